@@ -1,147 +1,515 @@
+import os
+import sys
+
+import attrs
+from marshmallow import fields
+
 from mable.cargo_bidding import TradingCompany, Bid
 
+# The shared planning helpers live in the repository root.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from anytime import Deadline
+from distance_oracle import DistanceOracle
+from feasibility_cache import FeasibilityCache
+from insertion import InsertionPlanner
+from lookahead import LookaheadPlanner
+from precompute import PlanPrecomputer
+from profiling import CallbackProfiler
+from risk_model import RiskModel
+from tracing import get_tracer
+from vessel_timeline import TimelineIndex
+from trial_schedule import TrialSchedule, committed_schedules
+
 class Company12(TradingCompany):
-    def __init__(self, fleet, name):
+    # Candidates x samples of the risk estimate per auction, about a second of sampling
+    RISK_SAMPLE_BUDGET = 10_000_000
+    # The lookahead gets at most this many seconds (and this share of what is left of the budget), and is
+    # skipped when (current + future trades) x vessels is larger than LOOKAHEAD_MAX_CANDIDATES
+    LOOKAHEAD_SECONDS = 0.5
+    LOOKAHEAD_SHARE = 0.1
+    LOOKAHEAD_MAX_CANDIDATES = 120
+
+    # Vessel selection policies: the cheapest insertion over the fleet, or the first vessel the trade fits on
+    VESSEL_POLICIES = ("cheapest", "first_fit")
+
+    def __init__(self, fleet, name, agent_timeout=60, time_budget_share=0.8, bid_markup=5.0,
+                 vessel_policy="cheapest", lookahead_beam_width=8, precompute=False):
+        """
+        :param agent_timeout: The simulation's global_agent_timeout in seconds, None for no limit.
+        :param time_budget_share: The share of agent_timeout that inform() uses before it returns its bids.
+        :param bid_markup: The bid is the estimated cost times the markup.
+        :param vessel_policy: One of VESSEL_POLICIES.
+        :param lookahead_beam_width: The beam width of the joint plan with the future trades, 0 disables it.
+        :param precompute: Plan the trades announced in pre_inform() in a background thread.
+        """
         super().__init__(fleet, name)
+        if vessel_policy not in self.VESSEL_POLICIES:
+            raise ValueError(f"Unknown vessel policy {vessel_policy!r}, expected one of {self.VESSEL_POLICIES}")
+        self._agent_timeout = agent_timeout
+        self._time_budget_share = time_budget_share
+        self.bid_markup = bid_markup
+        self.vessel_policy = vessel_policy
+        self.last_inform_timing = None
         self._future_trades = None
         self._planned_schedules = {}
+        self._committed = None
+        self._distances = DistanceOracle(self)
+        self._feasibility = FeasibilityCache(self)
+        self._planner = InsertionPlanner(self, self._distances, self._feasibility)
+        # The lookahead verifies many schedules that are never bid on, so it has its own feasibility cache and
+        # does not push out the entries receive() reuses
+        self._lookahead = LookaheadPlanner(
+            self, InsertionPlanner(self, self._distances, FeasibilityCache(self, maxsize=1024)),
+            beam_width=max(1, lookahead_beam_width))
+        self._use_lookahead = lookahead_beam_width > 0
+        # Plans of the announced trades, made between the callbacks (see precompute.py)
+        self._precompute = PlanPrecomputer(self, self._distances) if precompute else None
+        self.last_hidden_latency = 0.0
+        self._risk = RiskModel(self, self._distances)  # Sampled trade x vessel costs, see risk_model.py
+        self._timelines = TimelineIndex(self._distances)  # Our vessels over time, rebuilt when their schedules change
+        self._risk_estimate = None
+        self._risk_rows = {}
+        self._risk_columns = {}
+        self._trace = get_tracer(name)
+        # Opt-in with AGENT_PROFILE: compute used per callback and phase, exported with the metrics
+        self._profiler = CallbackProfiler.attach(self)
+        self._profiler.instrument(self._feasibility, "verify", "verification")
+        self._profiler.instrument(self, "predict_cost", "costing")
+
+    @attrs.define
+    class Data(TradingCompany.Data):
+        agent_timeout: float = 60
+        time_budget_share: float = 0.8
+        bid_markup: float = 5.0
+        vessel_policy: str = "cheapest"
+        lookahead_beam_width: int = 8
+        precompute: bool = False
+
+        class Schema(TradingCompany.Data.Schema):
+            agent_timeout = fields.Float(default=60)
+            time_budget_share = fields.Float(default=0.8)
+            bid_markup = fields.Float(default=5.0)
+            vessel_policy = fields.Str(default="cheapest")
+            lookahead_beam_width = fields.Int(default=8)
+            precompute = fields.Bool(default=False)
 
     def pre_inform(self, trades, time):
-        print(f"[pre_inform] {len(trades)} trades announced for time {time}")
+        self._trace.info("[pre_inform] %d trades announced for time %s", len(trades), time)
         self._future_trades = trades
+        if self._precompute is not None:
+            self._precompute.announce(trades)
 
     def try_schedule_on_vessel(self, vessel, trade):
         try:
-            new_schedule = vessel.schedule.copy()
-            new_schedule.add_transportation(trade)
+            trial, _ = self._planner.plan_trial([vessel], trade, self._committed)
 
-            if new_schedule.verify_schedule():
-                return True, new_schedule
+            if trial is not None:
+                return True, trial
 
-            print(
-                f"[schedule] Infeasible for vessel {vessel.name} "
-                f"with trade {getattr(trade, 'id', 'unknown')}"
-            )
+            if self._trace.debug_enabled:
+                self._trace.debug(
+                    "[schedule] Infeasible for vessel %s with trade %s", vessel.name, getattr(trade, 'id', 'unknown'))
             return False, None
 
         except Exception as e:
-            print(f"[schedule] Error on vessel {vessel.name}: {e}")
+            self._trace.error("[schedule] Error on vessel %s: %s", vessel.name, e)
             return False, None
 
-    def plan_for_trade(self, trade):
+    def quick_plan_for_trade(self, trade, deadline=None):
+        # Append the trade to the end of the first vessel that can take it: few verifications, valid but not cheap
         for vessel in self._fleet:
-            ok, sched = self.try_schedule_on_vessel(vessel, trade)
-            if ok:
-                return vessel, sched
+            if deadline is not None and deadline.expired():
+                break
+            sched = self._committed[vessel].copy() if self._committed else vessel.schedule
+            try:
+                sched.add_transportation(trade)
+            except ValueError:
+                continue
+            if self._feasibility.verify(sched, vessel):
+                return vessel, TrialSchedule(vessel, ((trade, None, None),))
+        return None, None
+
+    def plan_for_trade(self, trade, deadline=None):
+        trial, _ = self._planner.plan_trial(self._fleet, trade, self._committed, deadline)
+        if trial is not None:
+            return trial.vessel, trial
 
-        print(
-            f"[plan] No feasible vessel for trade {getattr(trade, 'id', 'unknown')}, skipping."
-        )
+        if self._trace.debug_enabled:
+            self._trace.debug("[plan] No feasible vessel for trade %s, skipping.", getattr(trade, 'id', 'unknown'))
         return None, None
 
     def inform(self, trades, *args, **kwargs):
-        print(f"\n[inform] {len(trades)} trades in this auction")
-        bids = []
+        # The background planning must not compete with the callback for the interpreter
+        if self._precompute is None:
+            return self._inform(trades)
+        self._precompute.pause()
+        try:
+            return self._inform(trades)
+        finally:
+            self._precompute.resume()
+
+    def _inform(self, trades):
+        self._trace.info("[inform] %d trades in this auction", len(trades))
+        deadline = Deadline.share_of(self._agent_timeout, self._time_budget_share)
+        timer = self._profiler.phase_timer()
+        self.last_inform_timing = timer
         self._planned_schedules = {}
+        # One copy of every committed schedule for all trials of this auction, plans only keep the insertions
+        self._committed = committed_schedules(self._fleet)
 
+        # Phase 0: cost distributions of all current and future trades on all vessels, for pricing
+        timer.start("risk")
+        self.estimate_risk(list(trades) + list(self._future_trades or []))
+
+        # Phase 1: plans made in the background since pre_inform, then a valid plan for the others straight away
+        precomputed = set()
+        hidden_before = 0.0
+        if self._precompute is not None:
+            timer.start("precomputed")
+            hidden_before = self._precompute.hidden_seconds
+            for i, trade in enumerate(trades):
+                try:
+                    vessel, trial = self._precompute.take(trade, self._committed, self._feasibility.verify)
+                    if vessel is not None:
+                        self._planned_schedules[trade] = (vessel, trial)
+                        precomputed.add(trade)
+                except Exception as e:
+                    self._trace.error("[inform] Failed to take the background plan of trade %d: %s", i, e)
+
+        timer.start("quick")
         for i, trade in enumerate(trades):
+            if deadline.expired():
+                break
+            if trade in precomputed:
+                continue
             try:
-                origin = getattr(trade, "origin_port", getattr(trade, "start_port", None))
-                destination = getattr(trade, "destination_port", getattr(trade, "end_port", None))
+                if self._trace.debug_enabled:
+                    origin = getattr(trade, "origin_port", getattr(trade, "start_port", None))
+                    destination = getattr(trade, "destination_port", getattr(trade, "end_port", None))
+                    self._trace.debug(
+                        "[trade %d] origin=%s, dest=%s, amount=%s",
+                        i, getattr(origin, 'name', origin), getattr(destination, 'name', destination),
+                        getattr(trade, 'amount', 'NA'))
 
-                print(
-                    f"[trade {i}] origin={getattr(origin, 'name', origin)}, "
-                    f"dest={getattr(destination, 'name', destination)}, "
-                    f"amount={getattr(trade, 'amount', 'NA')}"
-                )
+                vessel, trial = self.quick_plan_for_trade(trade, deadline)
+                if vessel is not None:
+                    self._planned_schedules[trade] = (vessel, trial)
+            except Exception as e:
+                self._trace.error("[inform] Failed to process trade %d: %s", i, e)
 
-                vessel, sched = self.plan_for_trade(trade)
-                if vessel is None or sched is None:
-                    continue
+        # Phase 2: replace the quick plans by the cheapest insertion while there is time.
+        # The quick plan is one of the insertions the planner prices, so a refined plan is never worse.
+        timer.start("refine")
+        refined = 0
+        for i, trade in enumerate(trades if self.vessel_policy == "cheapest" else ()):
+            if deadline.expired():
+                break
+            if trade in precomputed:
+                continue  # Already the cheapest insertion
+            try:
+                vessel, trial = self.plan_for_trade(trade, deadline)
+                if vessel is not None:
+                    self._planned_schedules[trade] = (vessel, trial)
+                    refined += 1
+            except Exception as e:
+                self._trace.error("[inform] Failed to refine trade %d: %s", i, e)
+
+        # Phase 3: with the next auction's trades known, only keep the trades of the best joint plan
+        timer.start("lookahead")
+        lookahead_candidates = (len(self._planned_schedules) + len(self._future_trades or [])) * len(self._fleet)
+        if (self._use_lookahead and self._future_trades and self._planned_schedules and not deadline.expired()
+                and lookahead_candidates <= self.LOOKAHEAD_MAX_CANDIDATES):
+            try:
+                lookahead_deadline = Deadline(min(self.LOOKAHEAD_SECONDS,
+                                                  self.LOOKAHEAD_SHARE * deadline.remaining()))
+                joint_plan = self._lookahead.plan(self._fleet, list(self._planned_schedules), self._future_trades,
+                                                  self.expected_payment, lookahead_deadline)
+                if not joint_plan.complete:
+                    self._trace.debug("[lookahead] Out of time or verifications, bidding on all plans")
+                else:
+                    for trade in list(self._planned_schedules):
+                        if trade not in joint_plan.included:
+                            self._trace.debug("[lookahead] Not bidding on %s->%s, it blocks better future trades",
+                                              trade.origin_port, trade.destination_port)
+                            del self._planned_schedules[trade]
+            except Exception as e:
+                self._trace.error("[inform] Lookahead failed: %s", e)
 
-                self._planned_schedules[trade] = (vessel, sched)
+        # Phase 4: all bids on a vessel may be won together, so they must fit on it together
+        timer.start("combine")
+        try:
+            moved, dropped = self._combine_plans(trades, deadline)
+            if moved or dropped:
+                self._trace.info("[inform] %d plans moved to another vessel, %d not bid on, so that every "
+                                 "combination of wins fits", moved, dropped)
+        except Exception as e:
+            self._trace.error("[inform] Failed to combine the plans: %s", e)
 
+        # Phase 5: price whatever plans there are
+        timer.start("price")
+        bids = []
+        for i, trade in enumerate(trades):
+            planned = self._planned_schedules.get(trade)
+            if planned is None:
+                continue
+            vessel, _ = planned
+            try:
                 cost = self.predict_cost(vessel, trade)
-                bid_amount = cost * 5
+                bid_amount = self.bid_amount(cost)
                 bids.append(Bid(amount=bid_amount, trade=trade))
 
-                print(
-                    f"[bid] trade {i}, vessel={vessel.name}, "
-                    f"bid={bid_amount:.2f}, cost_estimate={cost:.2f}"
-                )
+                self._trace.debug(
+                    "[bid] trade %d, vessel=%s, bid=%.2f, cost_estimate=%.2f", i, vessel.name, bid_amount, cost)
 
             except Exception as e:
-                print(f"[inform] Failed to process trade {i}: {e}")
+                self._trace.error("[inform] Failed to price trade %d: %s", i, e)
+        timer.stop()
 
-        print(f"[inform] Prepared {len(bids)} bids")
+        if deadline.expired():
+            self._trace.warning("[inform] Time budget of %.1fs used up, returning the bids found so far",
+                                deadline.seconds)
+        self._trace.info("[inform] Prepared %d bids (%d/%d refined) in %.3fs: %s",
+                         len(bids), refined, len(trades), timer.total(), timer.summary())
+        if self._precompute is not None:
+            self.last_hidden_latency = self._precompute.hidden_seconds - hidden_before
+            self._trace.info("[precompute] %d/%d trades planned in the background, %.3fs of planning hidden (%s)",
+                             len(precomputed), len(trades), self.last_hidden_latency, self._precompute.report())
         return bids
 
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
-        print(f"\n[receive] Won {len(contracts)} contracts")
+        self._trace.info("[receive] Won %d contracts", len(contracts))
+        # The plans are relative to the schedules at bidding time; recomputed plans use the current ones
+        self._committed = None
+
+        if self._precompute is not None:
+            self._precompute.pause()
+        changed = self._fleet
+        try:
+            with self._profiler.phase("commit"):
+                changed = self._commit_contracts(contracts)
+                self._timelines.update(self, self.headquarters.current_time, changed)
+        finally:
+            if self._precompute is not None:
+                # Plans on the vessels that got new work no longer apply
+                self._precompute.invalidate(changed)
+                self._precompute.resume()
 
-        for i, contract in enumerate(contracts):
+        self._trace.info("[receive] Feasibility cache: %s", self._feasibility.stats())
+        self._distances.save()
+        self._future_trades = None
+
+    def _commit_contracts(self, contracts):
+        # Won trades are merged per vessel: several wins on one vessel must end up in one schedule
+        committed = committed_schedules(self._fleet)
+        schedules = {}
+        by_vessel = {}
+        leftovers = []
+        for contract in contracts:
             trade = contract.trade
             planned = self._planned_schedules.get(trade)
-
             if planned is None:
-                print(
-                    f"[receive] No stored plan for trade {getattr(trade, 'id', 'unknown')}, "
-                    f"recomputing."
-                )
-                vessel, sched = self.plan_for_trade(trade)
-                if vessel is None or sched is None:
-                    print(
-                        f"[receive] Still infeasible for trade "
-                        f"{getattr(trade, 'id', 'unknown')}, leaving unscheduled."
-                    )
-                    continue
+                leftovers.append(trade)
             else:
-                vessel, sched = planned
+                by_vessel.setdefault(planned[0], []).append((trade, planned[1]))
+
+        merged = reinserted = 0
+        for vessel, planned_trades in by_vessel.items():
+            schedule = committed[vessel]
+            applied = []  # Insertion points already merged, relative to the committed schedule
+            for trade, trial in planned_trades:
+                new_schedule = self._merge_planned(vessel, committed[vessel], schedule, trial, applied)
+                if new_schedule is not None:
+                    merged += 1
+                else:
+                    if applied == [] and not trial.is_stale():
+                        # Nothing merged before and the same base as in inform(): the plan should have applied
+                        self._trace.warning("[receive] Planned insertion of trade %s did not apply to its own base "
+                                            "schedule on vessel %s", getattr(trade, 'id', 'unknown'), vessel.name)
+                    # The planned insertion clashes with the trades merged before: cheapest insertion into
+                    # the merged schedule. Insertion points are no longer relative to the committed schedule.
+                    new_schedule, _ = self._planner.best_insertion(vessel, trade, schedule)
+                    applied = None
+                    if new_schedule is None:
+                        leftovers.append(trade)
+                        continue
+                    reinserted += 1
+                schedule = new_schedule
+            if schedule is not committed[vessel]:
+                schedules[vessel] = schedule
 
+        # One pass over the trades that did not fit on their planned vessel, on top of everything merged so far
+        moved = 0
+        for trade in leftovers:
             try:
-                if not sched.verify_schedule():
-                    print(
-                        f"[receive] Planned schedule for trade "
-                        f"{getattr(trade, 'id', 'unknown')} failed verification, skipping."
-                    )
+                vessel, new_schedule, _ = self._planner.plan_for_trade(
+                    self._fleet, trade, {vessel: schedules.get(vessel, committed[vessel]) for vessel in self._fleet})
+            except Exception as e:
+                self._trace.error("[receive] Error planning trade %s: %s", getattr(trade, 'id', 'unknown'), e)
+                vessel = None
+            if vessel is None:
+                self._trace.warning(
+                    "[receive] Still infeasible for trade %s, leaving unscheduled.", getattr(trade, 'id', 'unknown'))
+                continue
+            schedules[vessel] = new_schedule
+            moved += 1
+
+        for vessel, schedule in schedules.items():
+            self._trace.debug("[receive] Applying %d tasks to vessel %s", len(schedule), vessel.name)
+            vessel.schedule = schedule
+        self._trace.info("[receive] %d trades merged as planned, %d re-inserted, %d moved, %d unscheduled",
+                         merged, reinserted, moved, len(contracts) - merged - reinserted - moved)
+        return list(schedules)
+
+    def _combine_plans(self, trades, deadline):
+        """
+        Make the planned trades of every vessel fit in together, in the order of the trades. A trade that does
+        not fit with the ones before it moves to the cheapest other vessel where it fits with that vessel's
+        trades, or is dropped. Removing trades from a feasible schedule keeps it feasible, so every set of won
+        bids can then be merged in receive().
+
+        :return: (moved, dropped)
+        """
+        joint = {}  # vessel -> (committed schedule plus its planned trades, their insertion points)
+
+        def fits(vessel, trial):
+            schedule, applied = joint.get(vessel, (self._committed[vessel], []))
+            applied = list(applied)
+            new_schedule = self._merge_planned(vessel, self._committed[vessel], schedule, trial, applied)
+            if new_schedule is None:
+                return False
+            joint[vessel] = (new_schedule, applied)
+            return True
+
+        moved = dropped = 0
+        for trade in trades:
+            planned = self._planned_schedules.get(trade)
+            if planned is None or fits(*planned):
+                continue
+            del self._planned_schedules[trade]
+            options = []
+            for vessel in self._fleet:
+                if vessel is planned[0] or deadline.expired():
                     continue
+                trial, cost = self._planner.plan_trial([vessel], trade, self._committed, deadline)
+                if trial is not None:
+                    options.append((cost, id(vessel), vessel, trial))
+            for _, _, vessel, trial in sorted(options, key=lambda option: option[:2]):
+                if fits(vessel, trial):
+                    self._planned_schedules[trade] = (vessel, trial)
+                    moved += 1
+                    break
+            else:
+                self._trace.debug("[combine] Not bidding on %s->%s, it does not fit with the other bids",
+                                  trade.origin_port, trade.destination_port)
+                dropped += 1
+        return moved, dropped
 
-                print(
-                    f"[receive] Applying schedule for trade {getattr(trade, 'id', 'unknown')} "
-                    f"to vessel {vessel.name}"
-                )
-                vessel.schedule = sched
+    def _merge_planned(self, vessel, committed, schedule, trial, applied):
+        """
+        Apply the inform-time insertion of a trial to a schedule that may already hold other won trades.
 
-            except Exception as e:
-                print(
-                    f"[receive] Error applying schedule for trade "
-                    f"{getattr(trade, 'id', 'unknown')} on vessel {vessel.name}: {e}"
-                )
+        :param committed: The vessel's committed schedule, which the trial's insertion points refer to.
+        :param schedule: The committed schedule plus the insertions in applied.
+        :param applied: (pick-up, drop-off) points of the merged insertions, relative to the committed schedule,
+            or None if the schedule was changed otherwise. Extended by the applied insertion.
+        :return: The verified schedule or None if the planned insertion does not apply.
+        """
+        if applied is None or trial.is_stale() or len(trial.insertions) != 1:
+            return None
+        trade, idx_pick_up, idx_drop_off = trial.insertions[0]
+        if idx_pick_up is None:
+            idx_pick_up = committed.get_insertion_points()[-1]  # Appended at the end of the committed schedule
+        if idx_drop_off is None:
+            idx_drop_off = idx_pick_up
 
-        self._future_trades = None
+        def shifted(point):
+            # Tasks inserted at or before a point move it back, tasks inserted at the same point come first
+            return point + sum((point >= pick_up) + (point >= drop_off) for pick_up, drop_off in applied)
 
-    def predict_cost(self, vessel, trade):
+        new_schedule = schedule.copy()
+        try:
+            new_schedule.add_transportation(trade, shifted(idx_pick_up), shifted(idx_drop_off))
+        except ValueError:
+            return None
+        # With nothing merged before, this is the schedule verified in inform() and a cache hit
+        if not self._feasibility.verify(new_schedule, vessel):
+            return None
+        applied.append((idx_pick_up, idx_drop_off))
+        return new_schedule
+
+    def estimate_risk(self, trades):
+        # Every vessel starts where and when its committed work is done (vessel_timeline.py); large batches use
+        # fewer samples
+        self._risk_estimate = None
+        self._risk_rows = {trade: row for row, trade in enumerate(trades)}
+        self._risk_columns = {vessel: column for column, vessel in enumerate(self._fleet)}
+        candidates = max(1, len(trades) * len(self._fleet))
         try:
-            origin = getattr(trade, "origin_port", getattr(trade, "start_port", "UNKNOWN"))
-            destination = getattr(trade, "destination_port", getattr(trade, "end_port", "UNKNOWN"))
-            origin_name = getattr(origin, "name", origin)
-            dest_name = getattr(destination, "name", destination)
+            current_time = self.headquarters.current_time
+            self._timelines.update(self, current_time, schedules=self._committed)
+            availability = {vessel: self._timelines.availability(self, vessel, current_time) for vessel in self._fleet}
+            self._risk_estimate = self._risk.estimate(
+                trades, self._fleet, availability, samples=max(200, self.RISK_SAMPLE_BUDGET // candidates))
+        except Exception as e:
+            self._trace.error("[risk] Failed to estimate trade costs: %s", e)
+
+    def risk_of(self, vessel, trade):
+        """
+        (expected cost, miss probability, quantile cost) of a trade from this auction's estimate, for the
+        cheapest vessel if vessel is None. None if the trade was not estimated or no vessel can do it.
+        """
+        row = self._risk_rows.get(trade)
+        if self._risk_estimate is None or row is None:
+            return None
+        if vessel is None:
+            column = int(self._risk_estimate.quantile_cost[row].argmin())
+        else:
+            column = self._risk_columns.get(vessel)
+            if column is None:
+                return None
+        estimate = self._risk_estimate
+        quantile_cost = float(estimate.quantile_cost[row, column])
+        if quantile_cost == float("inf"):
+            return None
+        return float(estimate.expected_cost[row, column]), float(estimate.miss_probability[row, column]), quantile_cost
+
+    def bid_amount(self, cost):
+        return cost * self.bid_markup
 
-            total_cost = 1000.0
-            print(f"[cost] {origin_name} -> {dest_name}, estimated cost={total_cost:.2f}")
+    def expected_payment(self, trade):
+        # What we would be paid if our bid wins, priced on the cheapest vessel
+        return self.bid_amount(self.predict_cost(None, trade))
+
+    def predict_cost(self, vessel, trade):
+        try:
+            # The cost quantile of the sampled travel times, a flat guess for trades that were not estimated
+            risk = self.risk_of(vessel, trade)
+            total_cost = 1000.0 if risk is None else risk[2]
+            if self._trace.debug_enabled:
+                origin = getattr(trade, "origin_port", getattr(trade, "start_port", "UNKNOWN"))
+                destination = getattr(trade, "destination_port", getattr(trade, "end_port", "UNKNOWN"))
+                self._trace.debug(
+                    "[cost] %s -> %s, estimated cost=%.2f, chance to miss the window=%s",
+                    getattr(origin, "name", origin), getattr(destination, "name", destination), total_cost,
+                    "n/a" if risk is None else f"{risk[1]:.2f}")
             return total_cost
 
         except Exception as e:
-            print(f"[cost] Failed to estimate cost: {e}")
+            self._trace.error("[cost] Failed to estimate cost: %s", e)
             return 10_000.0
 
 
 # Notes:
 # getattr is used to prevent crashing and null errors
-# verbose is used to debug the code in terminal
+# verbose output goes through tracing.py: AGENT_TRACE=debug shows the per-trade messages
+# inform is anytime: quick plans first, refined while time_budget_share of agent_timeout is left,
+# per-phase timing of the last call is in last_inform_timing, AGENT_PROFILE=on records every call (profiling.py)
+# the future trades from pre_inform are planned together with the current ones (lookahead.py),
+# we only bid on current trades that are part of the best joint plan
 
 # Places to improve:
 # 1. bid_amount
-# 2. predict_cost
-# 3. plan_for_trade
-# 4. pre_inform(use the future_trade concept)
\ No newline at end of file
+# 2. predict_cost (now the cost quantile of sampled travel times, risk_model.py)
+# 3. plan_for_trade (now searches all insertion points, see insertion.py)
+# 4. pre_inform(use the future_trade concept) (first version in lookahead.py)
\ No newline at end of file
@@ -1,43 +1,54 @@
 # main_competition_playground.py
+import numpy as np
 from mable.examples import environment, fleets, companies
 import group12
 
-def build_specification():
-    number_of_month = 5 
-    trades_per_auction = 3
-
+def build_specification(number_of_month=5, trades_per_auction=3, agent_timeout=60,
+                        my_fleet_mix=(1, 1, 1), arch_enemy_fleet_mix=(1, 1, 1), the_scheduler_fleet_mix=(1, 1, 1),
+                        arch_enemy_profit_factor=1.5, the_scheduler_profit_factor=1.4,
+                        bid_markup=5.0, vessel_policy="cheapest", lookahead_beam_width=8,
+                        seed=None, output_directory=".", show_detailed_auction_outcome=True):
+    # Fleet mixes are (num_suezmax, num_aframax, num_vlcc); seed=None keeps the simulation's default random
+    # bid_markup, vessel_policy and lookahead_beam_width are Company12's bidding knobs (see sweep.py)
     specifications_builder = environment.get_specification_builder(
         trades_per_occurrence=trades_per_auction,
         num_auctions=number_of_month
     )
+    if seed is not None:
+        # The world's random places vessels and generates cargoes, numpy's global one sizes the vessels
+        specifications_builder.add_random_specifications(seed=seed)
+        np.random.seed(seed)
 
     # My custom agent
-    my_fleet = fleets.mixed_fleet(num_suezmax=1, num_aframax=1, num_vlcc=1)
+    my_fleet = fleets.mixed_fleet(*my_fleet_mix)
     specifications_builder.add_company(
-        group12.Company12.Data(group12.Company12, my_fleet, group12.Company12.__name__)
+        group12.Company12.Data(group12.Company12, my_fleet, group12.Company12.__name__,
+                               agent_timeout=agent_timeout, time_budget_share=0.8, bid_markup=bid_markup,
+                               vessel_policy=vessel_policy, lookahead_beam_width=lookahead_beam_width)
     )
 
     # Competitor agents
-    arch_enemy_fleet = fleets.mixed_fleet(num_suezmax=1, num_aframax=1, num_vlcc=1)
+    arch_enemy_fleet = fleets.mixed_fleet(*arch_enemy_fleet_mix)
     specifications_builder.add_company(
         companies.MyArchEnemy.Data(
             companies.MyArchEnemy, arch_enemy_fleet, "Arch Enemy Ltd.",
-            profit_factor=1.5
+            profit_factor=arch_enemy_profit_factor
         )
     )
 
-    the_scheduler_fleet = fleets.mixed_fleet(num_suezmax=1, num_aframax=1, num_vlcc=1)
+    the_scheduler_fleet = fleets.mixed_fleet(*the_scheduler_fleet_mix)
     specifications_builder.add_company(
         companies.TheScheduler.Data(
             companies.TheScheduler, the_scheduler_fleet, "The Scheduler LP",
-            profit_factor=1.4
+            profit_factor=the_scheduler_profit_factor
         )
     )
 
     sim = environment.generate_simulation(
         specifications_builder,
-        show_detailed_auction_outcome=True,
-        global_agent_timeout=60
+        show_detailed_auction_outcome=show_detailed_auction_outcome,
+        output_directory=output_directory,
+        global_agent_timeout=agent_timeout
     )
     sim.run()
 
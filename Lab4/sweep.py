@@ -0,0 +1,189 @@
+# sweep.py
+# Searches Company12's bidding knobs (bid markup, vessel selection policy, lookahead beam width) over the
+# main_competition_playground setup with successive halving: every configuration first runs on a few seeds,
+# only the best 1/eta by mean profit of Company12 go on to eta times as many seeds, and so on until one
+# configuration is left or all seeds are used. The runs of a rung are spread over a process pool (the
+# simulations run through tournament.run_one). Every finished run is cached under the hash of its
+# configuration in <sweep directory>/cache, so an interrupted sweep resumes where it stopped and a wider
+# sweep reuses the runs of a narrower one.
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import tournament
+
+SEARCH_KEYS = ("bid_markup", "vessel_policy", "lookahead_beam_width")
+COMPANY = "Company12"
+LEADERBOARD_COLUMNS = SEARCH_KEYS + ("hash", "rung", "runs", "mean_profit", "std_profit", "mean_contracts")
+
+
+def search_space(bid_markup=(1.1, 1.3, 1.6, 2.0, 3.0, 5.0), vessel_policy=("cheapest", "first_fit"),
+                 lookahead_beam_width=(0, 4, 8)):
+    """
+    All combinations of the given values, one dict of Company12 knobs per configuration.
+    """
+    return [dict(zip(SEARCH_KEYS, combination))
+            for combination in itertools.product(bid_markup, vessel_policy, lookahead_beam_width)]
+
+
+def config_hash(config):
+    """
+    A stable short hash of a configuration (build_specification arguments without the seed).
+    """
+    encoded = json.dumps({key: value for key, value in config.items() if key != "seed"}, sort_keys=True)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:12]
+
+
+class ResultCache:
+    # One JSON file per configuration: {"config": ..., "seeds": {seed: per-company results}}
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._entries = {}
+
+    def _path(self, config):
+        return os.path.join(self.directory, f"{config_hash(config)}.json")
+
+    def _entry(self, config):
+        key = config_hash(config)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"config": config, "seeds": {}}
+            try:
+                with open(self._path(config)) as cache_file:
+                    entry = json.load(cache_file)
+            except (OSError, ValueError):
+                pass  # Not run yet, or a file cut short by an interrupted write
+            self._entries[key] = entry
+        return entry
+
+    def get(self, config, seed):
+        """
+        :return: The cached per-company results of a run or None.
+        """
+        return self._entry(config)["seeds"].get(str(seed))
+
+    def put(self, config, seed, results):
+        entry = self._entry(config)
+        entry["seeds"][str(seed)] = results
+        # Written under a temporary name and moved into place, so an interrupted sweep never leaves half a file
+        temporary_path = f"{self._path(config)}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(entry, cache_file, indent=1)
+        os.replace(temporary_path, self._path(config))
+
+
+def company_result(results, company=COMPANY):
+    for result in results:
+        if result["company"] == company:
+            return result
+    return None
+
+
+def score(cache, config, seeds, company=COMPANY):
+    """
+    :return: (mean profit, std of the profit, mean contracts, runs) of the company over the cached seeds.
+    """
+    results = [company_result(cache.get(config, seed) or [], company) for seed in seeds]
+    results = [result for result in results if result is not None]
+    if not results:
+        return -math.inf, 0.0, 0.0, 0
+    profits = [result["profit"] for result in results]
+    n = len(profits)
+    mean_profit = sum(profits) / n
+    std_profit = math.sqrt(sum((p - mean_profit) ** 2 for p in profits) / (n - 1)) if n > 1 else 0.0
+    return mean_profit, std_profit, sum(result["contracts"] for result in results) / n, n
+
+
+def rung_sizes(number_of_seeds, min_seeds=2, eta=3):
+    """
+    Seeds per rung, e.g. (2, 6, 9) for 9 seeds with min_seeds=2 and eta=3.
+    """
+    sizes = []
+    size = min(min_seeds, number_of_seeds)
+    while True:
+        sizes.append(size)
+        if size >= number_of_seeds:
+            return sizes
+        size = min(size * eta, number_of_seeds)
+
+
+def _run_pending(pool, pending, cache, sweep_directory, evaluate):
+    futures = {pool.submit(evaluate, f"{config_hash(config)}_seed{seed}", dict(config, seed=seed),
+                           sweep_directory): (config, seed)
+               for config, seed in pending}
+    for done, future in enumerate(as_completed(futures), start=1):
+        config, seed = futures[future]
+        run_name, _, results, error, seconds = future.result()
+        if error is not None:
+            # Not cached, so a resumed sweep tries again
+            print(f"[{done}/{len(pending)}] {run_name} failed after {seconds:.1f}s:\n{error}", file=sys.stderr)
+            continue
+        cache.put(config, seed, results)
+        print(f"[{done}/{len(pending)}] {run_name} finished in {seconds:.1f}s")
+
+
+def successive_halving(candidates, seeds=range(9), base_config=None, min_seeds=2, eta=3, sweep_directory="sweep",
+                       workers=None, company=COMPANY, evaluate=tournament.run_one):
+    """
+    Run the sweep.
+
+    :param candidates: Company12 knobs per configuration, e.g. from search_space.
+    :param seeds: The seeds, used in this order.
+    :param base_config: build_specification arguments shared by all configurations.
+    :param min_seeds: Seeds per configuration in the first rung.
+    :param eta: Each rung keeps the best 1/eta of the configurations and gives them eta times the seeds.
+    :param sweep_directory: Where the run directories, the cache and sweep.csv are written.
+    :param workers: The number of processes. Default is one per core.
+    :param company: The company whose mean profit ranks the configurations.
+    :param evaluate: Function (run name, config, directory) -> (run name, config, results, error, seconds),
+        executed in the worker processes.
+    :return: Leaderboard rows, best first: the survivors of the last rung, then the ones dropped earlier.
+    """
+    seeds = list(seeds)
+    configs = [dict(base_config or {}, **candidate) for candidate in candidates]
+    cache = ResultCache(os.path.join(sweep_directory, "cache"))
+    workers = workers or os.cpu_count() or 1
+    survivors = configs
+    reached = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rung, size in enumerate(rung_sizes(len(seeds), min_seeds, eta)):
+            rung_seeds = seeds[:size]
+            pending = [(config, seed) for config in survivors for seed in rung_seeds
+                       if cache.get(config, seed) is None]
+            print(f"Rung {rung}: {len(survivors)} configurations x {size} seeds, {len(pending)} runs not cached")
+            if pending:
+                _run_pending(pool, pending, cache, sweep_directory, evaluate)
+            for config in survivors:
+                reached[config_hash(config)] = (rung, rung_seeds)
+            survivors = sorted(survivors, key=lambda config: -score(cache, config, rung_seeds, company)[0])
+            if len(survivors) == 1 or size == len(seeds):
+                break
+            survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+
+    rows = []
+    for config in configs:
+        rung, rung_seeds = reached[config_hash(config)]
+        mean_profit, std_profit, mean_contracts, runs = score(cache, config, rung_seeds, company)
+        row = {key: config.get(key) for key in SEARCH_KEYS}
+        row.update(hash=config_hash(config), rung=rung, runs=runs, mean_profit=mean_profit,
+                   std_profit=std_profit, mean_contracts=mean_contracts)
+        rows.append(row)
+    rows.sort(key=lambda row: (-row["rung"], -row["mean_profit"]))
+    os.makedirs(sweep_directory, exist_ok=True)
+    with open(os.path.join(sweep_directory, "sweep.csv"), "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=LEADERBOARD_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+if __name__ == '__main__':
+    leaderboard = successive_halving(search_space())
+    print(tournament.format_table(leaderboard, LEADERBOARD_COLUMNS))
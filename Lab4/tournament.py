@@ -0,0 +1,202 @@
+# tournament.py
+# Runs main_competition_playground.build_specification for many seeds and configurations in parallel.
+# Every run gets its own output directory under the tournament directory, the per-company results of all
+# runs are merged into runs.csv (one row per run and company) and summary.csv (mean over the seeds).
+import contextlib
+import csv
+import glob
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Knobs of build_specification that make up a configuration; everything but the seed.
+CONFIG_KEYS = ("number_of_month", "trades_per_auction", "my_fleet_mix", "arch_enemy_fleet_mix",
+               "the_scheduler_fleet_mix", "arch_enemy_profit_factor", "the_scheduler_profit_factor")
+
+RUN_COLUMNS = ("run", "seed") + CONFIG_KEYS + (
+    "company", "contracts", "fulfilled", "income", "fuel_cost", "penalty", "profit")
+SUMMARY_COLUMNS = CONFIG_KEYS + (
+    "company", "runs", "mean_contracts", "mean_income", "mean_fuel_cost", "mean_penalty",
+    "mean_profit", "std_profit", "best_in_runs")
+
+
+def config_grid(seeds=range(5), number_of_month=(5,), trades_per_auction=(3,),
+                my_fleet_mix=((1, 1, 1),), arch_enemy_fleet_mix=((1, 1, 1),), the_scheduler_fleet_mix=((1, 1, 1),),
+                arch_enemy_profit_factor=(1.5,), the_scheduler_profit_factor=(1.4,)):
+    """
+    All combinations of the given values, one dict of build_specification arguments per run.
+    """
+    values = (number_of_month, trades_per_auction, my_fleet_mix, arch_enemy_fleet_mix,
+              the_scheduler_fleet_mix, arch_enemy_profit_factor, the_scheduler_profit_factor)
+    configs = []
+    for combination in itertools.product(*values):
+        for seed in seeds:
+            config = dict(zip(CONFIG_KEYS, combination))
+            config["seed"] = seed
+            configs.append(config)
+    return configs
+
+
+def summarise_metrics(metrics_path):
+    """
+    Per-company results of one metrics_competition_*.json file.
+
+    :return: One dict per company with contracts, fulfilled, income, fuel_cost, penalty and profit.
+    """
+    with open(metrics_path) as metrics_file:
+        metrics = json.load(metrics_file)
+    company_names = metrics["company_names"]
+    penalties = metrics["global_metrics"].get("penalty", {})
+    results = []
+    for company_id, company_name in company_names.items():
+        contracts = [contract
+                     for auction in metrics["global_metrics"]["auction_outcomes"]
+                     for contract in auction.get(company_id, [])]
+        income = sum(contract["payment"] for contract in contracts)
+        fuel_cost = metrics["company_metrics"].get(company_id, {}).get("fuel_cost", 0.0)
+        penalty = penalties.get(company_id, 0) or 0
+        results.append({
+            "company": company_name,
+            "contracts": len(contracts),
+            "fulfilled": sum(1 for contract in contracts if contract.get("fulfilled")),
+            "income": income,
+            "fuel_cost": fuel_cost,
+            "penalty": penalty,
+            "profit": income - fuel_cost - penalty,
+        })
+    return results
+
+
+def run_one(run_name, config, tournament_directory):
+    """
+    Run a single simulation in its own directory. Executed in a worker process.
+
+    :return: (run name, config, per-company results or None, error message or None, seconds)
+    """
+    start = time.perf_counter()
+    run_directory = os.path.join(tournament_directory, run_name)
+    os.makedirs(run_directory, exist_ok=True)
+    try:
+        import main_competition_playground
+        # The simulations' console output goes to the run directory instead of interleaving on screen
+        with open(os.path.join(run_directory, "output.log"), "w") as log_file, contextlib.redirect_stdout(log_file):
+            main_competition_playground.build_specification(
+                output_directory=run_directory, show_detailed_auction_outcome=False, **config)
+        metrics_paths = sorted(glob.glob(os.path.join(run_directory, "metrics_competition_*.json")))
+        if not metrics_paths:
+            return run_name, config, None, "no metrics file written", time.perf_counter() - start
+        return run_name, config, summarise_metrics(metrics_paths[-1]), None, time.perf_counter() - start
+    except Exception:
+        return run_name, config, None, traceback.format_exc(), time.perf_counter() - start
+
+
+def merge_results(runs):
+    """
+    Merge the per-run results into the mean per configuration and company.
+
+    :param runs: (run name, config, results) of the successful runs.
+    :return: Rows with the SUMMARY_COLUMNS.
+    """
+    grouped = {}
+    for run_name, config, results in runs:
+        config_key = tuple(config[key] for key in CONFIG_KEYS)
+        best_profit = max(result["profit"] for result in results)
+        for result in results:
+            grouped.setdefault((config_key, result["company"]), []).append(
+                (result, result["profit"] == best_profit))
+
+    rows = []
+    for (config_key, company), entries in grouped.items():
+        n = len(entries)
+        profits = [result["profit"] for result, _ in entries]
+        mean_profit = sum(profits) / n
+        std_profit = math.sqrt(sum((p - mean_profit) ** 2 for p in profits) / (n - 1)) if n > 1 else 0.0
+        row = dict(zip(CONFIG_KEYS, config_key))
+        row.update({
+            "company": company,
+            "runs": n,
+            "mean_contracts": sum(result["contracts"] for result, _ in entries) / n,
+            "mean_income": sum(result["income"] for result, _ in entries) / n,
+            "mean_fuel_cost": sum(result["fuel_cost"] for result, _ in entries) / n,
+            "mean_penalty": sum(result["penalty"] for result, _ in entries) / n,
+            "mean_profit": mean_profit,
+            "std_profit": std_profit,
+            "best_in_runs": sum(1 for _, best in entries if best),
+        })
+        rows.append(row)
+    rows.sort(key=lambda row: (tuple(str(row[key]) for key in CONFIG_KEYS), -row["mean_profit"]))
+    return rows
+
+
+def _write_csv(path, columns, rows):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: row[key] for key in columns})
+
+
+def format_table(rows, columns=None):
+    """
+    The summary rows as a plain text table. By default only the configuration keys that differ are shown.
+    """
+    if columns is None:
+        varying = tuple(key for key in CONFIG_KEYS if len({str(row[key]) for row in rows}) > 1)
+        columns = varying + ("company", "runs", "mean_contracts", "mean_income", "mean_profit", "std_profit",
+                             "best_in_runs")
+
+    def cell(value):
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+    cells = [[cell(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    lines.extend("  ".join(value.ljust(width) for value, width in zip(line, widths)) for line in cells)
+    return "\n".join(lines)
+
+
+def run_tournament(configs, tournament_directory="tournament", workers=None):
+    """
+    Run all configurations across a process pool and merge the results.
+
+    :param configs: build_specification arguments per run, e.g. from config_grid.
+    :param tournament_directory: Where the run directories, runs.csv and summary.csv are written.
+    :param workers: The number of processes. Default is one per core.
+    :return: The summary rows.
+    """
+    os.makedirs(tournament_directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    succeeded = []
+    run_rows = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(configs))) as pool:
+        futures = [pool.submit(run_one, f"run_{i:03d}_seed{config.get('seed')}", config, tournament_directory)
+                   for i, config in enumerate(configs)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            run_name, config, results, error, seconds = future.result()
+            if error is not None:
+                print(f"[{done}/{len(configs)}] {run_name} failed after {seconds:.1f}s:\n{error}", file=sys.stderr)
+                continue
+            print(f"[{done}/{len(configs)}] {run_name} finished in {seconds:.1f}s")
+            succeeded.append((run_name, config, results))
+            for result in results:
+                row = {"run": run_name, "seed": config.get("seed")}
+                row.update({key: config[key] for key in CONFIG_KEYS})
+                row.update(result)
+                run_rows.append(row)
+
+    run_rows.sort(key=lambda row: row["run"])
+    summary = merge_results(succeeded)
+    _write_csv(os.path.join(tournament_directory, "runs.csv"), RUN_COLUMNS, run_rows)
+    _write_csv(os.path.join(tournament_directory, "summary.csv"), SUMMARY_COLUMNS, summary)
+    return summary
+
+
+if __name__ == '__main__':
+    summary_rows = run_tournament(config_grid(seeds=range(8), arch_enemy_profit_factor=(1.3, 1.5)))
+    print(format_table(summary_rows))
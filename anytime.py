@@ -0,0 +1,75 @@
+"""
+Time budgets for the agent callbacks.
+
+The simulation stops every inform/receive call after global_agent_timeout
+seconds and a stopped inform() loses all of its bids. A Deadline is started
+at the beginning of a callback with a share of that timeout and the anytime
+loops check it between units of work. PhaseTimer records how long each phase
+of a callback took, so the used part of the budget can be reported.
+"""
+import time
+
+
+class Deadline:
+
+    def __init__(self, seconds):
+        """
+        :param seconds: The time budget from now. None means no limit.
+        :type seconds: float | None
+        """
+        self.seconds = seconds
+        self.start = time.perf_counter()
+        self.end = None if seconds is None else self.start + seconds
+
+    @classmethod
+    def share_of(cls, timeout, share):
+        """
+        A deadline after a share of a timeout, e.g. share_of(60, 0.8) expires after 48 seconds.
+        """
+        if timeout is None:
+            return cls(None)
+        return cls(timeout * share)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def remaining(self):
+        if self.end is None:
+            return float("inf")
+        return max(0.0, self.end - time.perf_counter())
+
+    def expired(self):
+        return self.end is not None and time.perf_counter() >= self.end
+
+
+class PhaseTimer:
+
+    def __init__(self):
+        # Seconds per phase in the order the phases were first entered.
+        self.durations = {}
+        self._phase = None
+        self._phase_start = None
+
+    def start(self, phase):
+        """
+        End the running phase (if any) and start the next one. Re-entering a phase adds to its time.
+        """
+        now = time.perf_counter()
+        self._close(now)
+        self._phase = phase
+        self._phase_start = now
+        self.durations.setdefault(phase, 0.0)
+
+    def stop(self):
+        self._close(time.perf_counter())
+        self._phase = None
+
+    def _close(self, now):
+        if self._phase is not None:
+            self.durations[self._phase] += now - self._phase_start
+
+    def total(self):
+        return sum(self.durations.values())
+
+    def summary(self):
+        return ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.durations.items())
@@ -0,0 +1,168 @@
+"""
+Batch assignment of trades to vessels.
+
+Instead of giving every trade, in list order, to the first vessel that fits,
+all trades are priced on all vessels at once (the cheapest insertion point of
+each, see InsertionPlanner) and the trades x vessels matrix is solved as a
+min-cost matching. Only the matched pairs are verified. A vessel can take
+more than one trade: trades that are left over after a round are matched
+again against the updated schedules (vessel chaining), until nothing more
+fits. The result is one ScheduleProposal in which every vessel has a single
+schedule with all of its trades.
+"""
+import numpy as np
+
+from mable.transport_operation import ScheduleProposal
+
+from insertion import InsertionPlanner
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional
+    linear_sum_assignment = None
+
+
+def min_cost_assignment(cost):
+    """
+    Solve the rectangular assignment problem (Hungarian algorithm). Infinite entries are never assigned.
+
+    :param cost: Matrix of shape (rows, columns).
+    :type cost: np.ndarray
+    :return: (row indices, column indices) of the assigned pairs, like scipy's linear_sum_assignment.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    finite = np.isfinite(cost)
+    if not finite.any():
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    # Forbidden pairs get a cost larger than any assignment of allowed pairs and are dropped afterwards
+    big = (np.abs(cost[finite]).max() + 1) * (min(cost.shape) + 1)
+    padded = np.where(finite, cost, big)
+    if linear_sum_assignment is not None:
+        rows, columns = linear_sum_assignment(padded)
+    else:
+        transposed = padded.shape[0] > padded.shape[1]
+        rows, columns = _hungarian(padded.T if transposed else padded)
+        if transposed:
+            rows, columns = columns, rows
+        order = np.argsort(rows)
+        rows, columns = rows[order], columns[order]
+    allowed = finite[rows, columns]
+    return rows[allowed], columns[allowed]
+
+
+def _hungarian(cost):
+    # Shortest augmenting path version for n <= m, O(n^2 m) with the inner loop over columns vectorised.
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_column = np.zeros(m + 1, dtype=int)  # 1-based row matched to each column, 0 = free
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        row_of_column[0] = i
+        j0 = 0
+        min_value = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_column[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            improve = free & (reduced < min_value[1:])
+            min_value[1:][improve] = reduced[improve]
+            way[1:][improve] = j0
+            candidates = np.where(free, min_value[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[row_of_column[used]] += delta
+            v[used] -= delta
+            min_value[1:][free] -= delta
+            j0 = j1
+            if row_of_column[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of_column[j0] = row_of_column[j1]
+            j0 = j1
+    columns = np.nonzero(row_of_column[1:])[0]
+    rows = row_of_column[1:][columns] - 1
+    return rows, columns
+
+
+class BatchAssigner:
+
+    def __init__(self, company, planner=None):
+        """
+        :param company: The company whose fleet is planned.
+        :type company: TradingCompany
+        :param planner: The insertion planner used to price and verify insertions. A new one is created if None.
+        :type planner: InsertionPlanner | None
+        """
+        self._company = company
+        if planner is None:
+            planner = InsertionPlanner(company)
+        self._planner = planner
+        self.rounds = 0
+        self.solves = 0
+
+    def _price(self, vessel, trade, schedule):
+        if self._planner._can_never_fit(vessel, trade):
+            return np.inf
+        priced = self._planner._price_insertions(vessel, trade, schedule)
+        return min(priced)[0] if priced else np.inf
+
+    def assign(self, trades, fleet=None, extra_cost=None, cost_function=None, schedules=None):
+        """
+        Assign the trades to the fleet.
+
+        :param trades: The trades to schedule.
+        :param fleet: The vessels. Default is the company's fleet.
+        :param extra_cost: Optional function (vessel, trade) -> cost added to the insertion cost in the matching.
+        :param cost_function: Function (vessel, trade) -> cost reported in the proposal.
+            Default is the estimated insertion cost.
+        :param schedules: Optional schedules to build on instead of the vessels' current ones, indexed by vessel.
+        :return: One consistent proposal: every vessel's schedule holds all trades assigned to it.
+        :rtype: ScheduleProposal
+        """
+        fleet = list(self._company.fleet if fleet is None else fleet)
+        schedules = dict(schedules or {})
+        scheduled_trades = []
+        costs = {}
+        remaining = list(trades)
+
+        while remaining and fleet:
+            self.rounds += 1
+            current = [schedules[vessel] if vessel in schedules else vessel.schedule for vessel in fleet]
+            matrix = np.array([[self._price(vessel, trade, schedule) for vessel, schedule in zip(fleet, current)]
+                               for trade in remaining], dtype=float)
+            if extra_cost is not None:
+                matrix += np.array([[extra_cost(vessel, trade) for vessel in fleet] for trade in remaining])
+
+            # Every vessel takes at most one trade per round; pairs that fail verification are excluded
+            # and the rest is matched again
+            assigned_rows = set()
+            while True:
+                self.solves += 1
+                rows, columns = min_cost_assignment(matrix)
+                if len(rows) == 0:
+                    break
+                for row, column in sorted(zip(rows.tolist(), columns.tolist()), key=lambda pair: matrix[pair]):
+                    vessel, trade = fleet[column], remaining[row]
+                    new_schedule, estimate = self._planner.best_insertion(vessel, trade, current[column])
+                    if new_schedule is None:
+                        matrix[row, column] = np.inf
+                        continue
+                    schedules[vessel] = new_schedule
+                    scheduled_trades.append(trade)
+                    costs[trade] = estimate if cost_function is None else cost_function(vessel, trade)
+                    assigned_rows.add(row)
+                    matrix[row, :] = np.inf
+                    matrix[:, column] = np.inf
+
+            if not assigned_rows:
+                break
+            remaining = [trade for row, trade in enumerate(remaining) if row not in assigned_rows]
+
+        return ScheduleProposal(schedules, scheduled_trades, costs)
@@ -0,0 +1,274 @@
+"""
+Offline replay of recorded auctions.
+
+The metrics_competition_*.json files record every auction of a run
+(global_metrics.auction_outcomes): each won trade with its ports, amount,
+cargo type and time window and the payment of the winner. AuctionReplay
+feeds these auctions to any TradingCompany subclass on the stand-in engine of
+benchmark_agents.py (great-circle distances, no simulation): pre_inform()
+with the next recorded auction's trades, inform() with the auction's trades
+and receive() with the settled contracts and the recorded ledger.
+
+The auctions are second price auctions, so the recorded payment is the
+second lowest bid. A replayed bid wins a trade if it is below the recorded
+payment and is then paid the recorded payment. For trades the agent's
+company won in the recording this is exact (the payment was the best
+competing bid); for the others the winner's own bid is not recorded and the
+payment stands in for it, so the replay is slightly optimistic there.
+
+Vessels do not sail between auctions: before every auction each vessel is
+moved to the last port of its schedule and starts idle, with an empty
+schedule. The cost of an auction is the estimated fuel and handling cost the
+won trades added to the schedules (InsertionPlanner.route_cost).
+
+    python auction_replay.py --agent Company12
+    python auction_replay.py --agent lab3.1 --fleet 5 metrics_competition_2141350169824_2025-11-26-10-50-05.json
+"""
+import os
+
+# Distances on the stand-in network are made up, so they must not end up in the shared distance cache
+os.environ.setdefault("AGENT_DISTANCE_CACHE", "")
+
+import argparse
+import glob
+import json
+import random
+import sys
+import time
+
+from mable.extensions.world_ports import LatLongPort, get_ports
+from mable.shipping_market import Contract, TimeWindowTrade
+from mable.transport_operation import Schedule
+
+from benchmark_agents import AGENTS, BenchmarkEngine, load_agent_class, make_fleet
+from distance_oracle import DEFAULT_PORTS_PATH
+from insertion import InsertionPlanner
+from tracing import WARNING, get_tracer
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class RecordedAuction:
+    __slots__ = ("run", "index", "time", "trades", "winners", "payments")
+
+    def __init__(self, run, index, time, trades, winners, payments):
+        """
+        :param run: The metrics file the auction was read from.
+        :param index: The position of the auction in the run.
+        :param time: The time of the auction.
+        :param trades: The won trades of the auction.
+        :param winners: The name of the winning company of each trade.
+        :param payments: The payment of each trade.
+        """
+        self.run = run
+        self.index = index
+        self.time = time
+        self.trades = trades
+        self.winners = winners
+        self.payments = payments
+
+
+def _port(port, ports):
+    known = ports.get(port["name"])
+    if known is None:
+        known = LatLongPort(port["name"], port["latitude"], port["longitude"])
+        ports[port["name"]] = known
+    return known
+
+
+def metrics_files(paths=None):
+    """
+    :param paths: Metrics files or directories containing them. Default is the repository root.
+    :return: The metrics files, sorted within each directory.
+    """
+    if paths is None:
+        paths = [_HERE]
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "metrics_competition_*.json"), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+
+def load_auctions(paths=None, ports=None):
+    """
+    Read the recorded auctions of metrics files.
+
+    :param paths: See metrics_files.
+    :param ports: Port name -> port of the network the trades are replayed on. Unknown ports are added.
+    :return: The auctions in file and auction order. Auctions in which nothing was won are skipped.
+    :rtype: List[RecordedAuction]
+    """
+    if ports is None:
+        ports = {port.name: port for port in get_ports(DEFAULT_PORTS_PATH)}
+    auctions = []
+    for file_path in metrics_files(paths):
+        with open(file_path) as metrics_file:
+            metrics = json.load(metrics_file)
+        company_names = metrics.get("company_names", {})
+        for index, outcome in enumerate(metrics.get("global_metrics", {}).get("auction_outcomes", [])):
+            trades, winners, payments = [], [], []
+            for company_id, won in outcome.items():
+                for contract in won:
+                    recorded = contract["trade"]
+                    trades.append(TimeWindowTrade(
+                        origin_port=_port(recorded["origin_port"], ports),
+                        destination_port=_port(recorded["destination_port"], ports),
+                        amount=recorded["amount"], cargo_type=recorded["cargo_type"],
+                        time=recorded.get("time", 0), time_window=list(recorded.get("time_window") or [None] * 4)))
+                    winners.append(company_names.get(company_id, company_id))
+                    payments.append(contract["payment"])
+            if trades:
+                auction_time = min(trade.time for trade in trades)
+                auctions.append(RecordedAuction(file_path, index, auction_time, trades, winners, payments))
+    return auctions
+
+
+class AuctionOutcome:
+    __slots__ = ("run", "index", "trades", "bids", "wins", "income", "cost", "unscheduled", "inform_seconds")
+
+    def __init__(self, run, index, trades, bids, wins, income, cost, unscheduled, inform_seconds):
+        self.run = run
+        self.index = index
+        self.trades = trades
+        self.bids = bids
+        self.wins = wins
+        self.income = income
+        self.cost = cost
+        self.unscheduled = unscheduled
+        self.inform_seconds = inform_seconds
+
+    @property
+    def profit(self):
+        return self.income - self.cost
+
+
+class ReplayResult:
+
+    def __init__(self, outcomes=None):
+        self.outcomes = list(outcomes or [])
+
+    def summary(self):
+        """
+        :return: Totals over all replayed auctions as a JSON-able dict.
+        """
+        totals = {key: sum(getattr(outcome, key) for outcome in self.outcomes)
+                  for key in ("trades", "bids", "wins", "income", "cost", "unscheduled", "inform_seconds")}
+        totals["auctions"] = len(self.outcomes)
+        totals["profit"] = totals["income"] - totals["cost"]
+        totals["win_rate"] = totals["wins"] / totals["trades"] if totals["trades"] else 0.0
+        return totals
+
+
+class AuctionReplay:
+
+    def __init__(self, agent_factory, fleet_size=3, seed=0, name="Replay", timeout=60):
+        """
+        :param agent_factory: Function (fleet, name) -> TradingCompany, e.g. a company class.
+        :param fleet_size: The number of vessels of the replayed company.
+        :param seed: Seed of the fleet's vessel types and starting ports.
+        :param name: The name of the replayed company.
+        :param timeout: The global_agent_timeout the agent sees.
+        """
+        self._agent_factory = agent_factory
+        self.fleet_size = fleet_size
+        self.seed = seed
+        self.name = name
+        self.timeout = timeout
+        self._ports = get_ports(DEFAULT_PORTS_PATH)
+
+    def replay(self, auctions):
+        """
+        Replay auctions. Every run (metrics file) starts with a new company and fleet.
+
+        :param auctions: The recorded auctions, see load_auctions.
+        :type auctions: List[RecordedAuction]
+        :rtype: ReplayResult
+        """
+        result = ReplayResult()
+        runs = {}
+        for auction in auctions:
+            runs.setdefault(auction.run, []).append(auction)
+        for run_auctions in runs.values():
+            result.outcomes.extend(self._replay_run(run_auctions))
+        return result
+
+    def _replay_run(self, auctions):
+        rng = random.Random(self.seed)
+        engine = BenchmarkEngine(self._ports, self.timeout)
+        fleet = make_fleet(self.fleet_size, self._ports, rng, self.name)
+        company = engine.add_company(self._agent_factory(fleet, self.name))
+        planner = InsertionPlanner(company)
+        outcomes = []
+        for i, auction in enumerate(auctions):
+            engine.world.current_time = auction.time
+            self._start_idle(engine, fleet, auction.time)
+            if i + 1 < len(auctions):
+                company.pre_inform(auctions[i + 1].trades, auctions[i + 1].time)
+            start = time.perf_counter()
+            bids = company.inform(auction.trades) or []
+            inform_seconds = time.perf_counter() - start
+
+            columns = {id(trade): column for column, trade in enumerate(auction.trades)}
+            contracts = []
+            won = set()
+            for bid in bids:
+                column = columns.get(id(bid.trade))
+                if column is None or column in won or not bid.amount < auction.payments[column]:
+                    continue
+                won.add(column)
+                contracts.append(Contract(payment=auction.payments[column], trade=auction.trades[column]))
+            ledger = {company.name: contracts}
+            for column, trade in enumerate(auction.trades):
+                if column not in won:
+                    ledger.setdefault(auction.winners[column], []).append(
+                        Contract(payment=auction.payments[column], trade=trade))
+
+            before = {vessel: planner.route_cost(vessel, vessel.schedule) for vessel in fleet}
+            company.receive(contracts, ledger)
+            cost = sum(planner.route_cost(vessel, vessel.schedule) - before[vessel] for vessel in fleet)
+            scheduled = {id(trade) for vessel in fleet for _, trade in vessel.schedule.get_simple_schedule()}
+            outcomes.append(AuctionOutcome(
+                auction.run, auction.index, len(auction.trades), len(bids), len(contracts),
+                sum(contract.payment for contract in contracts), cost,
+                sum(id(contract.trade) not in scheduled for contract in contracts), inform_seconds))
+        return outcomes
+
+    @staticmethod
+    def _start_idle(engine, fleet, current_time):
+        for vessel in fleet:
+            schedule = vessel.schedule
+            if len(schedule) > 0:
+                location_type, trade = schedule.get_simple_schedule()[-1]
+                vessel.location = trade.origin_port if location_type == "PICK_UP" else trade.destination_port
+            schedule = Schedule(vessel, current_time, current_time)
+            schedule.set_engine(engine)
+            vessel.schedule = schedule
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", help="Metrics files or directories. Default is the repository root.")
+    parser.add_argument("--agent", choices=sorted(AGENTS), default="Company12")
+    parser.add_argument("--fleet", type=int, default=3, help="Vessels of the replayed company.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60, help="The global_agent_timeout in seconds.")
+    args = parser.parse_args(argv)
+
+    get_tracer("Replay").set_levels(WARNING)  # The agents trace under their company's name
+    agent_class = load_agent_class(args.agent)
+    auctions = load_auctions(args.paths or None)
+    start = time.perf_counter()
+    result = AuctionReplay(agent_class, args.fleet, args.seed, timeout=args.timeout).replay(auctions)
+    summary = result.summary()
+    summary["seconds"] = time.perf_counter() - start
+    print(json.dumps(summary, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
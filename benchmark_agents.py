@@ -0,0 +1,379 @@
+"""
+Latency benchmark of the agents' callbacks under synthetic load.
+
+Drives Companyn, Company12 and the lab3.x MyCompany agents through
+pre_inform, inform and receive without running a simulation: the agents get
+a stand-in engine whose network measures great-circle distances between the
+ports in ports.csv, fleets built from the example vessel types and random
+trades. Every configuration is one point of a sweep over the trades per
+auction, the fleet size and the schedule depth (trades every vessel already
+has in its schedule). Latencies are reported as p50/p95/p99 over the repeats,
+peak memory comes from a separate run under tracemalloc (which slows Python
+down too much to time the same run).
+
+With --save-baseline the results are stored as JSON; later runs compare
+against it and flag callbacks whose p95 got slower than the tolerance allows,
+as well as callbacks whose p99 gets close to the agent timeout.
+
+    python benchmark_agents.py                              # default sweeps
+    python benchmark_agents.py --save-baseline
+    python benchmark_agents.py --agents Company12 --trades 3 100 1000 --fleet 10 --depth 2
+"""
+import os
+
+# Distances on the stand-in network are made up, so they must not end up in the shared distance cache
+os.environ.setdefault("AGENT_DISTANCE_CACHE", "")
+
+import argparse
+import importlib.util
+import inspect
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from mable.competition.generation import AuctionClassFactory
+from mable.competition.information import CompanyHeadquarters
+from mable.examples import companies, fleets
+from mable.extensions.fuel_emissions import ConsumptionRate, VesselEngine, VesselWithEngine
+from mable.extensions.world_ports import LatLongShippingNetwork, get_ports
+from mable.shipping_market import Contract, TimeWindowTrade
+from mable.simulation_space.structure import NetworkWithPortDict
+from mable.transport_operation import CargoCapacity
+
+from distance_oracle import DEFAULT_PORTS_PATH
+from tracing import WARNING, get_tracer
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, "Lab4"))
+
+# Agent name -> (file, class name)
+AGENTS = {
+    "Companyn": ("groupn.py", "Companyn"),
+    "Company12": (os.path.join("Lab4", "group12.py"), "Company12"),
+    "lab3.1": ("lab3.1.py", "MyCompany"),
+    "lab3.2": ("lab3.2.py", "MyCompany"),
+    "lab3.3": ("lab3.3.py", "MyCompany"),
+}
+CALLBACKS = ("pre_inform", "inform", "receive")
+DEFAULT_BASELINE_PATH = os.path.join(_HERE, "benchmark_baseline.json")
+# Sweeps vary one dimension at a time around the default point
+DEFAULT_POINT = {"trades": 10, "fleet": 10, "depth": 2}
+DEFAULT_SWEEPS = {"trades": (3, 10, 30, 100, 300, 1000), "fleet": (3, 10, 30, 100), "depth": (0, 2, 5, 10)}
+# Hours between the auction and the next one, the time of the pre-informed trades
+AUCTION_INTERVAL = 720
+COMPETITOR_NAME = "Arch Enemy Ltd."
+
+
+def load_agent_class(agent):
+    """
+    :param agent: A key of AGENTS.
+    :return: The agent's company class.
+    """
+    file_name, class_name = AGENTS[agent]
+    path = os.path.join(_HERE, file_name)
+    spec = importlib.util.spec_from_file_location(f"benchmark_{agent.replace('.', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+
+class GreatCircleNetwork(NetworkWithPortDict):
+
+    def get_distance(self, location_one, location_two):
+        if not hasattr(location_one, "latitude"):
+            location_one = self.get_port(location_one)
+        if not hasattr(location_two, "latitude"):
+            location_two = self.get_port(location_two)
+        if location_one == location_two:
+            return 0
+        return LatLongShippingNetwork.get_long_lat_dist(
+            location_one.latitude, location_one.longitude, location_two.latitude, location_two.longitude) / 1852
+
+    def get_journey_location(self, journey, vessel, time):
+        return journey.destination
+
+
+class _NoEvents:
+
+    def put(self, event):
+        pass
+
+    def remove(self, event):
+        pass
+
+    def purge(self, vessel):
+        pass
+
+
+class _World:
+
+    def __init__(self, network):
+        self.network = network
+        self.current_time = 0
+        self.event_queue = _NoEvents()
+
+
+class BenchmarkEngine:
+    """
+    The parts of the simulation engine the agents and the headquarters use.
+    """
+
+    def __init__(self, ports, global_agent_timeout=60):
+        self.world = _World(GreatCircleNetwork(ports))
+        self.class_factory = AuctionClassFactory()
+        self.shipping_companies = []
+        self.event_queue = self.world.event_queue
+        self.headquarters = CompanyHeadquarters(self)
+        self.global_agent_timeout = global_agent_timeout
+
+    def add_company(self, company):
+        company.set_engine(self)
+        company.headquarters = self.headquarters
+        self.shipping_companies.append(company)
+        return company
+
+    def add_new_schedules(self, company, schedules, time):
+        for vessel, schedule in schedules.items():
+            vessel.schedule = schedule
+
+
+def make_vessel(data, location, fuel):
+    """
+    A vessel from the VesselWithEngine.Data of the example fleets.
+    """
+    engine_data = data.propelling_engine
+    engine = VesselEngine(
+        fuel, engine_data.idle_consumption,
+        ConsumptionRate(base=engine_data.laden_consumption_rate.base,
+                        speed_power=engine_data.laden_consumption_rate.speed_power,
+                        factor=engine_data.laden_consumption_rate.factor),
+        ConsumptionRate(base=engine_data.ballast_consumption_rate.base,
+                        speed_power=engine_data.ballast_consumption_rate.speed_power,
+                        factor=engine_data.ballast_consumption_rate.factor),
+        engine_data.loading_consumption, engine_data.unloading_consumption)
+    capacities = [CargoCapacity(cargo_type=capacity.cargo_type, capacity=capacity.capacity,
+                                loading_rate=capacity.loading_rate)
+                  for capacity in data.capacities_and_loading_rates]
+    return VesselWithEngine(capacities, location, data.speed, engine, name=data.name)
+
+
+def make_fleet(size, ports, rng, prefix):
+    vessel_types = (fleets.get_vessel_suezmax, fleets.get_vessel_aframax, fleets.get_vessel_vlcc)
+    fuel = fleets.get_fuel_mfo()
+    return [make_vessel(vessel_types[i % len(vessel_types)](f"{prefix}-{i}"), rng.choice(ports), fuel)
+            for i in range(size)]
+
+
+def make_trades(number, ports, rng, time=0, latest_drop_off=1500):
+    """
+    Random oil trades between distinct ports with loose time windows.
+    """
+    trades = []
+    for _ in range(number):
+        origin, destination = rng.sample(ports, 2)
+        earliest_pick_up = time + rng.randint(24, 400)
+        trades.append(TimeWindowTrade(
+            origin_port=origin, destination_port=destination, amount=rng.uniform(20000, 100000), cargo_type="Oil",
+            time=time, time_window=[earliest_pick_up, earliest_pick_up + 240,
+                                    earliest_pick_up + 200, earliest_pick_up + latest_drop_off]))
+    return trades
+
+
+def fill_schedules(fleet, depth, ports, rng):
+    """
+    Give every vessel depth committed trades, appended at the end of its schedule.
+    """
+    for vessel in fleet:
+        schedule = vessel.schedule
+        for trade in make_trades(depth, ports, rng, latest_drop_off=100000):
+            schedule.add_transportation(trade)
+        vessel.schedule = schedule
+
+
+def run_once(agent_class, trades, fleet_size, depth, seed, ports, timeout=60, measure_memory=False):
+    """
+    One auction round of an agent on fresh synthetic load.
+
+    :return: callback -> seconds, or callback -> peak bytes if measure_memory.
+    """
+    rng = random.Random(seed)
+    engine = BenchmarkEngine(ports, timeout)
+    fleet = make_fleet(fleet_size, ports, rng, "Own")
+    if "agent_timeout" in inspect.signature(agent_class.__init__).parameters:
+        company = agent_class(fleet, agent_class.__name__, agent_timeout=timeout)
+    else:
+        company = agent_class(fleet, agent_class.__name__)
+    engine.add_company(company)
+    competitor_fleet = make_fleet(fleet_size, ports, rng, "Enemy")
+    engine.add_company(companies.MyArchEnemy(competitor_fleet, COMPETITOR_NAME))
+    fill_schedules(fleet, depth, ports, rng)
+    fill_schedules(competitor_fleet, depth, ports, rng)
+    auction_trades = make_trades(trades, ports, rng)
+    future_trades = make_trades(trades, ports, rng, time=AUCTION_INTERVAL)
+
+    results = {}
+
+    def measure(callback, *args):
+        if measure_memory:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            value = getattr(company, callback)(*args)
+            results[callback] = tracemalloc.get_traced_memory()[1] - start
+        else:
+            start = time.perf_counter()
+            value = getattr(company, callback)(*args)
+            results[callback] = time.perf_counter() - start
+        return value
+
+    measure("pre_inform", future_trades, AUCTION_INTERVAL)
+    bids = measure("inform", auction_trades) or []
+    # Every bid wins at its amount, the competitor wins the rest of the trades
+    contracts = [Contract(payment=bid.amount, trade=bid.trade) for bid in bids]
+    won = {contract.trade for contract in contracts}
+    lost = [Contract(payment=rng.uniform(1e5, 1e6), trade=trade) for trade in auction_trades if trade not in won]
+    measure("receive", contracts, {company.name: contracts, COMPETITOR_NAME: lost})
+    return results
+
+
+def run_config(agent, trades, fleet_size, depth, repeats=5, timeout=60, memory=True, seed=0):
+    """
+    Time one agent on one configuration.
+
+    :return: callback -> {"p50", "p95", "p99", "max" (seconds), "peak_kib"}
+    """
+    agent_class = load_agent_class(agent)
+    ports = get_ports(DEFAULT_PORTS_PATH)
+    samples = {callback: [] for callback in CALLBACKS}
+    for repeat in range(repeats):
+        for callback, seconds in run_once(agent_class, trades, fleet_size, depth, seed + repeat, ports,
+                                          timeout).items():
+            samples[callback].append(seconds)
+    peaks = {}
+    if memory:
+        tracemalloc.start()
+        try:
+            peaks = run_once(agent_class, trades, fleet_size, depth, seed, ports, timeout, measure_memory=True)
+        finally:
+            tracemalloc.stop()
+    stats = {}
+    for callback in CALLBACKS:
+        p50, p95, p99 = np.percentile(samples[callback], [50, 95, 99]).tolist()
+        stats[callback] = {"p50": p50, "p95": p95, "p99": p99, "max": max(samples[callback]),
+                           "peak_kib": peaks[callback] / 1024 if callback in peaks else None}
+    return stats
+
+
+def baseline_key(agent, callback, trades, fleet_size, depth):
+    return f"{agent}|{callback}|{trades}|{fleet_size}|{depth}"
+
+
+def sweep_points(trades=None, fleet=None, depth=None, grid=False):
+    """
+    The (trades, fleet, depth) configurations to run. Dimensions that are not given use the default sweep
+    (or the default point if another dimension was given). With grid every combination is run,
+    otherwise one dimension is varied at a time.
+    """
+    given = {"trades": trades, "fleet": fleet, "depth": depth}
+    if any(given.values()):
+        values = {name: tuple(given[name] or (DEFAULT_POINT[name],)) for name in DEFAULT_POINT}
+    elif grid:
+        values = DEFAULT_SWEEPS
+    else:
+        points = []
+        for name, sweep in DEFAULT_SWEEPS.items():
+            for value in sweep:
+                point = dict(DEFAULT_POINT, **{name: value})
+                point = (point["trades"], point["fleet"], point["depth"])
+                if point not in points:
+                    points.append(point)
+        return points
+    return list(itertools.product(values["trades"], values["fleet"], values["depth"]))
+
+
+def flags(stats, baseline_stats, timeout, timeout_share=0.8, tolerance=0.2, noise_floor=0.005):
+    """
+    :param stats: The stats of one callback.
+    :param baseline_stats: The baseline stats of the callback or None.
+    :param timeout_share: Share of the timeout above which a p99 is flagged.
+    :param tolerance: Relative p95 slow-down flagged as regression.
+    :param noise_floor: Slow-downs of less than this many seconds are never flagged.
+    :return: List of flags.
+    """
+    found = []
+    if stats["p99"] > timeout:
+        found.append("TIMEOUT")
+    elif stats["p99"] > timeout * timeout_share:
+        found.append("NEAR TIMEOUT")
+    if baseline_stats is not None:
+        slowdown = stats["p95"] - baseline_stats["p95"]
+        if slowdown > noise_floor and stats["p95"] > baseline_stats["p95"] * (1 + tolerance):
+            found.append(f"REGRESSION x{stats['p95'] / max(baseline_stats['p95'], 1e-9):.2f}")
+    return found
+
+
+def format_row(values, widths):
+    return "  ".join(str(value).rjust(width) for value, width in zip(values, widths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", nargs="+", choices=sorted(AGENTS), default=list(AGENTS))
+    parser.add_argument("--trades", nargs="+", type=int, help="Trades per auction.")
+    parser.add_argument("--fleet", nargs="+", type=int, help="Vessels per company.")
+    parser.add_argument("--depth", nargs="+", type=int, help="Trades already scheduled per vessel.")
+    parser.add_argument("--grid", action="store_true", help="Run every combination of the default sweeps.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory run.")
+    parser.add_argument("--timeout", type=float, default=60, help="The global_agent_timeout in seconds.")
+    parser.add_argument("--timeout-share", type=float, default=0.8)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    for agent in AGENTS.values():
+        get_tracer(agent[1]).set_levels(WARNING)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    header = ("agent", "callback", "trades", "fleet", "depth", "p50 ms", "p95 ms", "p99 ms", "peak KiB", "flags")
+    widths = (9, 10, 6, 5, 5, 9, 9, 9, 9, 0)
+    print(format_row(header, widths))
+    results = {}
+    flagged = 0
+    for trades, fleet_size, depth in sweep_points(args.trades, args.fleet, args.depth, args.grid):
+        for agent in args.agents:
+            stats = run_config(agent, trades, fleet_size, depth, args.repeats, args.timeout,
+                               not args.no_memory, args.seed)
+            for callback in CALLBACKS:
+                key = baseline_key(agent, callback, trades, fleet_size, depth)
+                results[key] = stats[callback]
+                found = flags(stats[callback], baseline.get(key), args.timeout, args.timeout_share,
+                              args.tolerance)
+                flagged += bool(found)
+                peak = stats[callback]["peak_kib"]
+                print(format_row((agent, callback, trades, fleet_size, depth,
+                                  f"{stats[callback]['p50'] * 1000:.1f}", f"{stats[callback]['p95'] * 1000:.1f}",
+                                  f"{stats[callback]['p99'] * 1000:.1f}",
+                                  "-" if peak is None else f"{peak:.0f}", ", ".join(found)), widths), flush=True)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    if flagged:
+        print(f"{flagged} callback(s) flagged")
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Online estimates of the competitors' profit factors.
+
+The profit factor of a won contract is payment / estimated cost, the cost
+being the cheapest vessel of the winner's fleet (see CostModel). Factors are
+kept per competitor and per route class (by laden distance) in running
+statistics that update in O(1) per contract: Welford's mean and variance over
+all contracts plus an exponentially weighted mean that follows recent
+behaviour. With these, the expected winning price of a trade is the lowest
+cost x factor over the competitors.
+"""
+import math
+
+# Upper bounds (nautical miles) of the route classes; longer routes fall into the last class.
+DEFAULT_ROUTE_CLASSES = (1500.0, 5000.0)
+
+
+class RunningStats:
+
+    def __init__(self, alpha=0.3):
+        """
+        :param alpha: Weight of the newest value in the exponentially weighted mean.
+        """
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = None
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def __repr__(self):
+        return f"RunningStats(count={self.count}, mean={self.mean:.3f}, std={self.std:.3f}, ewma={self.ewma})"
+
+
+class ProfitFactorEstimator:
+
+    def __init__(self, alpha=0.3, route_classes=DEFAULT_ROUTE_CLASSES, prior_factor=1.5, min_count=3):
+        """
+        :param alpha: Weight of the newest contract in the exponentially weighted means.
+        :param route_classes: Upper laden distance bounds of the route classes.
+        :param prior_factor: The factor assumed for a competitor that has not won anything yet.
+        :param min_count: Contracts needed in a route class before it is preferred over the competitor's
+            overall statistics.
+        """
+        self._alpha = alpha
+        self._route_classes = tuple(route_classes)
+        self.prior_factor = prior_factor
+        self._min_count = min_count
+        # (competitor name, route class) -> stats; route class None holds the competitor's overall stats
+        self._stats = {}
+
+    def route_class(self, laden_distance):
+        """
+        :return: The index of the route class for a laden distance.
+        :rtype: int
+        """
+        for i, bound in enumerate(self._route_classes):
+            if laden_distance <= bound:
+                return i
+        return len(self._route_classes)
+
+    def _get(self, competitor, route_class):
+        stats = self._stats.get((competitor, route_class))
+        if stats is None:
+            stats = RunningStats(self._alpha)
+            self._stats[(competitor, route_class)] = stats
+        return stats
+
+    def update(self, competitor, laden_distance, payment, cost):
+        """
+        Add one won contract. Contracts without a positive finite cost are ignored.
+
+        :return: The contract's profit factor or None if it was ignored.
+        """
+        if not 0 < cost < math.inf:
+            return None
+        factor = payment / cost
+        self._get(competitor, self.route_class(laden_distance)).update(factor)
+        self._get(competitor, None).update(factor)
+        return factor
+
+    def stats(self, competitor, laden_distance=None):
+        """
+        The statistics for a competitor, per route class if a laden distance is given.
+
+        :rtype: RunningStats | None
+        """
+        route_class = None if laden_distance is None else self.route_class(laden_distance)
+        return self._stats.get((competitor, route_class))
+
+    def competitors(self):
+        return sorted({competitor for competitor, _ in self._stats})
+
+    def factor(self, competitor, laden_distance, recent=True):
+        """
+        The expected profit factor of a competitor on a route: the route class statistics once they have
+        min_count contracts, else the competitor's overall statistics, else the prior.
+
+        :param recent: Use the exponentially weighted mean instead of the mean over all contracts.
+        """
+        stats = self._stats.get((competitor, self.route_class(laden_distance)))
+        if stats is None or stats.count < self._min_count:
+            stats = self._stats.get((competitor, None))
+        if stats is None:
+            return self.prior_factor
+        return stats.ewma if recent else stats.mean
+
+    def expected_winning_price(self, laden_distance, costs_by_competitor, recent=True):
+        """
+        The lowest expected bid of the competitors for a trade.
+
+        :param laden_distance: The trade's laden distance.
+        :param costs_by_competitor: Competitor name -> estimated cost of the trade for that competitor.
+        :return: (expected price, competitor) or (math.inf, None) if no competitor can do the trade.
+        """
+        best_price, best_competitor = math.inf, None
+        for competitor, cost in costs_by_competitor.items():
+            if not 0 < cost < math.inf:
+                continue
+            price = cost * self.factor(competitor, laden_distance, recent)
+            if price < best_price:
+                best_price, best_competitor = price, competitor
+        return best_price, best_competitor
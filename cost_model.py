@@ -0,0 +1,96 @@
+"""
+Batched trade x vessel cost estimates.
+
+The cost of a trade on a vessel (loading + unloading + laden travel consumption,
+as in predict_cost) is linear in the cargo amount and in the travel distance.
+The per-vessel coefficients of these terms are read once per vessel, so a whole
+trades x fleet matrix is a couple of NumPy outer products.
+"""
+import weakref
+
+import numpy as np
+
+from distance_oracle import DistanceOracle
+
+
+class CostModel:
+
+    def __init__(self, company, distances=None):
+        """
+        :param company: The company whose headquarters is used for distances.
+        :type company: TradingCompany
+        :param distances: The distance oracle to use. A new one is created if None.
+        :type distances: DistanceOracle | None
+        """
+        if distances is None:
+            distances = DistanceOracle(company)
+        self._distances = distances
+        # (handling consumption per hour, laden consumption per nautical mile, fuel price) per vessel
+        self._coefficients = weakref.WeakKeyDictionary()
+        # Loading hours per unit of cargo per (vessel, cargo type)
+        self._loading_hours = weakref.WeakKeyDictionary()
+
+    def _vessel_coefficients(self, vessel):
+        coefficients = self._coefficients.get(vessel)
+        if coefficients is None:
+            handling_per_hour = vessel.get_loading_consumption(1.0) + vessel.get_unloading_consumption(1.0)
+            hours_per_mile = vessel.get_travel_time(1.0)
+            laden_per_mile = vessel.get_laden_consumption(hours_per_mile, vessel.speed)
+            fuel_price = vessel.get_cost(1.0)
+            coefficients = (handling_per_hour, laden_per_mile, fuel_price)
+            self._coefficients[vessel] = coefficients
+        return coefficients
+
+    def _loading_hours_per_unit(self, vessel, cargo_type):
+        per_cargo_type = self._loading_hours.get(vessel)
+        if per_cargo_type is None:
+            per_cargo_type = {}
+            self._loading_hours[vessel] = per_cargo_type
+        hours = per_cargo_type.get(cargo_type)
+        if hours is None:
+            try:
+                hours = vessel.get_loading_time(cargo_type, 1.0)
+            except (KeyError, ZeroDivisionError):
+                hours = np.inf  # The vessel cannot carry this cargo type.
+            per_cargo_type[cargo_type] = hours
+        return hours
+
+    def cost_matrix(self, trades, fleet, include_fuel_price=False):
+        """
+        Estimate the cost of every trade on every vessel in one pass.
+
+        :param trades: The trades (rows).
+        :type trades: List[Trade]
+        :param fleet: The vessels (columns).
+        :type fleet: List[Vessel]
+        :param include_fuel_price: Convert the consumption into fuel cost.
+        :return: Matrix of shape (len(trades), len(fleet)). Entries are the same as predict_cost.
+        :rtype: np.ndarray
+        """
+        if len(trades) == 0 or len(fleet) == 0:
+            return np.zeros((len(trades), len(fleet)))
+        amounts = np.fromiter((trade.amount for trade in trades), dtype=float, count=len(trades))
+        laden_distances = np.fromiter(
+            (self._distances.distance(trade.origin_port, trade.destination_port) for trade in trades),
+            dtype=float, count=len(trades))
+        coefficients = np.array([self._vessel_coefficients(vessel) for vessel in fleet], dtype=float)
+        handling_per_hour, laden_per_mile, fuel_price = coefficients.T
+
+        cargo_types = [trade.cargo_type for trade in trades]
+        distinct_cargo_types = list(dict.fromkeys(cargo_types))
+        hours_per_type = np.array(
+            [[self._loading_hours_per_unit(vessel, cargo_type) for vessel in fleet]
+             for cargo_type in distinct_cargo_types], dtype=float)
+        type_rows = np.array([distinct_cargo_types.index(cargo_type) for cargo_type in cargo_types])
+        loading_hours = amounts[:, None] * hours_per_type[type_rows]
+
+        costs = loading_hours * handling_per_hour[None, :] + np.outer(laden_distances, laden_per_mile)
+        if include_fuel_price:
+            costs *= fuel_price[None, :]
+        return costs
+
+    def predict_cost(self, vessel, trade):
+        """
+        Cost of a single trade on a single vessel.
+        """
+        return float(self.cost_matrix([trade], [vessel])[0, 0])
@@ -0,0 +1,147 @@
+"""
+Cached port-to-port network distances.
+
+Every port in ports.csv gets an integer index and distances are kept in a dense
+matrix that is filled lazily from headquarters.get_network_distance. The matrix
+lives in a memory-mapped .npy file, so later runs (and other processes) start
+with the distances that were already computed.
+"""
+import csv
+import os
+
+import numpy as np
+
+from mable.simulation_space.universe import OnJourney
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PORTS_PATH = os.path.join(_HERE, "ports.csv")
+# AGENT_DISTANCE_CACHE overrides the cache file, an empty value keeps the distances in memory only
+# (e.g. for runs on a made-up network, whose distances must not end up in the shared cache).
+DEFAULT_CACHE_PATH = os.environ.get("AGENT_DISTANCE_CACHE", os.path.join(_HERE, "port_distances.npy")) or None
+
+# Opened matrices and port lists, shared by all oracles of a process (headquarters.get_companies()
+# instantiates a copy of every company, so oracles get created more often than it looks).
+_MATRICES = {}
+_PORT_NAMES = {}
+
+
+def load_port_names(path=DEFAULT_PORTS_PATH):
+    """
+    Read the port names from ports.csv in file order. The position in the list is the port index.
+
+    :param path: The path of the ports file.
+    :return: The port names.
+    :rtype: List[str]
+    """
+    if path not in _PORT_NAMES:
+        with open(path, newline="") as ports_file:
+            reader = csv.reader(ports_file)
+            next(reader)
+            _PORT_NAMES[path] = [row[0].strip() for row in reader if row]
+    return _PORT_NAMES[path]
+
+
+class DistanceOracle:
+
+    def __init__(self, company, ports_path=DEFAULT_PORTS_PATH, cache_path=DEFAULT_CACHE_PATH):
+        """
+        :param company: The company whose headquarters computes missing distances.
+        :type company: TradingCompany
+        :param ports_path: The ports file that defines the port indices.
+        :param cache_path: The memory-mapped distance matrix. None keeps the matrix in memory only.
+        """
+        self._company = company
+        self.port_names = load_port_names(ports_path)
+        self.port_index = {name: i for i, name in enumerate(self.port_names)}
+        self._cache_path = cache_path
+        key = (cache_path, len(self.port_names))
+        if cache_path is None or key not in _MATRICES:
+            _MATRICES[key] = self._open_matrix(len(self.port_names))
+        self._matrix = _MATRICES[key]
+        # Locations that are not ports in ports.csv, e.g. positions on a journey.
+        self._other = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _open_matrix(self, size):
+        shape = (size, size)
+        if self._cache_path is None:
+            return np.full(shape, np.nan)
+        if os.path.isfile(self._cache_path):
+            try:
+                matrix = np.load(self._cache_path, mmap_mode="r+")
+                if matrix.shape == shape:
+                    return matrix
+            except (OSError, ValueError):
+                pass  # Unreadable cache, start a fresh one.
+        # Written under a temporary name and moved into place, so processes that run in parallel never
+        # map a half-written (or truncated) file.
+        temporary_path = f"{self._cache_path}.{os.getpid()}.tmp"
+        try:
+            matrix = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.float64, shape=shape)
+            matrix[:] = np.nan
+            matrix.flush()
+            del matrix
+            os.replace(temporary_path, self._cache_path)
+            return np.load(self._cache_path, mmap_mode="r+")
+        except OSError:
+            return np.full(shape, np.nan)
+
+    def index_of(self, location):
+        """
+        :param location: A port, a port name or any other location.
+        :return: The index of the port in ports.csv or None if the location is not a known port.
+        :rtype: int | None
+        """
+        if isinstance(location, OnJourney):
+            return None
+        name = location if isinstance(location, str) else getattr(location, "name", None)
+        return self.port_index.get(name)
+
+    def distance(self, location_one, location_two):
+        """
+        Drop-in replacement for headquarters.get_network_distance with O(1) lookups for known ports.
+
+        :return: The network distance or math.inf if there is no route.
+        :rtype: float
+        """
+        i = self.index_of(location_one)
+        j = self.index_of(location_two)
+        if i is None or j is None:
+            return self._other_distance(location_one, location_two)
+        distance = self._matrix[i, j]
+        if distance == distance:  # not NaN
+            self.hits += 1
+            return float(distance)
+        self.misses += 1
+        distance = self._company.headquarters.get_network_distance(location_one, location_two)
+        # Routes are looked up in both directions by the network, so the matrix is symmetric.
+        self._matrix[i, j] = distance
+        self._matrix[j, i] = distance
+        return distance
+
+    def distance_by_index(self, i, j):
+        """
+        Distance between two port indices, computing it if it is not cached yet.
+        """
+        return self.distance(self.port_names[i], self.port_names[j])
+
+    def _other_distance(self, location_one, location_two):
+        if isinstance(location_one, OnJourney) or isinstance(location_two, OnJourney):
+            return self._company.headquarters.get_network_distance(location_one, location_two)
+        key = (location_one, location_two)
+        distance = self._other.get(key)
+        if distance is None:
+            self.misses += 1
+            distance = self._company.headquarters.get_network_distance(location_one, location_two)
+            self._other[key] = distance
+        else:
+            self.hits += 1
+        return distance
+
+    def save(self):
+        """
+        Flush the computed distances to the cache file.
+        """
+        if isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
@@ -0,0 +1,95 @@
+"""
+Memoised verify_schedule() results.
+
+verify_schedule() enumerates all cycles of the schedule's temporal network and is
+by far the most expensive call of the planning code. The result only depends on
+the vessel, its state at the current time and the ordered list of tasks, so it
+is cached under a fingerprint built from exactly these. inform() and receive()
+share one cache, so a plan verified while bidding is not verified again when
+the contract is won.
+"""
+from collections import OrderedDict
+
+
+def trade_key(trade):
+    """
+    A hashable identity of a trade that survives copies of the trade (e.g. in contracts).
+
+    :param trade: The trade.
+    :type trade: Trade
+    :return: The key.
+    :rtype: tuple
+    """
+    time_window = getattr(trade, "time_window", None)
+    return (
+        getattr(trade.origin_port, "name", trade.origin_port),
+        getattr(trade.destination_port, "name", trade.destination_port),
+        trade.amount,
+        trade.cargo_type,
+        tuple(time_window) if time_window is not None else None,
+        getattr(trade, "time", None),
+    )
+
+
+def schedule_fingerprint(schedule, vessel, current_time):
+    """
+    A cheap fingerprint of a schedule's state: who, when, from where, and which tasks in which order.
+
+    :param schedule: The schedule.
+    :type schedule: Schedule
+    :param vessel: The vessel the schedule is for.
+    :param current_time: The current simulation time.
+    :return: The fingerprint.
+    :rtype: tuple
+    """
+    location = vessel.location
+    tasks = tuple((location_type, trade_key(trade)) for location_type, trade in schedule.get_simple_schedule())
+    return id(vessel), current_time, getattr(location, "name", repr(location)), len(schedule), tasks
+
+
+class FeasibilityCache:
+
+    def __init__(self, company, maxsize=4096):
+        """
+        :param company: The company whose headquarters provides the current time.
+        :type company: TradingCompany
+        :param maxsize: The maximum number of remembered results. The least recently used ones are dropped.
+        :type maxsize: int
+        """
+        self._company = company
+        self._maxsize = maxsize
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def verify(self, schedule, vessel):
+        """
+        Same as schedule.verify_schedule(), but each schedule state is only ever verified once.
+
+        :param schedule: The schedule to verify.
+        :type schedule: Schedule
+        :param vessel: The vessel the schedule is for.
+        :return: True if the schedule is feasible.
+        :rtype: bool
+        """
+        key = schedule_fingerprint(schedule, vessel, self._company.headquarters.current_time)
+        result = self._results.get(key)
+        if result is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return result
+        self.misses += 1
+        result = schedule.verify_schedule()
+        self._results[key] = result
+        if len(self._results) > self._maxsize:
+            self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses, {len(self._results)} cached"
@@ -1,150 +1,189 @@
 from mable.cargo_bidding import TradingCompany, Bid
 
+from distance_oracle import DistanceOracle
+from feasibility_cache import FeasibilityCache
+from insertion import InsertionPlanner
+from precompute import PlanPrecomputer
+from tracing import get_tracer
+from trial_schedule import committed_schedules
+
 class Companyn(TradingCompany):
-    def __init__(self, fleet, name):
+    def __init__(self, fleet, name, precompute=False):
         super().__init__(fleet, name)
         self._future_trades = None
-        # Maps each trade to the vessel and schedule we planned for it in inform()
+        # Maps each trade to the vessel and trial schedule (insertion only, see trial_schedule.py) planned in inform()
         self._planned_schedules = {}
+        # One copy of each vessel's committed schedule, shared by all trial insertions of an auction
+        self._committed = None
+        # Port distances cached on disk, shared by all lookups of this agent
+        self._distances = DistanceOracle(self)
+        # verify_schedule() results shared between inform() and receive()
+        self._feasibility = FeasibilityCache(self)
+        # Best-insertion search over every (pick-up, drop-off) pair of every vessel
+        self._planner = InsertionPlanner(self, self._distances, self._feasibility)
+        # Optionally plan the trades announced in pre_inform() in a background thread (see precompute.py)
+        self._precompute = PlanPrecomputer(self, self._distances) if precompute else None
+        # Levelled tracing instead of print(); per-trade/per-vessel messages are DEBUG
+        self._trace = get_tracer(name)
 
     #  Store information about trades that will appear in the next auction.
     def pre_inform(self, trades, time):
-        print(f"pre_inform called: storing {len(trades)} upcoming trades for time {time}")
+        self._trace.info("pre_inform called: storing %d upcoming trades for time %s", len(trades), time)
         self._future_trades = trades
+        if self._precompute is not None:
+            self._precompute.announce(trades)
 
-    # Tentatively add the trade to this vessel's schedule.
-    # Returns (True, new_schedule) if the resulting schedule is feasible, otherwise (False, None).
+    # Tentatively add the trade to this vessel's schedule at its cheapest feasible insertion point.
+    # Returns (True, trial_schedule) if the resulting schedule is feasible, otherwise (False, None).
     def try_schedule_on_vessel(self, vessel, trade):
         try:
-            new_schedule = vessel.schedule.copy()
-            new_schedule.add_transportation(trade)
+            trial, _ = self._planner.plan_trial([vessel], trade, self._committed)
 
-            if new_schedule.verify_schedule():
-                return True, new_schedule
+            if trial is not None:
+                return True, trial
 
-            print(
-                f"Schedule not feasible for vessel {vessel.name} "
-                f"with trade {getattr(trade, 'id', 'unknown')} (time-window/capacity/other)."
-            )
+            if self._trace.debug_enabled:
+                self._trace.debug(
+                    "Schedule not feasible for vessel %s with trade %s (time-window/capacity/other).",
+                    vessel.name, getattr(trade, 'id', 'unknown'))
             return False, None
 
         except Exception as e:
-            print(f"Exception while trying schedule on vessel {vessel.name}: {e}")
+            self._trace.error("Exception while trying schedule on vessel %s: %s", vessel.name, e)
             return False, None
 
-    # Try all vessels and return the first (vessel, schedule) pair that yields a feasible schedule.
+    # Search every insertion point on every vessel and return the cheapest feasible (vessel, trial schedule) pair.
     # If none are feasible, return (None, None).
     def plan_for_trade(self, trade):
-        for vessel in self._fleet:
-            feasible, sched = self.try_schedule_on_vessel(vessel, trade)
-            if feasible:
-                return vessel, sched
-
-        print(
-            f"No feasible vessel found for trade "
-            f"{getattr(trade, 'id', 'unknown')} – will NOT bid on this trade."
-        )
+        trial, _ = self._planner.plan_trial(self._fleet, trade, self._committed)
+        if trial is not None:
+            return trial.vessel, trial
+
+        if self._trace.debug_enabled:
+            self._trace.debug(
+                "No feasible vessel found for trade %s – will NOT bid on this trade.",
+                getattr(trade, 'id', 'unknown'))
         return None, None
 
     # Decide which trades to bid on in the current auction round.
     # Only bid on trades for which we can find at least one feasible vessel schedule.
     def inform(self, trades, *args, **kwargs):
-        print(f"\ninform called: {len(trades)} trades offered this round")
+        self._trace.info("inform called: %d trades offered this round", len(trades))
         bids = []
         self._planned_schedules = {}
+        self._committed = committed_schedules(self._fleet)
+        if self._precompute is not None:
+            # The background planner must not compete with inform() for the interpreter
+            self._precompute.pause()
 
         for i, trade in enumerate(trades):
             try:
-                origin = getattr(trade, "origin_port", getattr(trade, "start_port", None))
-                destination = getattr(trade, "destination_port", getattr(trade, "end_port", None))
-
-                print(
-                    f"Trade {i}: origin={getattr(origin, 'name', origin)}, "
-                    f"dest={getattr(destination, 'name', destination)}, "
-                    f"amount={getattr(trade, 'amount', 'NA')}"
-                )
-
-                vessel, sched = self.plan_for_trade(trade)
-                if vessel is None or sched is None:
+                if self._trace.debug_enabled:
+                    origin = getattr(trade, "origin_port", getattr(trade, "start_port", None))
+                    destination = getattr(trade, "destination_port", getattr(trade, "end_port", None))
+                    self._trace.debug(
+                        "Trade %d: origin=%s, dest=%s, amount=%s",
+                        i, getattr(origin, 'name', origin), getattr(destination, 'name', destination),
+                        getattr(trade, 'amount', 'NA'))
+
+                vessel, trial = None, None
+                if self._precompute is not None:
+                    vessel, trial = self._precompute.take(trade, self._committed, self._feasibility.verify)
+                if vessel is None:
+                    vessel, trial = self.plan_for_trade(trade)
+                if vessel is None or trial is None:
                     continue
                
-                self._planned_schedules[trade] = (vessel, sched)
+                self._planned_schedules[trade] = (vessel, trial)
 
                 cost = self.predict_cost(vessel, trade)
                 # preliminary agent: bid at our estimated cost
                 bid_amount = cost*1.2 
                 bids.append(Bid(amount=bid_amount, trade=trade))
-                print(
-                    f"Trade {i}: vessel={vessel.name}, "
-                    f"bid={bid_amount}, cost_estimate={cost}"
-                )
+                self._trace.debug("Trade %d: vessel=%s, bid=%s, cost_estimate=%s", i, vessel.name, bid_amount, cost)
 
             except Exception as e:
-                print(f"Failed to process trade {i}: {e}")
+                self._trace.error("Failed to process trade %d: %s", i, e)
 
-        print(f"Total bids prepared: {len(bids)}")
+        self._trace.info("Total bids prepared: %d", len(bids))
+        if self._precompute is not None:
+            self._trace.info("Precompute: %s", self._precompute.report())
+            self._precompute.resume()
         return bids
 
     # Apply schedules for the trades we actually won in the auction.
     # Uses the plans computed earlier in inform(), with a fallback recomputation if needed.
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
-        print(f"\nreceive called: {len(contracts)} contracts won")
+        self._trace.info("receive called: %d contracts won", len(contracts))
+        # The plans are relative to the schedules at bidding time; recomputed plans use the current ones
+        self._committed = None
+        if self._precompute is not None:
+            self._precompute.pause()
+        changed = set()
 
         for i, contract in enumerate(contracts):
             trade = contract.trade
             planned = self._planned_schedules.get(trade, None)
 
+            if planned is not None and planned[1].is_stale():
+                # An earlier contract of this round already changed the vessel's schedule
+                planned = None
+
             if planned is None:
-                print(
-                    f"No stored plan for trade {getattr(trade, 'id', 'unknown')} "
-                    f"in receive(); recomputing schedule."
-                )
-                vessel, sched = self.plan_for_trade(trade)
-                if vessel is None or sched is None:
-                    print(
-                        f"Even recomputed schedule is infeasible for trade "
-                        f"{getattr(trade, 'id', 'unknown')}. Leaving it unscheduled."
-                    )
+                self._trace.warning(
+                    "No usable plan for trade %s in receive(); recomputing schedule.",
+                    getattr(trade, 'id', 'unknown'))
+                vessel, trial = self.plan_for_trade(trade)
+                if vessel is None or trial is None:
+                    self._trace.warning(
+                        "Even recomputed schedule is infeasible for trade %s. Leaving it unscheduled.",
+                        getattr(trade, 'id', 'unknown'))
                     continue
             else:
-                vessel, sched = planned
+                vessel, trial = planned
 
             try:
-                if not sched.verify_schedule():
-                    print(
-                        f"Planned schedule for trade {getattr(trade, 'id', 'unknown')} "
-                        f"failed verify_schedule() in receive(). Skipping."
-                    )
+                # Only now the plan becomes a real schedule
+                sched = trial.materialize()
+                if not self._feasibility.verify(sched, vessel):
+                    self._trace.warning(
+                        "Planned schedule for trade %s failed verify_schedule() in receive(). Skipping.",
+                        getattr(trade, 'id', 'unknown'))
                     continue
 
-                print(
-                    f"Applying schedule for trade {getattr(trade, 'id', 'unknown')} "
-                    f"to vessel {vessel.name}"
-                )
+                self._trace.debug(
+                    "Applying schedule for trade %s to vessel %s", getattr(trade, 'id', 'unknown'), vessel.name)
                 vessel.schedule = sched
+                changed.add(vessel)
 
             except Exception as e:
-                print(
-                    f"Exception while applying schedule for trade "
-                    f"{getattr(trade, 'id', 'unknown')} on vessel {vessel.name}: {e}"
-                )
+                self._trace.error(
+                    "Exception while applying schedule for trade %s on vessel %s: %s",
+                    getattr(trade, 'id', 'unknown'), vessel.name, e)
+
+        if self._precompute is not None:
+            # Background plans on the vessels that got new work no longer apply
+            self._precompute.invalidate(changed)
+            self._precompute.resume()
 
+        self._trace.info("Feasibility cache: %s", self._feasibility.stats())
+        self._distances.save()
         self._future_trades = None
 
     # Return a simple cost estimate for performing this trade with this vessel.
     # This is intentionally basic for the preliminary submission.
     def predict_cost(self, vessel, trade):
         try:
-            origin = getattr(trade, "origin_port", getattr(trade, "start_port", "UNKNOWN"))
-            destination = getattr(trade, "destination_port", getattr(trade, "end_port", "UNKNOWN"))
-            origin_name = getattr(origin, "name", origin)
-            dest_name = getattr(destination, "name", destination)
-
-            total_cost = 1000.0  
-            print(f"Predicted cost for trade {origin_name}->{dest_name}: {total_cost}")
+            total_cost = 1000.0
+            if self._trace.debug_enabled:
+                origin = getattr(trade, "origin_port", getattr(trade, "start_port", "UNKNOWN"))
+                destination = getattr(trade, "destination_port", getattr(trade, "end_port", "UNKNOWN"))
+                self._trace.debug(
+                    "Predicted cost for trade %s->%s: %s",
+                    getattr(origin, "name", origin), getattr(destination, "name", destination), total_cost)
             return total_cost
 
         except Exception as e:
-            print(f"Failed to predict cost: {e}")
+            self._trace.error("Failed to predict cost: %s", e)
             # Return a large number to avoid accidentally underbidding when we are unsure
             return 10_000.0
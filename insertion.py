@@ -0,0 +1,243 @@
+"""
+Best-insertion search for placing a trade into a fleet's schedules.
+
+Every (pick-up, drop-off) pair from get_insertion_points() is priced by the
+detour it adds to the vessel's route plus the cargo handling fuel. The
+candidates are then tried cheapest first, so schedule copies and
+verify_schedule() calls are only spent until the first feasible plan is found.
+"""
+import math
+
+from mable.simulation_space.universe import OnJourney
+
+from distance_oracle import DistanceOracle
+from feasibility_cache import FeasibilityCache
+from trial_schedule import TrialSchedule, task_signature
+
+
+class InsertionPlanner:
+
+    def __init__(self, company, distances=None, feasibility=None):
+        """
+        :param company: The company whose headquarters is used for distances and the current time.
+        :type company: TradingCompany
+        :param distances: The distance oracle to use. A new one is created if None.
+        :type distances: DistanceOracle | None
+        :param feasibility: The cache of verify_schedule() results. A new one is created if None.
+        :type feasibility: FeasibilityCache | None
+        """
+        self._company = company
+        if distances is None:
+            distances = DistanceOracle(company)
+        self._distances = distances
+        if feasibility is None:
+            feasibility = FeasibilityCache(company)
+        self._feasibility = feasibility
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.candidates = 0
+        self.pruned_vessels = 0
+        self.copies = 0
+        self.verifications = 0
+
+    def distance(self, location_one, location_two):
+        return self._distances.distance(location_one, location_two)
+
+    @staticmethod
+    def _task_ports(schedule):
+        # Port visited by every task (pick-up or drop-off) in schedule order.
+        ports = []
+        for location_type, trade in schedule.get_simple_schedule():
+            if location_type == "PICK_UP":
+                ports.append(trade.origin_port)
+            else:
+                ports.append(trade.destination_port)
+        return ports
+
+    @staticmethod
+    def _vessel_port(vessel):
+        location = vessel.location
+        if isinstance(location, OnJourney):
+            location = location.destination
+        return location
+
+    def _fuel_cost(self, vessel, distance):
+        travel_time = vessel.get_travel_time(distance)
+        return vessel.get_cost(vessel.get_laden_consumption(travel_time, vessel.speed))
+
+    def _handling_cost(self, vessel, trade):
+        loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
+        consumption = vessel.get_loading_consumption(loading_time) + vessel.get_unloading_consumption(loading_time)
+        return vessel.get_cost(consumption)
+
+    def route_cost(self, vessel, schedule, without=None):
+        """
+        Estimated cost of a whole schedule on the same terms as the insertion prices: the fuel for sailing
+        from the vessel's position through all tasks plus the handling of every cargo.
+
+        :param without: Optional trade of the schedule whose pick-up and drop-off are left out, so
+            route_cost(vessel, schedule) - route_cost(vessel, schedule, trade) is the saving of removing it.
+        :return: The estimated cost.
+        :rtype: float
+        """
+        previous = self._vessel_port(vessel)
+        distance = 0.0
+        handling_cost = 0.0
+        for location_type, trade in schedule.get_simple_schedule():
+            if trade is without:
+                continue
+            if location_type == "PICK_UP":
+                port = trade.origin_port
+                handling_cost += self._handling_cost(vessel, trade)
+            else:
+                port = trade.destination_port
+            distance += self.distance(previous, port)
+            previous = port
+        return self._fuel_cost(vessel, distance) + handling_cost
+
+    def _can_never_fit(self, vessel, trade):
+        """
+        Cheap vessel level checks that hold for every insertion point: the cargo has to fit into the
+        hold and the vessel has to be able to reach the origin before the pick-up window closes.
+        """
+        try:
+            if trade.amount > vessel.capacity(trade.cargo_type):
+                return True
+        except (KeyError, AttributeError):
+            return True
+        latest_pickup = getattr(trade, "latest_pickup_clean", math.inf)
+        if latest_pickup < math.inf:
+            direct_distance = self.distance(self._vessel_port(vessel), trade.origin_port)
+            earliest_arrival = self._company.headquarters.current_time + vessel.get_travel_time(direct_distance)
+            if earliest_arrival > latest_pickup:
+                return True
+        return False
+
+    def _price_insertions(self, vessel, trade, schedule):
+        """
+        Price all (pick-up, drop-off) pairs of a schedule without copying or verifying it.
+
+        :return: List of (estimated cost, pick-up index, drop-off index).
+        :rtype: List[Tuple[float, int, int]]
+        """
+        ports = self._task_ports(schedule)
+        insertion_points = list(schedule.get_insertion_points())
+        start = self._vessel_port(vessel)
+        origin = trade.origin_port
+        destination = trade.destination_port
+
+        def stop(index):
+            # Insertion point i sits between task i - 1 and task i (1-based), task 0 being the vessel.
+            return start if index == 0 else ports[index - 1]
+
+        def detour(index, port):
+            before = stop(index - 1)
+            added = self.distance(before, port)
+            if index <= len(ports):
+                after = stop(index)
+                added += self.distance(port, after) - self.distance(before, after)
+            return added
+
+        handling_cost = self._handling_cost(vessel, trade)
+        laden_distance = self.distance(origin, destination)
+        priced = []
+        for k, idx_pick_up in enumerate(insertion_points):
+            pick_up_detour = detour(idx_pick_up, origin)
+            for idx_drop_off in insertion_points[k:]:
+                if idx_drop_off == idx_pick_up:
+                    added = self.distance(stop(idx_pick_up - 1), origin) + laden_distance
+                    if idx_pick_up <= len(ports):
+                        after = stop(idx_pick_up)
+                        added += (self.distance(destination, after)
+                                  - self.distance(stop(idx_pick_up - 1), after))
+                else:
+                    added = pick_up_detour + detour(idx_drop_off, destination)
+                priced.append((self._fuel_cost(vessel, added) + handling_cost, idx_pick_up, idx_drop_off))
+        return priced
+
+    def _verified_schedule(self, vessel, base_schedule, trade, idx_pick_up, idx_drop_off):
+        new_schedule = base_schedule.copy()
+        self.copies += 1
+        try:
+            new_schedule.add_transportation(trade, idx_pick_up, idx_drop_off)
+        except ValueError:
+            return None
+        self.verifications += 1
+        if self._feasibility.verify(new_schedule, vessel):
+            return new_schedule
+        return None
+
+    def plan_for_trade(self, fleet, trade, schedules=None, deadline=None):
+        """
+        Find the cheapest feasible insertion of the trade over all vessels of the fleet.
+
+        :param fleet: The vessels to consider.
+        :param trade: The trade to insert.
+        :param schedules: Optional schedules to build on instead of the vessels' current schedules,
+            indexed by vessel.
+        :param deadline: Optional Deadline. Once it expired no further candidates are verified.
+        :type deadline: Deadline | None
+        :return: (vessel, schedule, estimated cost) or (None, None, None) if no insertion is feasible
+            (or none was found in time).
+        """
+        vessel, new_schedule, cost, _, _ = self._search(fleet, trade, schedules, deadline)
+        return vessel, new_schedule, cost
+
+    def plan_trial(self, fleet, trade, schedules=None, deadline=None):
+        """
+        Same search as plan_for_trade, but the plan is kept as a TrialSchedule (the insertion points on top
+        of the committed schedule) instead of a schedule copy.
+
+        :param schedules: Optional copies of the vessels' committed schedules to share between searches,
+            see trial_schedule.committed_schedules. Other schedules would make the trial meaningless.
+        :return: (trial schedule, estimated cost) or (None, None) if no insertion is feasible.
+        :rtype: Tuple[TrialSchedule | None, float | None]
+        """
+        vessel, new_schedule, cost, idx_pick_up, idx_drop_off = self._search(fleet, trade, schedules, deadline)
+        if vessel is None:
+            return None, None
+        # The trial refers to the schedule it was planned on
+        base_schedule = (schedules or {}).get(vessel)
+        return TrialSchedule(vessel, ((trade, idx_pick_up, idx_drop_off),),
+                             None if base_schedule is None else task_signature(base_schedule)), cost
+
+    def _search(self, fleet, trade, schedules, deadline):
+        if schedules is None:
+            schedules = {}
+        candidates = []
+        base_schedules = {}
+        for vessel_idx, vessel in enumerate(fleet):
+            if self._can_never_fit(vessel, trade):
+                self.pruned_vessels += 1
+                continue
+            base_schedule = schedules.get(vessel)
+            if base_schedule is None:
+                # Vessel.schedule already hands out a copy.
+                base_schedule = vessel.schedule
+                self.copies += 1
+            base_schedules[vessel_idx] = base_schedule
+            for cost, idx_pick_up, idx_drop_off in self._price_insertions(vessel, trade, base_schedule):
+                candidates.append((cost, vessel_idx, idx_pick_up, idx_drop_off))
+        self.candidates += len(candidates)
+
+        # Cheapest first: the first candidate that verifies is the cheapest feasible one.
+        candidates.sort()
+        for cost, vessel_idx, idx_pick_up, idx_drop_off in candidates:
+            if deadline is not None and deadline.expired():
+                break
+            new_schedule = self._verified_schedule(
+                fleet[vessel_idx], base_schedules[vessel_idx], trade, idx_pick_up, idx_drop_off)
+            if new_schedule is not None:
+                return fleet[vessel_idx], new_schedule, cost, idx_pick_up, idx_drop_off
+        return None, None, None, None, None
+
+    def best_insertion(self, vessel, trade, schedule=None):
+        """
+        Find the cheapest feasible insertion of the trade into a single vessel's schedule.
+
+        :return: (schedule, estimated cost) or (None, None) if no insertion is feasible.
+        """
+        schedules = None if schedule is None else {vessel: schedule}
+        _, new_schedule, cost = self.plan_for_trade([vessel], trade, schedules)
+        return new_schedule, cost
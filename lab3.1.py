@@ -1,20 +1,34 @@
 from mable.cargo_bidding import TradingCompany
 from mable.examples import environment, fleets, shipping
-from mable.transport_operation import Bid, ScheduleProposal
+from mable.transport_operation import Bid
+
+from assignment import BatchAssigner
+from cost_model import CostModel
+from distance_oracle import DistanceOracle
+from insertion import InsertionPlanner
+from regret_search import RegretSearch
+from tracing import get_tracer
 
 
 class MyCompany(TradingCompany):
+    SEARCH_BUDGET_MS = 500  # Time for improving the matched plan per propose/find call
 
     def __init__(self, fleet, name):
         super().__init__(fleet, name)
         self._future_trades = None  # Stores trades for the next auction
+        self._distances = DistanceOracle(self)  # Cached port distances
+        self._cost_model = CostModel(self, self._distances)  # Batched trade x vessel costs
+        self._trace = get_tracer(name)  # Levelled tracing, per-trade messages are DEBUG
+        planner = InsertionPlanner(self, self._distances)
+        self._assigner = BatchAssigner(self, planner)  # Trades x vessels matching
+        self._search = RegretSearch(self, planner)  # Regret insertion + destroy/repair on top of the matching
 
     def pre_inform(self, trades, time):
         self._future_trades = trades
-        print(f"[pre_inform] Storing {len(trades)} future trades for next auction.")
+        self._trace.info("[pre_inform] Storing %d future trades for next auction.", len(trades))
 
     def inform(self, trades, *args, **kwargs):
-        print(f"[inform] Bidding on {len(trades)} current trades.")
+        self._trace.info("[inform] Bidding on %d current trades.", len(trades))
         proposed_scheduling = self.propose_schedules(trades)
         scheduled_trades = proposed_scheduling.scheduled_trades
         self._current_scheduling_proposal = proposed_scheduling
@@ -25,95 +39,55 @@ class MyCompany(TradingCompany):
         ]
         bids = [Bid(amount=cost, trade=trade) for trade, cost in trades_and_costs]
 
-        print(f"[inform] Created {len(bids)} bids:")
-        for bid in bids:
-            print(f"  Trade {bid.trade.origin_port}->{bid.trade.destination_port}, Bid amount: {bid.amount:.2f}")
+        self._trace.info("[inform] Created %d bids", len(bids))
+        if self._trace.debug_enabled:
+            for bid in bids:
+                self._trace.debug("  Trade %s->%s, Bid amount: %.2f",
+                                  bid.trade.origin_port, bid.trade.destination_port, bid.amount)
 
         self._future_trades = None  # Forget future trades after bidding
         return bids
 
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
         trades = [contract.trade for contract in contracts]
-        print(f"[receive] Applying {len(trades)} won trades.")
+        self._trace.info("[receive] Applying %d won trades.", len(trades))
         scheduling_proposal = self.find_schedules(trades)
         self.apply_schedules(scheduling_proposal.schedules)
+        self._distances.save()
 
     def propose_schedules(self, trades):
-        schedules = {}
-        costs = {}
-        scheduled_trades = []
-
-        for vessel in self._fleet:
-            print(f"\n[propose_schedules] Evaluating vessel: {vessel.name}")
-
-            best_trade = None
-            min_distance = float("inf")
-
+        # All trades are matched to the fleet at once (see assignment.py). With future trades known, a trade
+        # also pays for the ballast trip from its destination to the closest future pick-up.
+        extra_cost = None
+        if self._future_trades:
+            closest_future = {}
             for current_trade in trades:
-                if not current_trade:
-                    continue    
-
-                print(f"  Considering current trade: {current_trade.origin_port}->{current_trade.destination_port}")
-
-                # Case 1: Future trades exist
-                if self._future_trades:
-                    # Find the closest future trade
-                    for future_trade in self._future_trades:
-                        distance = self.headquarters.get_network_distance(
-                            current_trade.destination_port,
-                            future_trade.origin_port
-                        )
-                        print(f"    Distance to future trade {future_trade.origin_port}->{future_trade.destination_port}: {distance:.2f}")
-
-                        if distance < min_distance:
-                            min_distance = distance
-                            best_trade = current_trade
-
-                # Case 2: No future trades, just pick current trade
-                else:
-                    best_trade = current_trade
-                    min_distance = 0
-                    break
-
-
-            if best_trade:
-                print(f"  Selected trade for vessel {vessel.name}: {best_trade.origin_port}->{best_trade.destination_port}, Closest distance to future trade: {min_distance:.2f}")
-                new_schedule = schedules.get(vessel, vessel.schedule.copy())
-                new_schedule.add_transportation(best_trade)
-
-                if new_schedule.verify_schedule():
-                    schedules[vessel] = new_schedule
-                    scheduled_trades.append(best_trade)
-                    costs[best_trade] = self.predict_cost(vessel, best_trade)
-                    print(f"    Predicted cost: {costs[best_trade]:.2f}")
-
-        return ScheduleProposal(schedules, scheduled_trades, costs)
+                closest_future[id(current_trade)] = min(
+                    self._distances.distance(current_trade.destination_port, future_trade.origin_port)
+                    for future_trade in self._future_trades)
+                if self._trace.debug_enabled:
+                    self._trace.debug("  Trade %s->%s: closest future trade at %.2f",
+                                      current_trade.origin_port, current_trade.destination_port,
+                                      closest_future[id(current_trade)])
+
+            def extra_cost(vessel, trade):
+                travel_time = vessel.get_travel_time(closest_future[id(trade)])
+                return vessel.get_cost(vessel.get_ballast_consumption(travel_time, vessel.speed))
+
+        proposal = self._assigner.assign(trades, extra_cost=extra_cost, cost_function=self.predict_cost)
+        proposal = self._search.improve(trades, proposal, self.SEARCH_BUDGET_MS,
+                                        extra_cost=extra_cost, cost_function=self.predict_cost)
+        if self._trace.debug_enabled:
+            for vessel, schedule in proposal.schedules.items():
+                self._trace.debug("[propose_schedules] Vessel %s: %d tasks", vessel.name, len(schedule))
+        return proposal
 
     def predict_cost(self, vessel, trade):
-        loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-        loading_cost = vessel.get_loading_consumption(loading_time)
-        unloading_cost = vessel.get_unloading_consumption(loading_time)
-        travel_distance = self.headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-        travel_time = vessel.get_travel_time(travel_distance)
-        travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-        return loading_cost + unloading_cost + travel_cost
+        # Loading + unloading + laden travel consumption, see CostModel.cost_matrix for many trades at once
+        return self._cost_model.predict_cost(vessel, trade)
 
     def find_schedules(self, trades):
-        schedules = {}
-        scheduled_trades = []
-
-        for trade in trades:
-            is_assigned = False
-            for vessel in self._fleet:
-                if is_assigned:
-                    break
-                new_schedule = schedules.get(vessel, vessel.schedule.copy())
-                new_schedule.add_transportation(trade)
-                if new_schedule.verify_schedule():
-                    schedules[vessel] = new_schedule
-                    scheduled_trades.append(trade)
-                    is_assigned = True
-        return ScheduleProposal(schedules, scheduled_trades, {})
+        return self._search.improve(trades, self._assigner.assign(trades), self.SEARCH_BUDGET_MS)
 
 
 def build_specification():
@@ -93,19 +93,49 @@
 
 from mable.cargo_bidding import TradingCompany
 from mable.examples import environment, fleets, shipping, companies
-from mable.transport_operation import ScheduleProposal
+
+from assignment import BatchAssigner
+from distance_oracle import DistanceOracle
+from insertion import InsertionPlanner
+from reachability import CompetitorReachability
+from regret_search import RegretSearch
+from tracing import get_tracer
+from vessel_timeline import TimelineIndex
 
 
 class MyCompany(TradingCompany):
+    SEARCH_BUDGET_MS = 500  # Time for improving the matched plan per propose/find call
+
+    def __init__(self, fleet, name):
+        super().__init__(fleet, name)
+        self._distances = DistanceOracle(self)  # Cached port distances
+        self._trace = get_tracer(name)  # Levelled tracing
+        self._reachability = CompetitorReachability(self._distances)  # Competitor arrivals, rebuilt every auction
+        self._timelines = TimelineIndex(self._distances)  # Competitor vessels over time, with the trades they won
+        planner = InsertionPlanner(self, self._distances)
+        self._assigner = BatchAssigner(self, planner)  # Trades x vessels matching
+        self._search = RegretSearch(self, planner)  # Regret insertion + destroy/repair on top of the matching
 
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
         trades = [one_contract.trade for one_contract in contracts]
         scheduling_proposal = self.find_schedules(trades)
         _ = self.apply_schedules(scheduling_proposal.schedules)
+        # The competitors' schedules are not visible, so the trades they won are laid out on their vessels
+        current_time = self.headquarters.current_time
+        for company in self.headquarters.get_companies():
+            won = (auction_ledger or {}).get(company.name)
+            if company.name != self.name and won:
+                self._timelines.record_won(company, [contract.trade for contract in won], current_time)
+        self._distances.save()
 
     def propose_schedules(self, trades):
-        schedules = {}
-        scheduled_trades = []
+        # The competitors' vessels only move between auctions, so their arrivals at all origins are computed once
+        # (get_companies() hands out copies of the companies, so we are recognised by name)
+        competitors = [company for company in self.headquarters.get_companies() if company.name != self.name]
+        for company in competitors:
+            self._timelines.update(company, self.headquarters.current_time)
+        self._reachability.rebuild(competitors, trades, self.headquarters.current_time, self._timelines)
+
         i = 0
         while i < len(trades):
             current_trade = trades[i]
@@ -113,54 +143,28 @@ class MyCompany(TradingCompany):
             # --- Find closest competitor vessels ---
             competing_vessels = self.find_competing_vessels(current_trade)
             if len(competing_vessels) == 0:
-                print(f"{current_trade.origin_port.name.split('-')[0]}"
-                      f" -> {current_trade.destination_port.name.split('-')[0]}: No competing vessels found")
+                self._trace.info("%s -> %s: No competing vessels found",
+                                 current_trade.origin_port.name.split('-')[0],
+                                 current_trade.destination_port.name.split('-')[0])
             for one_company in competing_vessels:
-                distance = self.headquarters.get_network_distance(
+                distance = self._distances.distance(
                           competing_vessels[one_company].location, current_trade.origin_port)
-                print(f"{current_trade.origin_port.name.split('-')[0]}"
-                      f" -> {current_trade.destination_port.name.split('-')[0]}:"
-                      f" {one_company.name}'s {competing_vessels[one_company].name}"
-                      f" in {competing_vessels[one_company].location.name.split('-')[0]}"
-                      f" at {distance:.2f} NM")
-
-            # --- Assign the trade to our vessel ---
-            is_assigned = False
-            j = 0
-            while j < len(self._fleet) and not is_assigned:
-                current_vessel = self._fleet[j]
-                current_vessel_schedule = schedules.get(current_vessel, current_vessel.schedule)
-                new_schedule = current_vessel_schedule.copy()
-                new_schedule.add_transportation(current_trade)
-                if new_schedule.verify_schedule():
-                    schedules[current_vessel] = new_schedule
-                    scheduled_trades.append(current_trade)
-                    is_assigned = True
-                j += 1
+                if self._trace.info_enabled:
+                    self._trace.info("%s -> %s: %s's %s in %s at %.2f NM",
+                                     current_trade.origin_port.name.split('-')[0],
+                                     current_trade.destination_port.name.split('-')[0],
+                                     one_company.name, competing_vessels[one_company].name,
+                                     competing_vessels[one_company].location.name.split('-')[0],
+                                     distance)
+
             i += 1
 
-        return ScheduleProposal(schedules, scheduled_trades, {})
+        # --- Assign all trades to our vessels at once, then improve the plan within the budget ---
+        proposal = self._assigner.assign(trades, cost_function=self.predict_cost)
+        return self._search.improve(trades, proposal, self.SEARCH_BUDGET_MS, cost_function=self.predict_cost)
 
     def find_schedules(self, trades):
-        schedules = {}
-        scheduled_trades = []
-        i = 0
-        while i < len(trades):
-            current_trade = trades[i]
-            is_assigned = False
-            j = 0
-            while j < len(self._fleet) and not is_assigned:
-                current_vessel = self._fleet[j]
-                current_vessel_schedule = schedules.get(current_vessel, current_vessel.schedule)
-                new_schedule = current_vessel_schedule.copy()
-                new_schedule.add_transportation(current_trade)
-                if new_schedule.verify_schedule():
-                    schedules[current_vessel] = new_schedule
-                    scheduled_trades.append(current_trade)
-                    is_assigned = True
-                j += 1
-            i += 1
-        return ScheduleProposal(schedules, scheduled_trades, {})
+        return self._search.improve(trades, self._assigner.assign(trades), self.SEARCH_BUDGET_MS)
 
     def predict_cost(self, vessel, trade):
         total_cost = 0
@@ -168,29 +172,12 @@ class MyCompany(TradingCompany):
 
     def find_competing_vessels(self, trade):
         """
-        Returns the closest vessel from each competitor to the trade's origin port.
+        Returns, for each competitor that can reach the trade's origin within its pick-up window after
+        the work it has won so far, the vessel that gets there first.
         """
         competing_vessels = {}
-
-        for company in self.headquarters.get_companies():
-            if company is self:
-                continue  # skip our own company
-
-            closest_vessel = None
-            min_distance = float("inf")
-
-            for vessel in company.fleet:
-                distance = self.headquarters.get_network_distance(
-                    vessel.location,
-                    trade.origin_port
-                )
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_vessel = vessel
-
-            if closest_vessel:
-                competing_vessels[company] = closest_vessel
-
+        for company, (vessel, _) in self._reachability.competing(trade).items():
+            competing_vessels[company] = vessel
         return competing_vessels
 
 
@@ -1,61 +1,96 @@
 from mable.cargo_bidding import TradingCompany
 from mable.examples import environment, fleets, shipping, companies
 
+from competitor_model import ProfitFactorEstimator
+from cost_model import CostModel
+from distance_oracle import DistanceOracle
+from tracing import get_tracer
+
 
 class MyCompany(TradingCompany):
 
+    def __init__(self, fleet, name):
+        super().__init__(fleet, name)
+        self._distances = DistanceOracle(self)  # Cached port distances
+        self._cost_model = CostModel(self, self._distances)  # Batched trade x vessel costs
+        self._trace = get_tracer(name)  # Levelled tracing, per-contract messages are DEBUG
+        self._profit_factors = ProfitFactorEstimator()  # Running profit factor per competitor and route class
+        self._competitor_fleets = None  # Competitor name -> fleet, looked up once
+
+    def competitor_fleets(self):
+        # headquarters.get_companies() builds a copy of every company, so only do it once
+        if self._competitor_fleets is None:
+            self._competitor_fleets = {c.name: c.fleet for c in self.headquarters.get_companies()
+                                       if c.name != self.name}
+        return self._competitor_fleets
+
+    def expected_winning_prices(self, trades):
+        """
+        The lowest bid to expect from the competitors for each trade, from their estimated profit factors.
+
+        :return: List of (expected price, competitor name), (inf, None) if no competitor can do the trade.
+        """
+        if len(trades) == 0:
+            return []
+        competitor_costs = {name: self._cost_model.cost_matrix(trades, fleet).min(axis=1, initial=float("inf"))
+                            for name, fleet in self.competitor_fleets().items()}
+        prices = []
+        for i, trade in enumerate(trades):
+            laden_distance = self._distances.distance(trade.origin_port, trade.destination_port)
+            prices.append(self._profit_factors.expected_winning_price(
+                laden_distance, {name: float(costs[i]) for name, costs in competitor_costs.items()}))
+        return prices
+
     def inform(self, trades, *args, **kwargs):
-        # We are not bidding in this exercise
-        print("[inform] Not bidding this round.")
+        # We are not bidding in this exercise, only predicting the price it would take to win
+        if self._trace.debug_enabled:
+            for trade, (price, competitor) in zip(trades, self.expected_winning_prices(trades)):
+                self._trace.debug("  Trade %s->%s: expected winning price %.2f (%s)",
+                                  trade.origin_port, trade.destination_port, price, competitor)
+        self._trace.info("[inform] Not bidding this round.")
         return []
 
     def receive(self, contracts, auction_ledger=None, *args, **kwargs):
-        competitor_name = "Arch Enemy Ltd."
-
-        # Safely find competitor fleet
-        competitors = [c for c in self.headquarters.get_companies() if c.name == competitor_name]
-        if not competitors:
-            print(f"[receive] Competitor '{competitor_name}' not found.")
+        # The ledger only holds this auction's contracts, so every contract updates the estimates exactly once
+        if not auction_ledger:
             return
-
-        competitor_fleet = competitors.pop().fleet
-        competitor_won_contracts = auction_ledger.get(competitor_name, [])
-
-        print(f"\n[receive] Found {len(competitor_won_contracts)} contracts won by {competitor_name}.")
-
-        # Loop over each contract they won
-        for contract in competitor_won_contracts:
-            trade = contract.trade
-            payment = contract.payment
-            best_cost = float("inf")
-
-            # Try all vessels to find the one with minimum predicted cost
-            for vessel in competitor_fleet:
-                predicted_cost = self.predict_cost(vessel, trade)
-                if predicted_cost < best_cost:
-                    best_cost = predicted_cost
-
-            if best_cost > 0:
-                profit_factor = payment / best_cost
-                print(
-                    f"  Trade {trade.origin_port}->{trade.destination_port}: "
-                    f"Payment={payment:.2f}, Predicted Cost={best_cost:.2f}, "
-                    f"Estimated Profit Factor={profit_factor:.3f}"
-                )
-            else:
-                print(f"  Trade {trade.origin_port}->{trade.destination_port}: Skipped (invalid cost)")
+        competitor_fleets = self.competitor_fleets()
+
+        for competitor_name, competitor_won_contracts in auction_ledger.items():
+            if competitor_name == self.name or not competitor_won_contracts:
+                continue
+            competitor_fleet = competitor_fleets.get(competitor_name)
+            if competitor_fleet is None:
+                self._trace.warning("[receive] Competitor '%s' not found.", competitor_name)
+                continue
+
+            self._trace.info("[receive] Found %d contracts won by %s.", len(competitor_won_contracts), competitor_name)
+
+            # Cost every contract on every competitor vessel in one pass and keep the cheapest vessel
+            won_trades = [contract.trade for contract in competitor_won_contracts]
+            best_costs = self._cost_model.cost_matrix(won_trades, competitor_fleet).min(axis=1, initial=float("inf"))
+
+            for contract, best_cost in zip(competitor_won_contracts, best_costs):
+                trade = contract.trade
+                laden_distance = self._distances.distance(trade.origin_port, trade.destination_port)
+                profit_factor = self._profit_factors.update(competitor_name, laden_distance, contract.payment, best_cost)
+                if profit_factor is not None:
+                    self._trace.debug("  Trade %s->%s: Payment=%.2f, Predicted Cost=%.2f, Estimated Profit Factor=%.3f",
+                                      trade.origin_port, trade.destination_port, contract.payment, best_cost,
+                                      profit_factor)
+                else:
+                    self._trace.debug("  Trade %s->%s: Skipped (invalid cost)", trade.origin_port, trade.destination_port)
+
+            stats = self._profit_factors.stats(competitor_name)
+            if stats is not None:
+                self._trace.info("[receive] %s profit factor: mean=%.3f, std=%.3f, recent=%.3f over %d contracts",
+                                 competitor_name, stats.mean, stats.std, stats.ewma, stats.count)
+
+        self._distances.save()
 
     def predict_cost(self, vessel, trade):
         """Estimate the cost of performing a trade for a given vessel."""
-        loading_time = vessel.get_loading_time(trade.cargo_type, trade.amount)
-        loading_cost = vessel.get_loading_consumption(loading_time)
-        unloading_cost = vessel.get_unloading_consumption(loading_time)
-        travel_distance = self.headquarters.get_network_distance(trade.origin_port, trade.destination_port)
-        travel_time = vessel.get_travel_time(travel_distance)
-        travel_cost = vessel.get_laden_consumption(travel_time, vessel.speed)
-
-        total_cost = loading_cost + unloading_cost + travel_cost
-        return total_cost
+        return self._cost_model.predict_cost(vessel, trade)
 
 
 def build_specification():
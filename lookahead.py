@@ -0,0 +1,156 @@
+"""
+Joint planning of the current auction's trades and the announced future trades.
+
+pre_inform() announces the trades of the next auction. A current trade that
+is cheap on its own can still be a bad deal if it takes the vessel that a
+better future trade needs. LookaheadPlanner runs a beam search over
+"take / leave" decisions for all trades together, ordered by pick-up time:
+every state is a set of per-vessel schedules and a score of estimated profit,
+taking a trade inserts it at its cheapest feasible position (InsertionPlanner).
+Future trades count with a weight, as we may not win them.
+
+States whose score plus the best possible profit of the remaining trades
+cannot reach the best state of the level are pruned (branch and bound), and
+the cheapest insertion of a trade into a vessel's schedule is memoised, so
+states that share a schedule share its insertions. The search stops at a
+Deadline or after max_verifications schedule verifications and then reports
+that it is incomplete; an incomplete plan decides nothing.
+"""
+import math
+
+from feasibility_cache import schedule_fingerprint, trade_key
+
+
+class LookaheadResult:
+
+    def __init__(self, included, schedules, score, complete):
+        """
+        :param included: The trades taken in the best joint plan.
+        :param schedules: vessel -> schedule of the best joint plan (only vessels that changed).
+        :param score: The estimated (weighted) profit of the plan.
+        :param complete: False if the deadline stopped the search before all trades were decided.
+        """
+        self.included = included
+        self.schedules = schedules
+        self.score = score
+        self.complete = complete
+
+
+class _State:
+    __slots__ = ("score", "schedules", "included")
+
+    def __init__(self, score, schedules, included):
+        self.score = score
+        self.schedules = schedules
+        self.included = included
+
+
+def _earliest_pickup(trade):
+    time_window = getattr(trade, "time_window", None)
+    if time_window and time_window[0] is not None:
+        return time_window[0]
+    return getattr(trade, "time", 0) or 0
+
+
+class LookaheadPlanner:
+
+    def __init__(self, company, planner, beam_width=8, future_weight=0.5, max_verifications=300):
+        """
+        :param company: The company whose headquarters provides the current time.
+        :type company: TradingCompany
+        :param planner: The insertion planner that places single trades.
+        :type planner: InsertionPlanner
+        :param beam_width: The number of partial plans kept per decision.
+        :param future_weight: Weight of a future trade's profit, roughly the chance of winning it.
+        :param max_verifications: The maximum number of schedules one plan verifies.
+        """
+        self._company = company
+        self._planner = planner
+        self.beam_width = beam_width
+        self.future_weight = future_weight
+        self.max_verifications = max_verifications
+        self._memo = {}
+        self._verification_limit = 0
+        self._cut_short = False
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.expanded = 0
+
+    def _insert(self, vessel, schedule, trade, current_time, deadline):
+        key = (schedule_fingerprint(schedule, vessel, current_time), trade_key(trade))
+        if key in self._memo:
+            self.memo_hits += 1
+            return self._memo[key]
+        self.memo_misses += 1
+        if self._planner.verifications >= self._verification_limit or (deadline is not None and deadline.expired()):
+            self._cut_short = True
+            return None, None
+        _, new_schedule, cost = self._planner.plan_for_trade([vessel], trade, {vessel: schedule}, deadline)
+        if new_schedule is None and deadline is not None and deadline.expired():
+            self._cut_short = True
+            return None, None  # Not known to be infeasible, so not remembered
+        self._memo[key] = (new_schedule, cost)
+        return new_schedule, cost
+
+    def _cheapest_insertion(self, fleet, base_schedules, state, trade, current_time, deadline):
+        best_vessel, best_schedule, best_cost = None, None, math.inf
+        for vessel in fleet:
+            schedule = state.schedules.get(vessel, base_schedules[vessel])
+            new_schedule, cost = self._insert(vessel, schedule, trade, current_time, deadline)
+            if new_schedule is not None and cost < best_cost:
+                best_vessel, best_schedule, best_cost = vessel, new_schedule, cost
+        return best_vessel, best_schedule, best_cost
+
+    def plan(self, fleet, trades, future_trades, value, deadline=None):
+        """
+        Find the best joint plan for the current and the future trades.
+
+        :param fleet: The vessels.
+        :param trades: The current auction's trades.
+        :param future_trades: The announced trades of the next auction.
+        :param value: Function trade -> expected payment for the trade.
+        :param deadline: Optional Deadline for the search.
+        :type deadline: Deadline | None
+        :return: The best plan found.
+        :rtype: LookaheadResult
+        """
+        self._memo.clear()
+        self._verification_limit = self._planner.verifications + self.max_verifications
+        self._cut_short = False
+        current_time = self._company.headquarters.current_time
+        base_schedules = {vessel: vessel.schedule for vessel in fleet}
+        items = [(trade, 1.0) for trade in trades] + [(trade, self.future_weight) for trade in future_trades or []]
+        items.sort(key=lambda item: _earliest_pickup(item[0]))
+        values = [weight * value(trade) for trade, weight in items]
+        # Best profit the trades from position i onwards can still add: all of them at no cost
+        remaining_bound = [0.0] * (len(items) + 1)
+        for i in range(len(items) - 1, -1, -1):
+            remaining_bound[i] = remaining_bound[i + 1] + max(0.0, values[i])
+
+        beam = [_State(0.0, {}, ())]
+        for i, (trade, weight) in enumerate(items):
+            if self._cut_short:
+                break
+            children = []
+            for state in beam:
+                children.append(state)  # leave the trade
+                vessel, schedule, cost = self._cheapest_insertion(
+                    fleet, base_schedules, state, trade, current_time, deadline)
+                self.expanded += 1
+                if vessel is None:
+                    continue
+                gain = values[i] - weight * cost
+                if gain <= 0:
+                    continue
+                schedules = dict(state.schedules)
+                schedules[vessel] = schedule
+                children.append(_State(state.score + gain, schedules, state.included + (trade,)))
+
+            best_score = max(child.score for child in children)
+            children = [child for child in children if child.score + remaining_bound[i + 1] >= best_score]
+            children.sort(key=lambda child: child.score, reverse=True)
+            beam = children[:self.beam_width]
+
+        # A search that was cut short let states "leave" trades it never priced, so its plan proves nothing
+        best = max(beam, key=lambda state: state.score)
+        return LookaheadResult(set(best.included), best.schedules, best.score, not self._cut_short)
@@ -0,0 +1,296 @@
+"""
+Columnar index over the metrics_competition_*.json simulation outputs.
+
+Every metrics file is read once and flattened into three column tables,
+stored together in one .npz file:
+
+    outcomes   one row per won contract (run, auction, company, payment, route, trade fields, fulfilled)
+    vessels    one row per vessel (run, company, vessel, fuel, emissions and status hours, route length)
+    companies  one row per company (run, company, fuel, emissions, status hours, penalty, income, profit)
+
+Strings (company and port names, cargo types) are stored as integer codes
+into one shared string table. Ingesting is incremental: files that are
+already in the index are skipped, so only new files are parsed. Queries work
+on the NumPy columns, e.g. MetricsIndex().mean_payment_per_route().
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.path.join(_HERE, "metrics_index.npz")
+
+_STATUSES = ("ballast", "loading", "laden", "unloading", "idle")
+
+# Column name -> dtype per table. String columns hold codes into the string table.
+TABLES = {
+    "outcomes": {
+        "run": np.int32, "auction": np.int32, "company": np.int32, "payment": np.float64,
+        "origin": np.int32, "destination": np.int32, "amount": np.float64, "cargo_type": np.int32,
+        "time": np.float64, "earliest_pickup": np.float64, "latest_pickup": np.float64,
+        "earliest_drop_off": np.float64, "latest_drop_off": np.float64, "fulfilled": np.bool_,
+    },
+    "vessels": dict(
+        {"run": np.int32, "company": np.int32, "vessel": np.int32, "fuel_consumption": np.float64,
+         "co2_emissions": np.float64, "fuel_cost": np.float64, "route_length": np.int32},
+        **{f"status_{status}": np.float64 for status in _STATUSES}),
+    "companies": dict(
+        {"run": np.int32, "company": np.int32, "fuel_consumption": np.float64, "co2_emissions": np.float64,
+         "fuel_cost": np.float64, "penalty": np.float64, "contracts": np.int32, "income": np.float64,
+         "profit": np.float64},
+        **{f"status_{status}": np.float64 for status in _STATUSES}),
+}
+
+
+def _time_window(trade):
+    time_window = trade.get("time_window") or [None] * 4
+    return [np.nan if t is None else t for t in time_window]
+
+
+class MetricsIndex:
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        """
+        :param path: The .npz file of the index. It is loaded if it exists.
+        """
+        self.path = path
+        self.strings = []
+        self._codes = {}
+        # Ingested files: absolute path -> (size, mtime, run id)
+        self.runs = {}
+        self.tables = {table: {column: np.zeros(0, dtype=dtype) for column, dtype in columns.items()}
+                       for table, columns in TABLES.items()}
+        if os.path.isfile(path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            self.strings = data["strings"].tolist()
+            for name, size, mtime, run in zip(data["run_names"].tolist(), data["run_sizes"].tolist(),
+                                              data["run_mtimes"].tolist(), data["run_ids"].tolist()):
+                self.runs[name] = (size, mtime, run)
+            for table, columns in TABLES.items():
+                for column in columns:
+                    key = f"{table}/{column}"
+                    if key in data:
+                        self.tables[table][column] = data[key]
+        self._codes = {string: code for code, string in enumerate(self.strings)}
+
+    def save(self):
+        arrays = {f"{table}/{column}": values
+                  for table, columns in self.tables.items() for column, values in columns.items()}
+        names = list(self.runs)
+        arrays["strings"] = np.array(self.strings, dtype=str)
+        arrays["run_names"] = np.array(names, dtype=str)
+        arrays["run_sizes"] = np.array([self.runs[name][0] for name in names], dtype=np.int64)
+        arrays["run_mtimes"] = np.array([self.runs[name][1] for name in names], dtype=np.float64)
+        arrays["run_ids"] = np.array([self.runs[name][2] for name in names], dtype=np.int32)
+        temporary_path = f"{self.path}.tmp.npz"
+        np.savez(temporary_path, **arrays)
+        os.replace(temporary_path, self.path)
+
+    def code(self, string):
+        """
+        The integer code of a string, adding it to the string table if it is new.
+        """
+        code = self._codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(string)
+            self._codes[string] = code
+        return code
+
+    def code_of(self, string):
+        """
+        The integer code of a string or -1 if the index has never seen it.
+        """
+        return self._codes.get(string, -1)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def ingest(self, paths=None, save=True):
+        """
+        Add metrics files to the index. Files that are already indexed and unchanged are skipped.
+
+        :param paths: Metrics files or directories containing them. Default is the repository root.
+        :param save: Write the index file afterwards if anything was added.
+        :return: The number of newly ingested files.
+        :rtype: int
+        """
+        if paths is None:
+            paths = [_HERE]
+        if isinstance(paths, str):
+            paths = [paths]
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(glob.glob(os.path.join(path, "**", "metrics_competition_*.json"),
+                                              recursive=True)))
+            else:
+                files.append(path)
+
+        new_rows = {table: {column: [] for column in columns} for table, columns in TABLES.items()}
+        added = 0
+        for file_path in files:
+            # Observer ids in the file names can repeat across processes, so files are known by their full path.
+            name = os.path.abspath(file_path)
+            stat = os.stat(file_path)
+            known = self.runs.get(name)
+            if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime:
+                continue
+            if known is not None:
+                self._drop_run(known[2])
+            run = max((entry[2] for entry in self.runs.values()), default=-1) + 1
+            with open(file_path) as metrics_file:
+                metrics = json.load(metrics_file)
+            self._flatten(run, metrics, new_rows)
+            self.runs[name] = (stat.st_size, stat.st_mtime, run)
+            added += 1
+
+        if added:
+            for table, columns in TABLES.items():
+                for column, dtype in columns.items():
+                    self.tables[table][column] = np.concatenate(
+                        [self.tables[table][column], np.array(new_rows[table][column], dtype=dtype)])
+            if save:
+                self.save()
+        return added
+
+    def _drop_run(self, run):
+        for table, columns in self.tables.items():
+            keep = columns["run"] != run
+            for column in columns:
+                columns[column] = columns[column][keep]
+
+    def _flatten(self, run, metrics, rows):
+        company_names = metrics.get("company_names", {})
+        company_codes = {company_id: self.code(name) for company_id, name in company_names.items()}
+        income = dict.fromkeys(company_names, 0.0)
+        contracts = dict.fromkeys(company_names, 0)
+
+        outcomes = rows["outcomes"]
+        auction_outcomes = metrics.get("global_metrics", {}).get("auction_outcomes", [])
+        for auction, outcome in enumerate(auction_outcomes):
+            for company_id, won in outcome.items():
+                for contract in won:
+                    trade = contract["trade"]
+                    time_window = _time_window(trade)
+                    outcomes["run"].append(run)
+                    outcomes["auction"].append(auction)
+                    outcomes["company"].append(company_codes.get(company_id, self.code(company_id)))
+                    outcomes["payment"].append(contract["payment"])
+                    outcomes["origin"].append(self.code(trade["origin_port"]["name"]))
+                    outcomes["destination"].append(self.code(trade["destination_port"]["name"]))
+                    outcomes["amount"].append(trade["amount"])
+                    outcomes["cargo_type"].append(self.code(trade["cargo_type"]))
+                    outcomes["time"].append(trade.get("time", np.nan))
+                    outcomes["earliest_pickup"].append(time_window[0])
+                    outcomes["latest_pickup"].append(time_window[1])
+                    outcomes["earliest_drop_off"].append(time_window[2])
+                    outcomes["latest_drop_off"].append(time_window[3])
+                    outcomes["fulfilled"].append(bool(contract.get("fulfilled")))
+                    income[company_id] = income.get(company_id, 0.0) + contract["payment"]
+                    contracts[company_id] = contracts.get(company_id, 0) + 1
+
+        vessels = rows["vessels"]
+        for key, vessel_metrics in metrics.get("vessel_metrics", {}).items():
+            # Keys look like "(company id, vessel id)"
+            company_id, vessel_id = (part.strip() for part in key.strip("()").split(","))
+            vessels["run"].append(run)
+            vessels["company"].append(company_codes.get(company_id, self.code(company_id)))
+            vessels["vessel"].append(int(vessel_id))
+            vessels["route_length"].append(len(vessel_metrics.get("route", [])))
+            for column in ("fuel_consumption", "co2_emissions", "fuel_cost"):
+                vessels[column].append(vessel_metrics.get(column, np.nan))
+            for status in _STATUSES:
+                vessels[f"status_{status}"].append(vessel_metrics.get(f"vessel_status_{status}", np.nan))
+
+        companies = rows["companies"]
+        penalties = metrics.get("global_metrics", {}).get("penalty", {})
+        for company_id, company_metrics in metrics.get("company_metrics", {}).items():
+            penalty = penalties.get(company_id, 0) or 0
+            fuel_cost = company_metrics.get("fuel_cost", 0.0)
+            companies["run"].append(run)
+            companies["company"].append(company_codes.get(company_id, self.code(company_id)))
+            for column in ("fuel_consumption", "co2_emissions", "fuel_cost"):
+                companies[column].append(company_metrics.get(column, np.nan))
+            for status in _STATUSES:
+                companies[f"status_{status}"].append(company_metrics.get(f"vessel_status_{status}", np.nan))
+            companies["penalty"].append(penalty)
+            companies["contracts"].append(contracts.get(company_id, 0))
+            companies["income"].append(income.get(company_id, 0.0))
+            companies["profit"].append(income.get(company_id, 0.0) - fuel_cost - penalty)
+
+    def table(self, name):
+        """
+        :param name: "outcomes", "vessels" or "companies".
+        :return: Column name -> NumPy array.
+        :rtype: Dict[str, np.ndarray]
+        """
+        return self.tables[name]
+
+    def group_mean(self, table, value, by, where=None):
+        """
+        Mean of a column grouped by one or more code columns.
+
+        :param table: The table name.
+        :param value: The column to average.
+        :param by: The column or columns to group by.
+        :param where: Optional boolean mask of the rows to use.
+        :return: (group keys of shape (groups, len(by)), means, counts)
+        """
+        if isinstance(by, str):
+            by = (by,)
+        columns = self.tables[table]
+        values = columns[value].astype(np.float64)
+        keys = np.stack([columns[column].astype(np.int64) for column in by], axis=1)
+        if where is not None:
+            values = values[where]
+            keys = keys[where]
+        if len(values) == 0:
+            return np.zeros((0, len(by)), dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = np.bincount(inverse, weights=values, minlength=len(groups))
+        return groups, sums / counts, counts
+
+    def mean_payment_per_route(self, company=None):
+        """
+        Mean payment of the won contracts per (origin, destination) port pair.
+
+        :param company: Only count the contracts of this company (name). Default is all companies.
+        :return: (origin name, destination name) -> (mean payment, number of contracts)
+        :rtype: Dict[Tuple[str, str], Tuple[float, int]]
+        """
+        where = None
+        if company is not None:
+            where = self.tables["outcomes"]["company"] == self.code_of(company)
+        groups, means, counts = self.group_mean("outcomes", "payment", ("origin", "destination"), where)
+        return {(self.strings[origin], self.strings[destination]): (mean, count)
+                for (origin, destination), mean, count in zip(groups.tolist(), means.tolist(), counts.tolist())}
+
+    def company_summary(self):
+        """
+        Mean profit, income and contracts per company over all indexed runs.
+
+        :return: company name -> dict of means and the number of runs
+        """
+        groups, mean_profit, runs = self.group_mean("companies", "profit", "company")
+        _, mean_income, _ = self.group_mean("companies", "income", "company")
+        _, mean_contracts, _ = self.group_mean("companies", "contracts", "company")
+        return {self.strings[company]: {"runs": int(n), "mean_profit": float(profit),
+                                        "mean_income": float(income), "mean_contracts": float(contracts)}
+                for (company,), profit, income, contracts, n
+                in zip(groups.tolist(), mean_profit.tolist(), mean_income.tolist(), mean_contracts.tolist(),
+                       runs.tolist())}
+
+
+if __name__ == "__main__":
+    index = MetricsIndex()
+    print(f"Ingested {index.ingest()} new metrics files, {len(index)} in the index.")
+    for company_name, summary in index.company_summary().items():
+        print(f"{company_name}: {summary}")
@@ -1,22 +1,18 @@
 from mable.cargo_bidding import TradingCompany, Bid
 from mable.examples import environment, fleets
-from mable.transport_operation import ScheduleProposal
+
+from assignment import BatchAssigner
 
 
 class MyCompany(TradingCompany):
-    
+
+    def __init__(self, fleet, name):
+        super().__init__(fleet, name)
+        self._assigner = BatchAssigner(self)
+
     def propose_schedules(self, trades):
-        schedules = {}
-        scheduled_trades = []
-        for trade in trades:
-            for vessel in self._fleet:
-                new_schedule = vessel.schedule.copy()
-                new_schedule.add_transportation(trade)
-                if new_schedule.verify_schedule():
-                    schedules[vessel] = new_schedule
-                    scheduled_trades.append(trade)
-                    break
-        return ScheduleProposal(schedules, scheduled_trades, {})
+        # One matching over all trades x vessels; a vessel that takes several trades keeps them all in one schedule
+        return self._assigner.assign(trades)
     
     def inform(self, trades, *args, **kwargs):
         print(f"Received {len(trades)} trades")
@@ -0,0 +1,242 @@
+"""
+Background planning of the announced trades.
+
+pre_inform() announces the next auction's trades, but inform() for them
+comes only after the current auction's inform() and receive() and the
+simulated time in between. PlanPrecomputer plans the announced trades in a
+background thread in the meantime: the cheapest insertion over the fleet
+(InsertionPlanner.plan_trial), keyed by trade identity. inform() then takes
+the plans that are ready and only verifies them against the current
+schedules. Since the next announcement arrives before the current auction's
+inform(), the last two announcements are kept; a taken plan is forgotten.
+
+The worker runs only between the callbacks: pause() stops it (a running
+search gives up at its next candidate, as with an expired Deadline) so it
+never competes with inform() or receive() for the interpreter, and resume()
+restarts the plans that were cut short. The engine changes schedules,
+positions and the time between the callbacks. announce() and resume(),
+which run in the callbacks, take a snapshot of the fleet, copies of the
+committed schedules and the current time, and the worker plans against the
+latest snapshot with its own insertion planner and feasibility cache. That
+keeps the worker off the live schedules, but not off the live engine:
+mable's Schedule.add_transportation and verify_schedule read the engine's
+current time, the vessel's location and its hold, which the simulation
+changes while the worker runs. A background plan is therefore only a
+candidate; take() verifies it again in inform() against the current state,
+and a plan that fails is traced and counts as finding no vessel.
+
+A plan is relative to the vessel's committed schedule when it was made.
+receive() invalidates the plans of the vessels whose schedules it changed,
+and they are planned again. Vessels also finish tasks while the simulation
+runs, which removes them from the front of the schedule; take() shifts the
+insertion points of such a plan accordingly instead of dropping it. Only
+the planning time of plans that inform() took unchanged counts as hidden
+latency; a shifted plan is counted apart, since the state it was planned on
+is gone.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from feasibility_cache import FeasibilityCache, trade_key
+from insertion import InsertionPlanner
+from tracing import get_tracer
+from trial_schedule import TrialSchedule, committed_schedules, task_signature
+
+_ABORTED = object()
+
+
+class _Snapshot:
+    # The fleet as the worker plans it, taken in a callback: schedule copies and the time. It stands in for
+    # the company (and its headquarters) towards the worker's planner and feasibility cache.
+
+    def __init__(self, company, distances):
+        self.fleet = list(company.fleet)
+        self.schedules = committed_schedules(self.fleet)
+        self.current_time = company.headquarters.current_time
+        self.headquarters = self
+        self.planner = InsertionPlanner(self, distances, FeasibilityCache(self))
+
+
+class _Plan:
+    __slots__ = ("trial", "cost", "signature", "seconds")
+
+    def __init__(self, trial, cost, signature, seconds):
+        self.trial = trial
+        self.cost = cost
+        self.signature = signature  # Tasks of the vessel's committed schedule the trial refers to
+        self.seconds = seconds
+
+
+class _PauseSignal:
+    # Passed to the planner as its deadline: the search stops as soon as the worker is paused
+
+    def __init__(self, running):
+        self._running = running
+
+    def expired(self):
+        return not self._running.is_set()
+
+
+class PlanPrecomputer:
+
+    def __init__(self, company, distances, workers=1):
+        """
+        :param company: The company whose fleet is planned.
+        :type company: TradingCompany
+        :param distances: The company's distance oracle.
+        :type distances: DistanceOracle
+        :param workers: The number of background threads.
+        """
+        self._company = company
+        self._distances = distances
+        self._snapshot = None
+        self._trace = get_tracer(company.name)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="precompute")
+        self._running = threading.Event()
+        self._running.set()
+        self._signal = _PauseSignal(self._running)
+        self._lock = threading.Lock()
+        self._trades = {}  # trade key -> announced trade
+        self._announcements = deque(maxlen=2)  # trade keys of the last announcements
+        self._futures = {}  # trade key -> Future of a _Plan, None (infeasible) or _ABORTED
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.planned = 0
+        self.used = 0
+        self.rebased = 0
+        self.missed = 0
+        self.infeasible = 0
+        self.rejected = 0
+        self.hidden_seconds = 0.0
+
+    def announce(self, trades):
+        """
+        Plan the announced trades in the background. Trades of older announcements than the previous one
+        are forgotten.
+        """
+        keys = [trade_key(trade) for trade in trades]
+        with self._lock:
+            self._snapshot = _Snapshot(self._company, self._distances)
+            if len(self._announcements) == self._announcements.maxlen:
+                for key in set(self._announcements[0]).difference(self._announcements[1], keys):
+                    self._forget(key)
+            self._announcements.append(keys)
+            for key, trade in zip(keys, trades):
+                self._trades[key] = trade
+                if self._running.is_set() and key not in self._futures:
+                    self._submit(key)
+
+    def _forget(self, key):
+        self._trades.pop(key, None)
+        future = self._futures.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def _submit(self, key):
+        self._futures[key] = self._pool.submit(self._plan, self._trades[key], self._snapshot)
+
+    def _plan(self, trade, snapshot):
+        if not self._running.is_set():
+            return _ABORTED
+        start = time.perf_counter()
+        try:
+            trial, cost = snapshot.planner.plan_trial(snapshot.fleet, trade, snapshot.schedules, self._signal)
+        except Exception as e:
+            self._trace.error("[precompute] Failed to plan trade %s: %s", getattr(trade, 'id', 'unknown'), e)
+            return None
+        if trial is None:
+            return _ABORTED if not self._running.is_set() else None
+        self.planned += 1
+        return _Plan(trial, cost, trial.base_signature, time.perf_counter() - start)
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        """
+        Restart the worker and the plans that a pause cut short.
+        """
+        with self._lock:
+            self._snapshot = _Snapshot(self._company, self._distances)
+            self._running.set()
+            for key, future in list(self._futures.items()):
+                if future.done() and not future.cancelled() and future.result() is _ABORTED:
+                    self._submit(key)
+            for key in self._trades:
+                if key not in self._futures:
+                    self._submit(key)
+
+    def invalidate(self, vessels):
+        """
+        Forget the plans on vessels whose committed schedule changed, and plans that found no vessel (another
+        vessel may have become free). They are planned again on resume().
+        """
+        vessels = set(vessels)
+        with self._lock:
+            for key, future in list(self._futures.items()):
+                if not future.done():
+                    continue
+                plan = future.result() if not future.cancelled() else None
+                if plan is None or (plan is not _ABORTED and plan.trial.vessel in vessels):
+                    del self._futures[key]
+
+    def take(self, trade, committed, verify):
+        """
+        The background plan of a trade if it is ready and still applies to the current schedules.
+
+        :param committed: vessel -> the current committed schedule.
+        :param verify: Function (schedule, vessel) -> bool, the caller's feasibility check.
+        :return: (vessel, trial schedule) or (None, None).
+        """
+        with self._lock:
+            future = self._futures.get(trade_key(trade))
+            if future is not None and future.done():
+                self._forget(trade_key(trade))  # Auctioned now, so never asked for again
+        if future is None or not future.done() or future.cancelled():
+            self.missed += 1
+            return None, None
+        plan = future.result()
+        if plan is None:
+            # Planned again by the caller: a vessel may have finished enough work since for the trade to fit
+            self.infeasible += 1
+            return None, None
+        if plan is _ABORTED:
+            self.missed += 1
+            return None, None
+        vessel = plan.trial.vessel
+        trial = self._rebase(plan, committed.get(vessel))
+        if trial is None or not verify(trial.materialize(committed[vessel]), vessel):
+            self.rejected += 1
+            return None, None
+        if trial is plan.trial:
+            self.used += 1
+            self.hidden_seconds += plan.seconds
+        else:
+            self.rebased += 1
+        return vessel, trial
+
+    @staticmethod
+    def _rebase(plan, schedule):
+        # Tasks the vessel finished since the plan was made are gone from the front of the schedule
+        if schedule is None:
+            return None
+        signature = task_signature(schedule)
+        finished = len(plan.signature) - len(signature)
+        if finished < 0 or plan.signature[finished:] != signature:
+            return None
+        if finished == 0:
+            return plan.trial
+        trade, idx_pick_up, idx_drop_off = plan.trial.insertions[0]
+        insertion_points = list(schedule.get_insertion_points())
+        idx_pick_up, idx_drop_off = idx_pick_up - finished, idx_drop_off - finished
+        if not insertion_points or idx_pick_up < insertion_points[0]:
+            return None  # Planned before a task that is done by now
+        return TrialSchedule(plan.trial.vessel, ((trade, idx_pick_up, idx_drop_off),), signature)
+
+    def report(self):
+        return (f"{self.used} plans taken, {self.rebased} taken after shifting, {self.rejected} no longer valid, {self.infeasible} found no vessel, "
+                f"{self.missed} not ready, "
+                f"{self.hidden_seconds:.3f}s of planning hidden")
@@ -0,0 +1,309 @@
+"""
+Opt-in compute profiling of the agent callbacks.
+
+CallbackProfiler.attach(company) wraps the company's pre_inform, inform and
+receive and records wall time, CPU time (of the calling thread, the
+simulation runs the callbacks in worker threads) and the net number of
+allocated memory blocks of every call. Phases inside a callback are recorded
+the same way: the phases of a PhaseTimer from phase_timer(), a
+`with profiler.phase(name):` block, or every call of a method wrapped with
+instrument(), e.g. the schedule verification.
+
+Profiling is off unless the environment variable AGENT_PROFILE is set:
+"on" records the numbers, "cprofile" also runs every callback under cProfile
+and keeps the profile of the slowest call of each callback. When it is off,
+attach() changes nothing and phase_timer() hands out a plain PhaseTimer.
+
+After every receive() the totals are added to the company's entry in the
+simulation's metrics (keys compute_<callback>_..., so they end up in the
+metrics_competition_*.json file with the fuel and vessel status numbers) and
+a summary with per-callback and per-phase statistics is written to
+agent_profile_<company>.json in the simulation's output directory, with the
+cProfile captures next to it.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from anytime import PhaseTimer
+
+CALLBACKS = ("pre_inform", "inform", "receive")
+
+
+def _profile_mode_from_env():
+    value = os.environ.get("AGENT_PROFILE", "").lower()
+    if value in ("", "0", "off", "false", "no"):
+        return None
+    return "cprofile" if value == "cprofile" else "on"
+
+
+class _Usage:
+    __slots__ = ("wall", "cpu", "blocks")
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.blocks = sys.getallocatedblocks()
+
+    def since(self):
+        """
+        :return: (wall seconds, CPU seconds, net allocated blocks) since the usage was taken.
+        """
+        return (time.perf_counter() - self.wall, time.thread_time() - self.cpu,
+                sys.getallocatedblocks() - self.blocks)
+
+
+class CallStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.cpu_time = 0.0
+        self.allocated_blocks = 0
+        self.wall_times = []
+        self.peak_kib = None
+
+    def add(self, wall, cpu, blocks):
+        self.calls += 1
+        self.cpu_time += cpu
+        self.allocated_blocks += blocks
+        self.wall_times.append(wall)
+
+    @property
+    def wall_time(self):
+        return sum(self.wall_times)
+
+    def to_json(self):
+        summary = {"calls": self.calls, "wall_time": self.wall_time, "cpu_time": self.cpu_time,
+                   "allocated_blocks": self.allocated_blocks}
+        if self.wall_times:
+            p50, p95 = np.percentile(self.wall_times, [50, 95]).tolist()
+            summary.update(wall_p50=p50, wall_p95=p95, wall_max=max(self.wall_times))
+        if self.peak_kib is not None:
+            summary["peak_kib"] = self.peak_kib
+        return summary
+
+
+class ProfiledPhaseTimer(PhaseTimer):
+    """
+    A PhaseTimer that also reports its phases to a CallbackProfiler.
+    """
+
+    def __init__(self, profiler):
+        super().__init__()
+        self._profiler = profiler
+        self._usage = None
+
+    def start(self, phase):
+        super().start(phase)
+        self._usage = _Usage()
+
+    def _close(self, now):
+        if self._phase is not None and self._usage is not None:
+            self._profiler.record_phase(self._phase, *self._usage.since())
+            self._usage = None
+        super()._close(now)
+
+
+class CallbackProfiler:
+
+    def __init__(self, company, mode=None, output_directory=None):
+        """
+        Use attach() to profile a company.
+
+        :param company: The profiled company.
+        :param mode: None (off), "on" or "cprofile" (also keep a cProfile of the slowest call per callback).
+        :param output_directory: Where the summary is written. Default is the simulation's output directory.
+        """
+        self._company = company
+        self.mode = mode
+        self._output_directory = output_directory
+        self.callbacks = {}
+        self.phases = {}
+        self._slowest = {}  # callback -> (wall time, cProfile.Profile)
+        self._exported = {}  # metric key -> value already added to the simulation's metrics
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    @classmethod
+    def attach(cls, company, mode="env", output_directory=None):
+        """
+        Profile the callbacks of a company if profiling is enabled.
+
+        :param company: The company, usually self in __init__.
+        :param mode: "env" to read AGENT_PROFILE, otherwise see __init__.
+        :rtype: CallbackProfiler
+        """
+        profiler = cls(company, _profile_mode_from_env() if mode == "env" else mode, output_directory)
+        if profiler.enabled:
+            for callback in CALLBACKS:
+                method = getattr(company, callback, None)
+                if method is not None:
+                    setattr(company, callback, profiler._wrap_callback(callback, method))
+        return profiler
+
+    def _wrap_callback(self, callback, method):
+        def profiled(*args, **kwargs):
+            with self.callback(callback):
+                return method(*args, **kwargs)
+        profiled.__wrapped__ = method
+        return profiled
+
+    @contextmanager
+    def callback(self, callback):
+        """
+        Record one call of a callback. Called by the wrappers of attach().
+        """
+        profile = None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler is active in this thread
+                profile = None
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        usage = _Usage()
+        try:
+            yield
+        finally:
+            wall, cpu, blocks = usage.since()
+            if profile is not None:
+                profile.disable()
+            stats = self.callbacks.setdefault(callback, CallStats())
+            stats.add(wall, cpu, blocks)
+            if tracing:
+                peak_kib = (tracemalloc.get_traced_memory()[1] - memory_start) / 1024
+                stats.peak_kib = max(stats.peak_kib or 0.0, peak_kib)
+            if profile is not None and wall > self._slowest.get(callback, (-1.0, None))[0]:
+                self._slowest[callback] = (wall, profile)
+            if callback == "receive":
+                self.export()
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Record a block as a phase: `with profiler.phase("costing"): ...`. Does nothing when profiling is off.
+        """
+        if not self.enabled:
+            yield
+            return
+        usage = _Usage()
+        try:
+            yield
+        finally:
+            self.record_phase(phase, *usage.since())
+
+    def record_phase(self, phase, wall, cpu, blocks):
+        self.phases.setdefault(phase, CallStats()).add(wall, cpu, blocks)
+
+    def phase_timer(self):
+        """
+        :return: A PhaseTimer whose phases are recorded, a plain one when profiling is off.
+        :rtype: PhaseTimer
+        """
+        return ProfiledPhaseTimer(self) if self.enabled else PhaseTimer()
+
+    def instrument(self, owner, method_name, phase):
+        """
+        Record every call of owner.method_name as the phase, e.g. instrument(feasibility, "verify",
+        "verification"). Nested calls of a phase are counted by the outermost call. Does nothing when
+        profiling is off.
+        """
+        if not self.enabled:
+            return
+        method = getattr(owner, method_name)
+        depth = [0]
+
+        def instrumented(*args, **kwargs):
+            if depth[0]:
+                return method(*args, **kwargs)
+            depth[0] += 1
+            usage = _Usage()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                depth[0] -= 1
+                self.record_phase(phase, *usage.since())
+        instrumented.__wrapped__ = method
+        setattr(owner, method_name, instrumented)
+
+    def summary(self):
+        """
+        :return: The per-callback and per-phase statistics as a JSON-able dict.
+        """
+        return {
+            "company": getattr(self._company, "name", None),
+            "mode": self.mode,
+            "callbacks": {callback: stats.to_json() for callback, stats in self.callbacks.items()},
+            "phases": {phase: stats.to_json() for phase, stats in self.phases.items()},
+            "slowest": {callback: wall for callback, (wall, _) in self._slowest.items()},
+        }
+
+    def _engine(self):
+        return getattr(self._company, "_engine", None)
+
+    def _metrics(self):
+        engine = self._engine()
+        observers = getattr(engine, "get_event_observers", None)
+        if observers is None:
+            return None
+        for observer in observers():
+            metrics = getattr(observer, "metrics", None)
+            if hasattr(metrics, "add_company_numeric_metric"):
+                return metrics
+        return None
+
+    def _export_metrics(self):
+        # The simulation's metrics only add up, so the growth since the last export is added
+        metrics = self._metrics()
+        if metrics is None:
+            return
+        try:
+            # Not before the simulation knows the company, a new id would not get the company's name
+            metrics.get_company_id(self._company, create_id_if_not_exists=False)
+        except (KeyError, TypeError):
+            return
+        for callback, stats in self.callbacks.items():
+            for key, value in (("calls", stats.calls), ("wall_time", stats.wall_time), ("cpu_time", stats.cpu_time),
+                               ("allocated_blocks", stats.allocated_blocks)):
+                metric = f"compute_{callback}_{key}"
+                metrics.add_company_numeric_metric(self._company, metric, value - self._exported.get(metric, 0))
+                self._exported[metric] = value
+
+    def export(self, output_directory=None):
+        """
+        Add the totals to the simulation's company metrics and write the summary and the cProfile captures.
+
+        :param output_directory: Overrides the output directory.
+        :return: The path of the summary or None if nothing was recorded.
+        """
+        if not self.callbacks:
+            return None
+        self._export_metrics()
+        output_directory = (output_directory or self._output_directory
+                            or getattr(self._engine(), "output_directory", None) or ".")
+        file_stem = "agent_profile_" + re.sub(r"[^\w.-]+", "_", str(getattr(self._company, "name", "company")))
+        summary = self.summary()
+        summary["profiles"] = {}
+        try:
+            for callback, (_, profile) in self._slowest.items():
+                profile_path = os.path.join(output_directory, f"{file_stem}_{callback}.prof")
+                profile.dump_stats(profile_path)
+                summary["profiles"][callback] = os.path.basename(profile_path)
+            summary_path = os.path.join(output_directory, f"{file_stem}.json")
+            with open(summary_path, "w") as summary_file:
+                json.dump(summary, summary_file, indent=4)
+        except OSError:
+            return None
+        return summary_path
@@ -0,0 +1,219 @@
+"""
+Which competitors can actually serve a trade.
+
+The closest competitor vessel is not necessarily a competitor: it may be
+busy with its own schedule until long after the trade's pick-up window
+closes, or too small for the cargo. CompetitorReachability is rebuilt once
+per auction and computes the earliest arrival of every competitor vessel at
+every trade origin of the round as one vessels x trades matrix: a vessel
+starts where and when its committed schedule ends and sails to the origin at
+its speed (from the vessel's timeline if a TimelineIndex is given, see
+vessel_timeline.py). A vessel can compete for a trade if it can carry the cargo and
+arrives before the latest pick-up. Sea routes are never shorter than the
+great circle (spatial_index.py), so the exact network distance is only
+computed for the (start, origin) pairs of vessels that could make the
+pick-up at great-circle distance; the other arrivals are left at inf, as
+they cannot compete anyway. Per-company minima and the list of
+competing companies are reduced from the matrix once, so the pricing code
+looks them up per trade in O(1).
+"""
+import math
+
+import numpy as np
+
+from mable.simulation_space.universe import OnJourney
+
+from distance_oracle import DEFAULT_PORTS_PATH
+from feasibility_cache import trade_key
+from spatial_index import great_circle_matrix, load_port_positions
+
+# The great circle is scaled down a little, so differences in the earth radius never rule out a vessel
+_GREAT_CIRCLE_SLACK = 0.99
+
+
+def vessel_availability(vessel, current_time, distances=None):
+    """
+    Where and when a vessel is done with its committed work.
+
+    :param distances: The distance oracle, for the rest of a journey the vessel is on. Without it the vessel
+        counts as arrived at the journey's destination now.
+    :return: (location, time)
+    """
+    location = vessel.location
+    try:
+        schedule = vessel.schedule
+    except AttributeError:
+        schedule = None
+    if schedule is not None and len(schedule) > 0:
+        location_type, trade = schedule.get_simple_schedule()[-1]
+        location = trade.origin_port if location_type == "PICK_UP" else trade.destination_port
+        return location, max(current_time, schedule.completion_time())
+    if isinstance(location, OnJourney):
+        # Arrives at its destination without anything else to do, after sailing the rest of the journey
+        if distances is None:
+            return location.destination, current_time
+        hours_per_mile = vessel.get_travel_time(1.0)
+        sailed = (current_time - getattr(location, "start_time", current_time)) / hours_per_mile
+        remaining = max(0.0, distances.distance(location.origin, location.destination) - sailed)
+        return location.destination, current_time + remaining * hours_per_mile
+    return location, current_time
+
+
+def _latest_pickup(trade):
+    clean_window = getattr(trade, "clean_window", None)
+    if clean_window is None:
+        return math.inf
+    return clean_window()[1]
+
+
+def _can_carry(vessel, trade):
+    try:
+        return trade.amount <= vessel.capacity(trade.cargo_type)
+    except (KeyError, AttributeError):
+        return False
+
+
+class CompetitorReachability:
+
+    def __init__(self, distances, ports_path=DEFAULT_PORTS_PATH):
+        """
+        :param distances: The distance oracle.
+        :type distances: DistanceOracle
+        :param ports_path: The ports file with the port positions for the great-circle bound.
+        """
+        self._distances = distances
+        self._positions = load_port_positions(ports_path)
+        self.exact_lookups = 0
+        self.companies = []
+        self.vessels = []
+        self.arrival = np.zeros((0, 0))  # vessels x trades, inf where the vessel cannot compete for the trade
+        self.company_arrival = np.zeros((0, 0))  # companies x trades
+        self.reachable = np.zeros((0, 0), dtype=bool)  # companies x trades
+        self._columns = {}
+        self._earliest = []  # per trade: company -> (vessel, arrival) for the companies that can compete
+        self._rows = {}
+
+    def rebuild(self, companies, trades, current_time, timelines=None):
+        """
+        Compute the arrival matrix for an auction. Call once per auction.
+
+        :param companies: The competing companies.
+        :param trades: The trades of the auction.
+        :param current_time: The current simulation time.
+        :param timelines: Optional TimelineIndex with the companies' vessels, for the work that their
+            schedules do not show.
+        """
+        trades = list(trades)
+        self.companies = list(companies)
+        self._rows = {company: row for row, company in enumerate(self.companies)}
+        self._columns = {trade_key(trade): column for column, trade in enumerate(trades)}
+        self.vessels = []
+        owners = []
+        starts = []
+        ready_times = []
+        hours_per_mile = []
+        for row, company in enumerate(self.companies):
+            for vessel in getattr(company, "fleet", []):
+                if timelines is None:
+                    location, ready_time = vessel_availability(vessel, current_time, self._distances)
+                else:
+                    location, ready_time = timelines.availability(company, vessel, current_time)
+                self.vessels.append(vessel)
+                owners.append(row)
+                starts.append(location)
+                ready_times.append(ready_time)
+                hours_per_mile.append(vessel.get_travel_time(1.0))
+        owners = np.array(owners, dtype=int)
+
+        # Distances only for the distinct (start, origin) ports, then spread over the matrix
+        start_keys = [self._port_key(location) for location in starts]
+        origin_keys = [self._port_key(trade.origin_port) for trade in trades]
+        distinct_starts = {key: i for i, key in enumerate(dict.fromkeys(start_keys))}
+        distinct_origins = {key: j for j, key in enumerate(dict.fromkeys(origin_keys))}
+        start_of, origin_of = {}, {}
+        for location, key in zip(starts, start_keys):
+            start_of.setdefault(key, location)
+        for trade, key in zip(trades, origin_keys):
+            origin_of.setdefault(key, trade.origin_port)
+        start_index = np.array([distinct_starts[key] for key in start_keys], dtype=int)
+        origin_index = np.array([distinct_origins[key] for key in origin_keys], dtype=int)
+        ready_times = np.array(ready_times, dtype=float)
+        hours_per_mile = np.array(hours_per_mile, dtype=float)
+        latest_pickups = np.array([_latest_pickup(trade) for trade in trades], dtype=float)
+
+        # Vessels that cannot make the pick-up even along the great circle are ruled out without exact distances
+        lower_bounds = _GREAT_CIRCLE_SLACK * great_circle_matrix(
+            [start_of[key] for key in distinct_starts], [origin_of[key] for key in distinct_origins],
+            self._positions).reshape(len(distinct_starts), len(distinct_origins))
+        can_carry = np.array([[_can_carry(vessel, trade) for trade in trades] for vessel in self.vessels],
+                             dtype=bool).reshape(len(self.vessels), len(trades))
+        candidates = can_carry & (ready_times[:, None] + lower_bounds[start_index[:, None], origin_index[None, :]]
+                                  * hours_per_mile[:, None] <= latest_pickups[None, :])
+        distances = np.full((len(distinct_starts), len(distinct_origins)), np.inf)
+        vessel_rows, trade_columns = np.nonzero(candidates)
+        start_keys_list, origin_keys_list = list(distinct_starts), list(distinct_origins)
+        for i, j in set(zip(start_index[vessel_rows].tolist(), origin_index[trade_columns].tolist())):
+            distances[i, j] = self._distances.distance(start_of[start_keys_list[i]], origin_of[origin_keys_list[j]])
+            self.exact_lookups += 1
+        distances = distances[start_index[:, None], origin_index[None, :]]
+
+        arrival = ready_times[:, None] + distances * hours_per_mile[:, None]
+        self.arrival = np.where(candidates, arrival, np.inf)
+
+        # Per company: the earliest arriving vessel for every trade
+        self.company_arrival = np.full((len(self.companies), len(trades)), np.inf)
+        fastest = np.full((len(self.companies), len(trades)), -1, dtype=int)
+        for row in range(len(self.companies)):
+            members = np.nonzero(owners == row)[0]
+            if len(members) == 0:
+                continue
+            best = np.argmin(self.arrival[members], axis=0)
+            fastest[row] = members[best]
+            self.company_arrival[row] = self.arrival[members[best], np.arange(len(trades))]
+        self.reachable = self.company_arrival <= latest_pickups[None, :]
+
+        self._earliest = []
+        for column in range(len(trades)):
+            rows = np.nonzero(self.reachable[:, column])[0]
+            rows = rows[np.argsort(self.company_arrival[rows, column], kind="stable")]
+            self._earliest.append({self.companies[row]: (self.vessels[fastest[row, column]],
+                                                         float(self.company_arrival[row, column]))
+                                   for row in rows})
+
+    def _port_key(self, location):
+        index = self._distances.index_of(location)
+        if index is not None:
+            return index
+        if isinstance(location, OnJourney):
+            return id(location)
+        return location if isinstance(location, str) else getattr(location, "name", id(location))
+
+    def _column(self, trade):
+        return self._columns.get(trade_key(trade))
+
+    def competing(self, trade):
+        """
+        The companies that can reach the trade's origin in time, earliest first.
+
+        :return: company -> (earliest arriving vessel, arrival time). Empty for a trade of another auction.
+        :rtype: Dict[TradingCompany, Tuple[Vessel, float]]
+        """
+        column = self._column(trade)
+        return {} if column is None else self._earliest[column]
+
+    def competitor_count(self, trade):
+        return len(self.competing(trade))
+
+    def earliest_arrival(self, trade, company=None):
+        """
+        :param company: The company or None for the earliest of all competitors.
+        :return: The earliest arrival at the trade's origin, inf if no vessel can carry the cargo and make the
+            pick-up in time or the trade is not of this auction.
+        """
+        column = self._column(trade)
+        if column is None:
+            return math.inf
+        if company is None:
+            return float(self.company_arrival[:, column].min(initial=math.inf))
+        row = self._rows.get(company)
+        return math.inf if row is None else float(self.company_arrival[row, column])
@@ -0,0 +1,264 @@
+"""
+Regret insertion and large neighbourhood search over the whole fleet.
+
+Inserting trades one after the other, cheapest vessel first, gives the easy
+trades the good slots and leaves the trades with few options to whatever is
+left. Regret insertion inserts next the trade that would lose most by
+waiting: the one with the largest difference between its cheapest and its
+second cheapest vessel. The result is then improved with destroy and repair
+steps (large neighbourhood search): a few trades are taken out (at random,
+the most expensive ones, or a group of nearby ones), the vessels that lost
+them are rebuilt and the trades are put back by regret insertion. A step is
+kept only if it schedules more trades or the same trades cheaper.
+
+The search starts from a given proposal (e.g. the BatchAssigner's) and only
+replaces it with a strictly better plan, so it is never worse than that
+proposal. It stops when its millisecond budget runs out or after max_stall
+destroy and repair steps in a row that found nothing better, and it is
+skipped when at most one trade is assigned. The cheapest
+insertion of a trade into a vessel's schedule is memoised by the schedule's
+fingerprint, so vessels that a step did not touch cost nothing to re-price.
+"""
+import math
+import random
+
+from mable.transport_operation import ScheduleProposal
+
+from anytime import Deadline
+from feasibility_cache import schedule_fingerprint, trade_key
+
+
+class _Solution:
+    __slots__ = ("schedules", "routes", "costs", "unassigned", "cost")
+
+    def __init__(self, schedules, routes, costs, unassigned, cost):
+        self.schedules = schedules  # vessel -> schedule, only vessels with new trades
+        self.routes = routes  # vessel -> new trades in insertion order
+        self.costs = costs  # trade -> estimated cost
+        self.unassigned = unassigned
+        self.cost = cost
+
+    @property
+    def scheduled(self):
+        return sum(len(route) for route in self.routes.values())
+
+    def better_than(self, other):
+        if self.scheduled != other.scheduled:
+            return self.scheduled > other.scheduled
+        return self.cost < other.cost - 1e-9
+
+
+class RegretSearch:
+
+    def __init__(self, company, planner, max_removed=3, seed=0, max_stall=50):
+        """
+        :param company: The company whose fleet is planned.
+        :type company: TradingCompany
+        :param planner: The insertion planner that prices and verifies single insertions.
+        :type planner: InsertionPlanner
+        :param max_removed: The maximum number of trades taken out by one destroy step.
+        :param seed: Seed of the random choices of the destroy steps.
+        :param max_stall: The search stops after this many steps in a row without a better plan.
+        """
+        self._company = company
+        self._planner = planner
+        self.max_removed = max_removed
+        self.max_stall = max_stall
+        self._random = random.Random(seed)
+        self._memo = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.iterations = 0
+        self.improvements = 0
+
+    def _insert(self, vessel, schedule, trade, current_time, deadline):
+        key = (schedule_fingerprint(schedule, vessel, current_time), trade_key(trade))
+        if key in self._memo:
+            self.memo_hits += 1
+            return self._memo[key]
+        self.memo_misses += 1
+        _, new_schedule, cost = self._planner.plan_for_trade([vessel], trade, {vessel: schedule}, deadline)
+        if new_schedule is None and deadline.expired():
+            return None, None  # Not known to be infeasible, so not remembered
+        self._memo[key] = (new_schedule, cost)
+        return new_schedule, cost
+
+    def _total_cost(self, schedules, routes, base_costs, extra_cost):
+        total = 0.0
+        for vessel, route in routes.items():
+            total += self._planner.route_cost(vessel, schedules[vessel]) - base_costs[vessel]
+            if extra_cost is not None:
+                total += sum(extra_cost(vessel, trade) for trade in route)
+        return total
+
+    def _repair(self, fleet, base, schedules, routes, costs, pending, context):
+        """
+        Regret insertion of the pending trades into the given (partial) plan.
+
+        :return: The completed solution or None if the deadline expired.
+        """
+        current_time, deadline, extra_cost, base_costs = context
+        schedules, routes, costs = dict(schedules), {v: list(r) for v, r in routes.items()}, dict(costs)
+        pending = list(pending)
+        unassigned = []
+        while pending:
+            choice = None
+            infeasible = []
+            for i, trade in enumerate(pending):
+                options = []
+                for vessel in fleet:
+                    new_schedule, cost = self._insert(
+                        vessel, schedules.get(vessel, base[vessel]), trade, current_time, deadline)
+                    if new_schedule is not None:
+                        if extra_cost is not None:
+                            cost += extra_cost(vessel, trade)
+                        options.append((cost, vessel, new_schedule))
+                if deadline.expired():
+                    return None
+                if not options:
+                    infeasible.append(i)  # Schedules only fill up, so the trade will not fit later either
+                    continue
+                options.sort(key=lambda option: option[0])
+                regret = options[1][0] - options[0][0] if len(options) > 1 else math.inf
+                if choice is None or (regret, -options[0][0]) > (choice[0], -choice[2][0]):
+                    choice = (regret, i, options[0])
+            unassigned.extend(pending[i] for i in infeasible)
+            if choice is None:
+                break
+            _, chosen, (cost, vessel, new_schedule) = choice
+            trade = pending[chosen]
+            schedules[vessel] = new_schedule
+            routes.setdefault(vessel, []).append(trade)
+            costs[trade] = cost
+            pending = [t for i, t in enumerate(pending) if i != chosen and i not in infeasible]
+        return _Solution(schedules, routes, costs, unassigned,
+                         self._total_cost(schedules, routes, base_costs, extra_cost))
+
+    def _removal_gain(self, vessel, schedule, trade, extra_cost):
+        gain = self._planner.route_cost(vessel, schedule) - self._planner.route_cost(vessel, schedule, trade)
+        if extra_cost is not None:
+            gain += extra_cost(vessel, trade)
+        return gain
+
+    def _destroy(self, solution, extra_cost):
+        assigned = [(vessel, trade) for vessel, route in solution.routes.items() for trade in route]
+        count = self._random.randint(1, min(self.max_removed, len(assigned)))
+        operator = self._random.randrange(3)
+        if operator == 0:  # Random trades
+            return [trade for _, trade in self._random.sample(assigned, count)]
+        if operator == 1:  # The trades whose removal saves most, with some noise to vary the choice
+            gains = [(self._removal_gain(vessel, solution.schedules[vessel], trade, extra_cost)
+                      * self._random.uniform(0.8, 1.2), i) for i, (vessel, trade) in enumerate(assigned)]
+            gains.sort(reverse=True)
+            return [assigned[i][1] for _, i in gains[:count]]
+        # Related trades: a random trade and the trades with the closest origins and destinations
+        _, seed_trade = self._random.choice(assigned)
+
+        def relatedness(trade):
+            return (self._planner.distance(seed_trade.origin_port, trade.origin_port)
+                    + self._planner.distance(seed_trade.destination_port, trade.destination_port))
+        others = sorted((trade for _, trade in assigned if trade is not seed_trade), key=relatedness)
+        return [seed_trade] + others[:count - 1]
+
+    def _neighbour(self, fleet, base, solution, context):
+        current_time, deadline, extra_cost, _ = context
+        removed = self._destroy(solution, extra_cost)
+        removed_ids = {id(trade) for trade in removed}
+        schedules, routes = dict(solution.schedules), dict(solution.routes)
+        costs = {trade: cost for trade, cost in solution.costs.items() if id(trade) not in removed_ids}
+        pending = list(removed)
+        # Vessels that lost a trade are rebuilt from their committed schedule with the trades they keep
+        for vessel, route in solution.routes.items():
+            if not any(id(trade) in removed_ids for trade in route):
+                continue
+            schedule = base[vessel]
+            kept = []
+            for trade in route:
+                if id(trade) in removed_ids:
+                    continue
+                new_schedule, cost = self._insert(vessel, schedule, trade, current_time, deadline)
+                if new_schedule is None:
+                    if deadline.expired():
+                        return None
+                    pending.append(trade)
+                    continue
+                schedule = new_schedule
+                kept.append(trade)
+            if kept:
+                schedules[vessel], routes[vessel] = schedule, kept
+            else:
+                schedules.pop(vessel, None)
+                routes.pop(vessel, None)
+        return self._repair(fleet, base, schedules, routes, costs, pending + solution.unassigned, context)
+
+    def _from_proposal(self, proposal, trades, base_costs, extra_cost):
+        routes = {}
+        for trade in proposal.scheduled_trades:
+            for vessel, schedule in proposal.schedules.items():
+                if any(task_trade is trade for _, task_trade in schedule.get_simple_schedule()):
+                    routes.setdefault(vessel, []).append(trade)
+                    break
+        scheduled = {id(trade) for route in routes.values() for trade in route}
+        schedules = {vessel: proposal.schedules[vessel] for vessel in routes}
+        costs = {trade: proposal.costs.get(trade, 0.0) for route in routes.values() for trade in route}
+        unassigned = [trade for trade in trades if id(trade) not in scheduled]
+        return _Solution(schedules, routes, costs, unassigned,
+                         self._total_cost(schedules, routes, base_costs, extra_cost))
+
+    def improve(self, trades, initial=None, budget_ms=500, fleet=None, extra_cost=None, cost_function=None):
+        """
+        Plan the trades by regret insertion and improve the plan until the budget runs out.
+
+        :param trades: The trades to schedule.
+        :param initial: The proposal to improve on, e.g. BatchAssigner.assign(trades). It is returned
+            unchanged unless a plan with more trades or a lower estimated cost is found.
+        :type initial: ScheduleProposal | None
+        :param budget_ms: The time budget of the search in milliseconds.
+        :param fleet: The vessels. Default is the company's fleet.
+        :param extra_cost: Optional function (vessel, trade) -> cost added to the insertion cost.
+        :param cost_function: Function (vessel, trade) -> cost reported in the proposal.
+            Default is the estimated insertion cost.
+        :return: The best plan found.
+        :rtype: ScheduleProposal
+        """
+        deadline = Deadline(budget_ms / 1000)
+        fleet = list(self._company.fleet if fleet is None else fleet)
+        self._memo.clear()
+        current_time = self._company.headquarters.current_time
+        base = {vessel: vessel.schedule for vessel in fleet}
+        base_costs = {vessel: self._planner.route_cost(vessel, schedule) for vessel, schedule in base.items()}
+        context = (current_time, deadline, extra_cost, base_costs)
+
+        best = start = None
+        if initial is not None:
+            best = start = self._from_proposal(initial, trades, base_costs, extra_cost)
+        constructed = self._repair(fleet, base, {}, {}, {}, trades, context)
+        if constructed is not None and (best is None or constructed.better_than(best)):
+            best = constructed
+        if best is None:
+            return ScheduleProposal({}, [], {})
+
+        # With one trade or none assigned, taking trades out and putting them back cannot change anything
+        current = best
+        stalled = 0
+        while best.scheduled > 1 and stalled < self.max_stall and not deadline.expired():
+            self.iterations += 1
+            candidate = self._neighbour(fleet, base, current, context)
+            if candidate is None:
+                break
+            stalled += 1
+            if candidate.better_than(current):
+                current = candidate
+                stalled = 0
+                if current.better_than(best):
+                    best = current
+                    self.improvements += 1
+
+        if best is start:
+            return initial
+        scheduled_trades = [trade for route in best.routes.values() for trade in route]
+        if cost_function is None:
+            costs = {trade: best.costs[trade] for trade in scheduled_trades}
+        else:
+            costs = {trade: cost_function(vessel, trade) for vessel, route in best.routes.items() for trade in route}
+        return ScheduleProposal(dict(best.schedules), scheduled_trades, costs)
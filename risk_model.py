@@ -0,0 +1,274 @@
+"""
+Risk-aware trade costs from the spread of the transit times.
+
+A cost estimate with fixed travel times hides how often a plan runs late.
+time_transition_distribution.csv gives a mean and a standard deviation of the
+transit time per route; their ratio (coefficient of variation) is used to
+draw travel times around the vessel's own travel time: every leg takes
+travel time x a log-normal factor with mean 1 and the route's variation.
+Routes without a record use the mean variation of all routes.
+
+A candidate is a trade done by a vessel after the work it has committed to:
+ballast to the origin, wait for the pick-up window, load, sail laden, wait for
+the drop-off window and unload. For all candidates of trades x vessels, the
+samples are drawn in one NumPy batch (split into chunks to bound the memory)
+and give the expected cost, the probability of missing a time window and a
+quantile of the cost for pricing a bid. All candidates use the same standard
+normal draws (common random numbers), so differences between candidates are
+not sampling noise and the estimates are reproducible.
+"""
+import math
+import weakref
+
+import numpy as np
+
+from mable.simulation_space.universe import OnJourney
+
+from distance_oracle import DistanceOracle
+from transition_table import TransitionTable
+
+
+class RiskEstimate:
+
+    def __init__(self, expected_cost, miss_probability, quantile_cost):
+        """
+        Arrays of shape (trades, vessels).
+
+        :param expected_cost: Mean fuel cost over the samples, inf if the vessel cannot do the trade.
+        :param miss_probability: Share of the samples that miss the pick-up or the drop-off window.
+        :param quantile_cost: The cost quantile for pricing.
+        """
+        self.expected_cost = expected_cost
+        self.miss_probability = miss_probability
+        self.quantile_cost = quantile_cost
+
+
+def _lognormal_parameters(variation):
+    # Log-normal factor with mean 1 and the given coefficient of variation
+    sigma = np.sqrt(np.log1p(np.square(variation)))
+    return -sigma ** 2 / 2, sigma
+
+
+class RiskModel:
+
+    def __init__(self, company, distances=None, transitions=None, samples=2000, quantile=0.9, miss_penalty=0.0,
+                 seed=0, chunk_elements=250_000):
+        """
+        :param company: The company whose headquarters provides the current time.
+        :type company: TradingCompany
+        :param distances: The distance oracle to use. A new one is created if None.
+        :type distances: DistanceOracle | None
+        :param transitions: The transit time table. Loaded from the default file if None.
+        :type transitions: TransitionTable | None
+        :param samples: Travel time samples per candidate.
+        :param quantile: The cost quantile returned for pricing, e.g. 0.9.
+        :param miss_penalty: Cost added to a sample that misses a time window.
+        :param seed: Seed of the standard normal draws.
+        :param chunk_elements: Candidates x samples computed at once.
+        """
+        self._company = company
+        if distances is None:
+            distances = DistanceOracle(company)
+        self._distances = distances
+        if transitions is None:
+            transitions = TransitionTable.load()
+        self._transitions = transitions
+        self.quantile = quantile
+        self.miss_penalty = miss_penalty
+        self._chunk_elements = chunk_elements
+        # Standard normal draws of the ballast and the laden leg, shared by all candidates
+        self._normal = np.random.default_rng(seed).standard_normal((2, samples))
+
+        # Coefficient of variation per transit time record; a single observation (inf) gets the mean
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variation = transitions.std / transitions.mean
+        known = np.isfinite(variation)
+        self.default_variation = float(variation[known].mean()) if known.any() else 0.0
+        self._variation = np.where(known, variation, self.default_variation)
+        # (ballast, laden, idle, handling consumption per hour, hours per nautical mile, fuel price) per vessel
+        self._rates = weakref.WeakKeyDictionary()
+
+    @property
+    def samples(self):
+        return self._normal.shape[1]
+
+    def route_variation(self, origins, destinations):
+        """
+        :param origins: Ports or port names.
+        :param destinations: Ports or port names, as many as origins.
+        :return: The coefficient of variation of the transit time of every route.
+        :rtype: np.ndarray
+        """
+        ids = [(self._transitions.id_of(self._port(origin)), self._transitions.id_of(self._port(destination)))
+               for origin, destination in zip(origins, destinations)]
+        known = np.array([i is not None and j is not None for i, j in ids], dtype=bool)
+        variation = np.full(len(ids), self.default_variation)
+        if known.any():
+            from_ids = np.array([i for (i, _), ok in zip(ids, known) if ok])
+            to_ids = np.array([j for (_, j), ok in zip(ids, known) if ok])
+            positions = self._transitions.positions(from_ids, to_ids)
+            variation[known] = np.where(positions >= 0, self._variation[positions], self.default_variation)
+        same = np.array([self._port(origin) == self._port(destination)
+                         for origin, destination in zip(origins, destinations)], dtype=bool)
+        variation[same] = 0.0
+        return variation
+
+    @staticmethod
+    def _port(location):
+        # A vessel on a journey is placed at its destination
+        if isinstance(location, OnJourney):
+            location = location.destination
+        return location if isinstance(location, str) else getattr(location, "name", location)
+
+    def _vessel_rates(self, vessel):
+        rates = self._rates.get(vessel)
+        if rates is None:
+            speed = vessel.speed
+            rates = (vessel.get_ballast_consumption(1.0, speed), vessel.get_laden_consumption(1.0, speed),
+                     vessel.get_idle_consumption(1.0),
+                     vessel.get_loading_consumption(1.0) + vessel.get_unloading_consumption(1.0),
+                     vessel.get_travel_time(1.0), vessel.get_cost(1.0))
+            self._rates[vessel] = rates
+        return rates
+
+    def availability(self, vessel, schedule=None):
+        """
+        Where and when a vessel is done with its committed work.
+
+        :param schedule: The vessel's schedule. Default is its current one.
+        :return: (location, time)
+        """
+        current_time = self._company.headquarters.current_time
+        if schedule is None:
+            schedule = vessel.schedule
+        if len(schedule) == 0:
+            location = vessel.location
+            return (location.destination if isinstance(location, OnJourney) else location), current_time
+        location_type, trade = schedule.get_simple_schedule()[-1]
+        location = trade.origin_port if location_type == "PICK_UP" else trade.destination_port
+        return location, max(current_time, schedule.completion_time())
+
+    @staticmethod
+    def _handling_hours(vessel, trade):
+        try:
+            if trade.amount > vessel.capacity(trade.cargo_type):
+                return math.inf
+            return vessel.get_loading_time(trade.cargo_type, trade.amount)
+        except (KeyError, AttributeError, ZeroDivisionError):
+            return math.inf
+
+    @staticmethod
+    def _time_window(trade):
+        # Earliest pick-up, latest pick-up, earliest drop-off and latest drop-off, with 0 and inf for open ends
+        clean_window = getattr(trade, "clean_window", None)
+        if clean_window is None:
+            return [0, math.inf, 0, math.inf]
+        return clean_window()
+
+    def estimate(self, trades, fleet, availability=None, samples=None):
+        """
+        Sample the cost of every trade on every vessel.
+
+        :param trades: The trades (rows).
+        :param fleet: The vessels (columns).
+        :param availability: Optional vessel -> (location, time) where the vessel starts, e.g. from
+            availability(vessel, committed schedule). Default is the vessel's position now.
+        :param samples: Use only this many of the samples, to bound the time for large batches.
+        :rtype: RiskEstimate
+        """
+        n_trades, n_vessels = len(trades), len(fleet)
+        if n_trades == 0 or n_vessels == 0:
+            empty = np.zeros((n_trades, n_vessels))
+            return RiskEstimate(empty, empty.copy(), empty.copy())
+        current_time = self._company.headquarters.current_time
+        starts = []
+        for vessel in fleet:
+            if availability is not None and vessel in availability:
+                starts.append(availability[vessel])
+            else:
+                location = vessel.location
+                starts.append((location.destination if isinstance(location, OnJourney) else location, current_time))
+        rates = np.array([self._vessel_rates(vessel) for vessel in fleet], dtype=float)
+        ballast_rate, laden_rate, idle_rate, handling_rate, hours_per_mile, fuel_price = rates.T
+        start_times = np.array([time for _, time in starts], dtype=float)
+
+        ballast_distance = np.array([[self._distances.distance(location, trade.origin_port)
+                                      for location, _ in starts] for trade in trades], dtype=float)
+        laden_distance = np.array([self._distances.distance(trade.origin_port, trade.destination_port)
+                                   for trade in trades], dtype=float)
+        ballast_hours = ballast_distance * hours_per_mile[None, :]
+        laden_hours = laden_distance[:, None] * hours_per_mile[None, :]
+        handling_hours = np.array([[self._handling_hours(vessel, trade) for vessel in fleet] for trade in trades],
+                                  dtype=float)
+        ballast_variation = self.route_variation(
+            [location for _ in trades for location, _ in starts], [trade.origin_port for trade in trades for _ in fleet]
+        ).reshape(n_trades, n_vessels)
+        laden_variation = self.route_variation([trade.origin_port for trade in trades],
+                                               [trade.destination_port for trade in trades])
+        windows = np.array([self._time_window(trade) for trade in trades], dtype=float)
+
+        # One row per candidate
+        candidate = {
+            "start": np.broadcast_to(start_times[None, :], (n_trades, n_vessels)).ravel(),
+            "ballast_hours": ballast_hours.ravel(),
+            "laden_hours": laden_hours.ravel(),
+            "handling_hours": handling_hours.ravel(),
+            "ballast_variation": ballast_variation.ravel(),
+            "laden_variation": np.repeat(laden_variation, n_vessels),
+            "ballast_rate": np.tile(ballast_rate, n_trades),
+            "laden_rate": np.tile(laden_rate, n_trades),
+            "idle_rate": np.tile(idle_rate, n_trades),
+            "handling_rate": np.tile(handling_rate, n_trades),
+            "fuel_price": np.tile(fuel_price, n_trades),
+            "windows": np.repeat(windows, n_vessels, axis=0),
+        }
+        expected = np.empty(n_trades * n_vessels)
+        missed = np.empty(n_trades * n_vessels)
+        quantile = np.empty(n_trades * n_vessels)
+        feasible = np.isfinite(candidate["ballast_hours"] + candidate["laden_hours"] + candidate["handling_hours"])
+        expected[~feasible] = math.inf
+        missed[~feasible] = 1.0
+        quantile[~feasible] = math.inf
+        rows = np.flatnonzero(feasible)
+        normal = self._normal if samples is None else self._normal[:, :max(1, samples)]
+        chunk = max(1, self._chunk_elements // normal.shape[1])
+        for first in range(0, len(rows), chunk):
+            part = rows[first:first + chunk]
+            expected[part], missed[part], quantile[part] = self._sample(
+                {key: values[part] for key, values in candidate.items()}, normal)
+        shape = (n_trades, n_vessels)
+        return RiskEstimate(expected.reshape(shape), missed.reshape(shape), quantile.reshape(shape))
+
+    def _sample(self, candidate, normal):
+        # Arrays of shape (candidates, samples)
+        ballast_mu, ballast_sigma = _lognormal_parameters(candidate["ballast_variation"])
+        laden_mu, laden_sigma = _lognormal_parameters(candidate["laden_variation"])
+        ballast = candidate["ballast_hours"][:, None] * np.exp(
+            ballast_mu[:, None] + ballast_sigma[:, None] * normal[0][None, :])
+        laden = candidate["laden_hours"][:, None] * np.exp(
+            laden_mu[:, None] + laden_sigma[:, None] * normal[1][None, :])
+        handling = candidate["handling_hours"][:, None]
+        earliest_pick_up, latest_pick_up, earliest_drop_off, latest_drop_off = (
+            candidate["windows"][:, k][:, None] for k in range(4))
+
+        arrival_origin = candidate["start"][:, None] + ballast
+        start_loading = np.maximum(arrival_origin, earliest_pick_up)
+        arrival_destination = start_loading + handling + laden
+        start_unloading = np.maximum(arrival_destination, earliest_drop_off)
+        waiting = (start_loading - arrival_origin) + (start_unloading - arrival_destination)
+        missed = (arrival_origin > latest_pick_up) | (arrival_destination > latest_drop_off)
+
+        consumption = (candidate["ballast_rate"][:, None] * ballast + candidate["laden_rate"][:, None] * laden
+                       + candidate["idle_rate"][:, None] * waiting + candidate["handling_rate"][:, None] * handling)
+        costs = candidate["fuel_price"][:, None] * consumption
+        if self.miss_penalty:
+            costs = costs + self.miss_penalty * missed
+        return costs.mean(axis=1), missed.mean(axis=1), np.quantile(costs, self.quantile, axis=1)
+
+    def estimate_one(self, vessel, trade, availability=None):
+        """
+        :return: (expected cost, miss probability, quantile cost) of one trade on one vessel.
+        """
+        estimate = self.estimate([trade], [vessel], availability)
+        return (float(estimate.expected_cost[0, 0]), float(estimate.miss_probability[0, 0]),
+                float(estimate.quantile_cost[0, 0]))
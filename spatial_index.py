@@ -0,0 +1,92 @@
+"""
+Great-circle lower bounds of sea distances.
+
+Positions are taken from the port objects or from the latitude/longitude in
+ports.csv and put on the unit sphere, where the straight-line (chord)
+distance orders points the same way as the great-circle distance. Sea routes
+are never shorter than the great circle, so great_circle_matrix() bounds the
+exact network distances of many pairs at once from below and the exact
+distance is only needed for the pairs the bound cannot rule out (see
+reachability.py).
+"""
+import csv
+
+import numpy as np
+
+from mable.simulation_space.universe import OnJourney
+
+from distance_oracle import DEFAULT_PORTS_PATH
+
+EARTH_RADIUS_NM = 3440.065
+
+_PORT_POSITIONS = {}
+
+
+def load_port_positions(path=DEFAULT_PORTS_PATH):
+    """
+    :return: Port name -> (latitude, longitude) from ports.csv.
+    :rtype: Dict[str, Tuple[float, float]]
+    """
+    if path not in _PORT_POSITIONS:
+        positions = {}
+        with open(path, newline="") as ports_file:
+            reader = csv.reader(ports_file)
+            next(reader)
+            for row in reader:
+                if row:
+                    positions[row[0].strip()] = (float(row[1]), float(row[2]))
+        _PORT_POSITIONS[path] = positions
+    return _PORT_POSITIONS[path]
+
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Positions in degrees as points on the unit sphere, shape (n, 3).
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+    cos_latitudes = np.cos(latitudes)
+    return np.stack([cos_latitudes * np.cos(longitudes), cos_latitudes * np.sin(longitudes), np.sin(latitudes)],
+                    axis=-1)
+
+
+def chord_to_nautical_miles(chord):
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def port_position(location, positions):
+    """
+    :param location: A port, port name or journey (placed at its destination, where its next task starts).
+    :param positions: Port name -> (latitude, longitude), see load_port_positions.
+    :return: (latitude, longitude) or None if the position is not known.
+    """
+    if isinstance(location, OnJourney):
+        location = location.destination
+    latitude = getattr(location, "latitude", None)
+    longitude = getattr(location, "longitude", None)
+    if latitude is None or longitude is None:
+        name = location if isinstance(location, str) else getattr(location, "name", None)
+        latitude, longitude = positions.get(name, (None, None))
+    if latitude is None:
+        return None
+    return latitude, longitude
+
+
+def great_circle_matrix(locations_one, locations_two, positions):
+    """
+    Great-circle distances in nautical miles between two lists of locations, 0 where a position is unknown
+    (so it stays a lower bound).
+
+    :return: Array of shape (len(locations_one), len(locations_two)).
+    """
+    def points(locations):
+        known = [port_position(location, positions) for location in locations]
+        mask = np.array([position is not None for position in known], dtype=bool)
+        latitudes = [position[0] if position is not None else 0.0 for position in known]
+        longitudes = [position[1] if position is not None else 0.0 for position in known]
+        return unit_vectors(latitudes, longitudes).reshape(-1, 3), mask
+
+    points_one, known_one = points(locations_one)
+    points_two, known_two = points(locations_two)
+    chords = np.linalg.norm(points_one[:, None, :] - points_two[None, :, :], axis=-1)
+    return np.where(known_one[:, None] & known_two[None, :], chord_to_nautical_miles(chords), 0.0)
@@ -0,0 +1,143 @@
+"""
+Levelled tracing for the agents' hot loops.
+
+Messages use %-style arguments and are only formatted when they are actually
+printed or dumped, and the level is checked before anything else happens. For
+the innermost loops the boolean flags (tracer.debug_enabled, ...) can be
+checked directly so not even the call is paid when tracing is off.
+
+Besides printing, a tracer can record messages in a ring buffer. The buffer
+keeps the unformatted messages of the last N calls and is dumped when an
+error is traced, which gives the context of a failure without printing it all
+the time.
+
+The levels can be set per run with the environment variables AGENT_TRACE
+(printed messages, default "info") and AGENT_TRACE_BUFFER (recorded messages,
+default "off"), e.g. AGENT_TRACE=warning AGENT_TRACE_BUFFER=debug.
+"""
+import os
+import sys
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+_LEVEL_NAMES = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": OFF}
+
+_TRACERS = {}
+
+
+def _level_from_env(variable, default):
+    return _LEVEL_NAMES.get(os.environ.get(variable, "").lower(), default)
+
+
+class Tracer:
+
+    def __init__(self, name, level=INFO, buffer_level=OFF, buffer_size=1000, stream=None):
+        """
+        :param name: Prefix of the printed messages, e.g. the agent name.
+        :param level: Messages at or above this level are printed.
+        :param buffer_level: Messages at or above this level are recorded in the ring buffer.
+        :param buffer_size: The number of messages kept in the ring buffer.
+        :param stream: Where messages are printed. Default is stdout.
+        """
+        self.name = name
+        self._stream = stream
+        self._buffer = deque(maxlen=buffer_size)
+        self._level = level
+        self._buffer_level = buffer_level
+        self._update_flags()
+
+    def _update_flags(self):
+        threshold = min(self._level, self._buffer_level)
+        self.debug_enabled = threshold <= DEBUG
+        self.info_enabled = threshold <= INFO
+        self.warning_enabled = threshold <= WARNING
+        self._threshold = threshold
+
+    def set_levels(self, level=None, buffer_level=None):
+        if level is not None:
+            self._level = level
+        if buffer_level is not None:
+            self._buffer_level = buffer_level
+        self._update_flags()
+
+    def is_enabled(self, level):
+        return level >= self._threshold
+
+    def log(self, level, message, *args):
+        if level < self._threshold:
+            return
+        if level >= self._buffer_level:
+            self._buffer.append((time.time(), level, message, args))
+        if level >= self._level:
+            print(self._format(level, message, args), file=self._stream or sys.stdout)
+
+    def debug(self, message, *args):
+        if self.debug_enabled:
+            self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        if self.info_enabled:
+            self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        if self.warning_enabled:
+            self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        """
+        Trace an error and dump the ring buffer that led up to it.
+        """
+        self.log(ERROR, message, *args)
+        if self._buffer:
+            self.dump()
+
+    def _format(self, level, message, args):
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        return f"[{self.name}] {message}"
+
+    def recent(self):
+        """
+        :return: The formatted messages in the ring buffer, oldest first.
+        :rtype: List[str]
+        """
+        return [self._format(level, message, args) for _, level, message, args in self._buffer]
+
+    def dump(self, stream=None, clear=True):
+        """
+        Print the ring buffer.
+
+        :param stream: Where to print. Default is the tracer's stream.
+        :param clear: Empty the buffer after dumping.
+        """
+        stream = stream or self._stream or sys.stdout
+        print(f"[{self.name}] --- last {len(self._buffer)} trace messages ---", file=stream)
+        for line in self.recent():
+            print(line, file=stream)
+        if clear:
+            self._buffer.clear()
+
+
+def get_tracer(name):
+    """
+    The tracer for a name, created on first use with the levels from the environment.
+
+    :param name: The tracer name.
+    :rtype: Tracer
+    """
+    tracer = _TRACERS.get(name)
+    if tracer is None:
+        tracer = Tracer(name,
+                        level=_level_from_env("AGENT_TRACE", INFO),
+                        buffer_level=_level_from_env("AGENT_TRACE_BUFFER", OFF))
+        _TRACERS[name] = tracer
+    return tracer
@@ -0,0 +1,251 @@
+"""
+Synthetic trades sampled from the port distribution files.
+
+Follows the cargo generation of the simulation (DistributionShipping): the
+origin is drawn by the ports' supply counts, the destination by the demand
+counts of the ports that have a transit time record with the origin, the
+amount is the smaller of a supply and a demand draw from gamma distributions
+fitted to the ports' cargo weights, and the time windows come from a normal
+draw of the transit time. Where the simulation samples one trade at a time,
+TradeGenerator draws whole batches with NumPy and rejects the invalid draws
+as a mask, so tens of thousands of trades per auction take milliseconds.
+
+The files are read once into arrays indexed by the ports.csv port index
+(ports that are not in ports.csv cannot be sailed to and are left out).
+Sampling is reproducible for a seed, and auction_trades() returns the trades
+in the form that environment.get_specification_builder takes as fixed_trades.
+"""
+import csv
+import os
+
+import numpy as np
+
+from mable.shipping_market import TimeWindowTrade
+
+from distance_oracle import DEFAULT_PORTS_PATH, load_port_names
+from transition_table import DEFAULT_TIME_TRANSITION_PATH, TransitionTable
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CARGO_WEIGHT_PATH = os.path.join(_HERE, "port_cargo_weight_distribution.csv")
+DEFAULT_FREQUENCY_PATH = os.path.join(_HERE, "port_trade_frequency_distribution.csv")
+
+# As in the simulation: port (un)loading rates in tonnes per day and the time window allowance in days
+PORT_LOADING_RATE = 50000
+PORT_UNLOADING_RATE = 70000
+TIME_WINDOW_ALLOWANCE = 5
+MIN_CARGO_WEIGHT = 1
+
+
+def _read_rows(path):
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader)
+        return [row for row in reader if row]
+
+
+def outlier_mask(means, stds, stds_around_mean=5):
+    """
+    The records the simulation keeps: mean and (finite) standard deviation within stds_around_mean standard
+    deviations of the column means. An infinite standard deviation marks a record with one data point.
+
+    :return: Boolean mask of the records to keep.
+    """
+    means = np.asarray(means, dtype=float)
+    stds = np.asarray(stds, dtype=float)
+    finite_means = means[np.isfinite(means)]
+    finite_stds = stds[np.isfinite(stds)]
+    mean_ok = np.abs(means - finite_means.mean()) <= finite_means.std(ddof=1) * stds_around_mean
+    std_ok = np.isinf(stds) | (np.abs(stds - finite_stds.mean()) <= finite_stds.std(ddof=1) * stds_around_mean)
+    return mean_ok & std_ok
+
+
+class TradeDistributions:
+
+    def __init__(self, cargo_weight_path=DEFAULT_CARGO_WEIGHT_PATH, frequency_path=DEFAULT_FREQUENCY_PATH,
+                 time_transition_path=DEFAULT_TIME_TRANSITION_PATH, ports_path=DEFAULT_PORTS_PATH):
+        """
+        :param cargo_weight_path: Mean and standard deviation of the cargo weight per port and supply/demand.
+        :param frequency_path: The number of trades per port and supply/demand.
+        :param time_transition_path: Mean and standard deviation of the transit time (minutes) between ports.
+        :param ports_path: The ports file that defines the port indices.
+        """
+        self.port_names = load_port_names(ports_path)
+        self.port_index = {name: i for i, name in enumerate(self.port_names)}
+        size = len(self.port_names)
+
+        # Cargo weights, NaN where a port has no (or only an outlier) record
+        rows = [row for row in _read_rows(cargo_weight_path) if row[0] in self.port_index]
+        means = np.array([float(row[2]) for row in rows])
+        stds = np.array([float(row[3]) for row in rows])
+        keep = outlier_mask(means, stds)
+        stds = np.where(np.isinf(stds), stds[keep & np.isfinite(stds)].mean(), stds)
+        self.weight_mean = {"Supply": np.full(size, np.nan), "Demand": np.full(size, np.nan)}
+        self.weight_std = {"Supply": np.full(size, np.nan), "Demand": np.full(size, np.nan)}
+        for row, mean, std, kept in zip(rows, means, stds, keep):
+            if kept:
+                self.weight_mean[row[1]][self.port_index[row[0]]] = mean
+                self.weight_std[row[1]][self.port_index[row[0]]] = std
+
+        # Trade counts
+        self.frequency = {"Supply": np.zeros(size), "Demand": np.zeros(size)}
+        for port, supply_demand, samples in _read_rows(frequency_path):
+            if port in self.port_index:
+                self.frequency[supply_demand][self.port_index[port]] = float(samples)
+
+        # Transit times between ports of ports.csv (ids below size), looked up in both directions
+        sources, targets, means, stds = TransitionTable.load(time_transition_path, ports_path).records()
+        in_ports = (sources < size) & (targets < size)
+        sources, targets, means, stds = sources[in_ports], targets[in_ports], means[in_ports], stds[in_ports]
+        keep = outlier_mask(means, stds)
+        stds = np.where(np.isinf(stds), stds[keep & np.isfinite(stds)].mean(), stds)
+        self.transition_mean = np.full((size, size), np.nan)
+        self.transition_std = np.full((size, size), np.nan)
+        self.transition_mean[sources[keep], targets[keep]] = means[keep]
+        self.transition_std[sources[keep], targets[keep]] = stds[keep]
+        one_way = np.isnan(self.transition_mean)
+        self.transition_mean[one_way] = self.transition_mean.T[one_way]
+        self.transition_std[one_way] = self.transition_std.T[one_way]
+        self._build_sampling_tables()
+
+    def _build_sampling_tables(self):
+        # Destinations of every origin in one flat array (CSR layout). The cumulative demand weights are
+        # normalised per origin and offset by the origin's row number, so that a single searchsorted over
+        # the flat array samples the destinations of a whole batch of origins.
+        linked = ~np.isnan(self.transition_mean) & (self.frequency["Demand"] > 0)[None, :]
+        origin_ok = (self.frequency["Supply"] > 0) & linked.any(axis=1)
+        self.origins = np.flatnonzero(origin_ok)
+        self.origin_probabilities = self.frequency["Supply"][self.origins] / self.frequency["Supply"][self.origins].sum()
+        destinations = []
+        offsets = []
+        for row, origin in enumerate(self.origins):
+            targets = np.flatnonzero(linked[origin])
+            weights = np.cumsum(self.frequency["Demand"][targets])
+            destinations.append(targets)
+            offsets.append(row + weights / weights[-1])
+        self._destinations = np.concatenate(destinations) if destinations else np.zeros(0, dtype=int)
+        self._cumulative = np.concatenate(offsets) if offsets else np.zeros(0)
+        self._row_start = np.concatenate([[0], np.cumsum([len(targets) for targets in destinations])]).astype(int)
+
+    def sample_destinations(self, origin_rows, random):
+        """
+        :param origin_rows: Rows in self.origins of the sampled origins.
+        :param random: The numpy Generator.
+        :return: Port indices of the destinations.
+        """
+        positions = np.searchsorted(self._cumulative, origin_rows + random.random(len(origin_rows)), side="right")
+        # Guard against rounding at the end of a row
+        positions = np.clip(positions, self._row_start[origin_rows], self._row_start[origin_rows + 1] - 1)
+        return self._destinations[positions]
+
+
+class TradeGenerator:
+
+    def __init__(self, distributions=None, seed=None):
+        """
+        :param distributions: The loaded distributions. Loaded from the default files if None.
+        :type distributions: TradeDistributions | None
+        :param seed: Seed of the generator's random numbers.
+        """
+        if distributions is None:
+            distributions = TradeDistributions()
+        self.distributions = distributions
+        self._random = np.random.default_rng(seed)
+
+    def _gamma(self, means, stds):
+        # Gamma distribution with the given mean and standard deviation, a zero deviation gives the mean
+        deterministic = ~(stds > 0)
+        safe_stds = np.where(deterministic, 1.0, stds)
+        scale = safe_stds ** 2 / means
+        return np.where(deterministic, means, self._random.gamma(means / scale, scale))
+
+    def _draw(self, number, pickup_period):
+        distributions = self.distributions
+        random = self._random
+        rows = random.choice(len(distributions.origins), size=number, p=distributions.origin_probabilities)
+        origins = distributions.origins[rows]
+        destinations = distributions.sample_destinations(rows, random)
+        supply = self._gamma(distributions.weight_mean["Supply"][origins], distributions.weight_std["Supply"][origins])
+        demand = self._gamma(distributions.weight_mean["Demand"][destinations],
+                             distributions.weight_std["Demand"][destinations])
+        amounts = np.minimum(supply, demand)
+        valid = (origins != destinations) & (amounts > MIN_CARGO_WEIGHT)  # NaN amounts (no weight record) fail too
+
+        # Time windows in days, as the simulation computes them
+        transit = np.trunc(random.normal(distributions.transition_mean[origins, destinations],
+                                         distributions.transition_std[origins, destinations]) / (24 * 60))
+        amounts_or_zero = np.where(valid, amounts, 0)
+        loading_time = np.trunc(amounts_or_zero / PORT_LOADING_RATE)
+        unloading_time = np.trunc(amounts_or_zero / PORT_UNLOADING_RATE)
+        period_start, period_end = pickup_period
+        low = np.floor(period_start)
+        high = np.maximum(np.floor(period_end - TIME_WINDOW_ALLOWANCE - loading_time), low + 1)
+        pickup_time = np.floor(low + random.random(number) * (high - low))
+        origin_earliest = np.maximum(0, pickup_time - TIME_WINDOW_ALLOWANCE)
+        origin_latest = np.minimum(origin_earliest + 2 * TIME_WINDOW_ALLOWANCE, period_end)
+        destination_earliest = origin_earliest + transit + unloading_time
+        destination_latest = destination_earliest + 2 * TIME_WINDOW_ALLOWANCE
+        time_windows = np.stack([origin_earliest, origin_latest, destination_earliest, destination_latest], axis=1) * 24
+        return origins[valid], destinations[valid], amounts[valid], time_windows[valid]
+
+    def sample(self, number, time=0, trade_occurrence_frequency=30, pickup_period=None):
+        """
+        Sample the trades of one auction as arrays.
+
+        :param number: The number of trades.
+        :param time: The auction time in hours.
+        :param trade_occurrence_frequency: Days between auctions, the trades are picked up before the next one.
+        :param pickup_period: (start, end) in days in which the trades are picked up.
+            Default is the period from this auction to the next.
+        :return: (origin port indices, destination port indices, amounts, time windows in hours of shape (number, 4))
+        """
+        if pickup_period is None:
+            frequency = trade_occurrence_frequency * 24
+            pickup_period = (time / 24, (time + frequency - 1) / 24)
+        parts = []
+        missing = number
+        while missing > 0:
+            # A few draws are rejected, so draw a little more than needed
+            drawn = self._draw(int(missing * 1.1) + 16, pickup_period)
+            parts.append(tuple(array[:missing] for array in drawn))
+            missing -= len(parts[-1][0])
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(4))
+
+    def trades(self, number, time=0, trade_occurrence_frequency=30, pickup_period=None):
+        """
+        Sample the trades of one auction. See sample.
+
+        :return: The trades, with port names as origin and destination.
+        :rtype: List[TimeWindowTrade]
+        """
+        port_names = self.distributions.port_names
+        origins, destinations, amounts, time_windows = self.sample(
+            number, time, trade_occurrence_frequency, pickup_period)
+        return [TimeWindowTrade(origin_port=port_names[origin], destination_port=port_names[destination],
+                                amount=amount, cargo_type="Oil", time=time, time_window=time_window)
+                for origin, destination, amount, time_window
+                in zip(origins.tolist(), destinations.tolist(), amounts.tolist(), time_windows.tolist())]
+
+    def auction_trades(self, trades_per_occurrence, num_auctions=2, trade_occurrence_frequency=30):
+        """
+        The trades of all auctions of a simulation, for get_specification_builder(fixed_trades=...).
+        Auctions are held at the same times as with the simulation's own cargo generation.
+
+        :param trades_per_occurrence: The number of trades per auction.
+        :param num_auctions: The number of auctions.
+        :param trade_occurrence_frequency: Days between auctions.
+        :rtype: List[TimeWindowTrade]
+        """
+        frequency = trade_occurrence_frequency * 24
+        trades = []
+        for time in range(0, num_auctions * frequency + 1, frequency):
+            trades.extend(self.trades(trades_per_occurrence, time, trade_occurrence_frequency))
+        return trades
+
+
+if __name__ == "__main__":
+    import time as timer
+    generator = TradeGenerator(seed=0)
+    start = timer.perf_counter()
+    sampled = generator.sample(50000)
+    print(f"Sampled {len(sampled[0])} trades in {timer.perf_counter() - start:.3f}s, "
+          f"mean amount {sampled[2].mean():.0f}")
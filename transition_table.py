@@ -0,0 +1,213 @@
+"""
+Indexed transit time distributions from time_transition_distribution.csv.
+
+Port names become integer ids: the ports of ports.csv keep their index there
+(the same ids as DistanceOracle), ports that only appear in the transitions
+file are numbered after them. The From -> To records are kept as a sparse
+matrix in CSR layout (row pointers, column ids, mean and standard deviation
+per record) plus a dense table of record positions, so a lookup by ids is a
+single array access and whole arrays of port pairs are looked up at once.
+
+Parsing the CSV is the slow part, so the compiled arrays are written to an
+.npz file next to it. The cache remembers the modification time and size of
+both source files and is rebuilt when either changes.
+"""
+import csv
+import os
+
+import numpy as np
+
+from distance_oracle import DEFAULT_PORTS_PATH, load_port_names
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TIME_TRANSITION_PATH = os.path.join(_HERE, "time_transition_distribution.csv")
+
+# Loaded tables by (csv path, ports path, cache path), checked against the files' state on every lookup
+_TABLES = {}
+
+
+def default_cache_path(path):
+    return os.path.splitext(path)[0] + ".npz"
+
+
+def _file_state(path):
+    status = os.stat(path)
+    return np.array([status.st_mtime_ns, status.st_size], dtype=np.int64)
+
+
+class TransitionTable:
+
+    def __init__(self, names, indptr, indices, mean, std):
+        """
+        Use TransitionTable.load to read the file.
+
+        :param names: Port names by id.
+        :param indptr: CSR row pointers, the records from port i are indptr[i]:indptr[i + 1].
+        :param indices: CSR column ids, the destination of each record.
+        :param mean: Mean transit time (minutes) of each record.
+        :param std: Standard deviation of the transit time of each record, inf for a single observation.
+        """
+        self.names = list(names)
+        self.port_index = {name: i for i, name in enumerate(self.names)}
+        self.indptr = indptr
+        self.indices = indices
+        self.mean = mean
+        self.std = std
+        size = len(self.names)
+        self.sources = np.repeat(np.arange(size), np.diff(indptr))
+        # Position of the record of every (From, To) pair, -1 where there is none
+        self._position = np.full((size, size), -1, dtype=np.int32)
+        self._position[self.sources, indices] = np.arange(len(indices), dtype=np.int32)
+
+    @classmethod
+    def load(cls, path=DEFAULT_TIME_TRANSITION_PATH, ports_path=DEFAULT_PORTS_PATH, cache_path="default"):
+        """
+        Load the table from the compiled cache, or parse the CSV and write the cache if it is missing or stale.
+        Tables are shared within the process.
+
+        :param path: The transitions file.
+        :param ports_path: The ports file that defines the port ids.
+        :param cache_path: The compiled cache. "default" puts it next to the CSV, None disables it.
+        :rtype: TransitionTable
+        """
+        if cache_path == "default":
+            cache_path = default_cache_path(path)
+        state = np.concatenate([_file_state(path), _file_state(ports_path)])
+        key = (path, ports_path, cache_path)
+        loaded = _TABLES.get(key)
+        if loaded is not None and np.array_equal(loaded[0], state):
+            return loaded[1]
+        table = cls._read_cache(cache_path, state) if cache_path is not None else None
+        if table is None:
+            table = cls.parse(path, ports_path)
+            if cache_path is not None:
+                table.save(cache_path, state)
+        _TABLES[key] = (state, table)
+        return table
+
+    @classmethod
+    def parse(cls, path=DEFAULT_TIME_TRANSITION_PATH, ports_path=DEFAULT_PORTS_PATH):
+        """
+        Build the table from the CSV, without the cache.
+
+        :rtype: TransitionTable
+        """
+        names = list(load_port_names(ports_path))
+        port_index = {name: i for i, name in enumerate(names)}
+        sources, targets, means, stds = [], [], [], []
+        with open(path, newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            for row in reader:
+                if not row:
+                    continue
+                for name in row[:2]:
+                    if name not in port_index:
+                        port_index[name] = len(names)
+                        names.append(name)
+                sources.append(port_index[row[0]])
+                targets.append(port_index[row[1]])
+                means.append(float(row[2]))
+                stds.append(float(row[3]))
+        sources = np.array(sources, dtype=np.int32)
+        targets = np.array(targets, dtype=np.int32)
+        # Sorted by (From, To); of repeated pairs the first record is kept
+        order = np.lexsort((np.arange(len(sources)), targets, sources))
+        sources, targets = sources[order], targets[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        order, sources, targets = order[first], sources[first], targets[first]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(names)))]).astype(np.int32)
+        return cls(names, indptr, targets, np.array(means)[order], np.array(stds)[order])
+
+    @classmethod
+    def _read_cache(cls, cache_path, state):
+        try:
+            with np.load(cache_path) as cached:
+                if not np.array_equal(cached["state"], state):
+                    return None
+                return cls(cached["names"].tolist(), cached["indptr"], cached["indices"], cached["mean"],
+                           cached["std"])
+        except (OSError, ValueError, KeyError):
+            return None  # Missing or unreadable cache
+
+    def save(self, cache_path, state):
+        """
+        Write the compiled cache. Written under a temporary name and moved into place, so a process never
+        reads a half-written file.
+
+        :param state: The state of the source files the cache is valid for.
+        """
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(temporary_path, state=state, names=np.array(self.names), indptr=self.indptr,
+                     indices=self.indices, mean=self.mean, std=self.std)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            pass  # A read-only checkout just parses the CSV every time
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def size(self):
+        return len(self.names)
+
+    def id_of(self, location):
+        """
+        :param location: A port or a port name.
+        :return: The port id or None if the port is not known.
+        """
+        name = location if isinstance(location, str) else getattr(location, "name", None)
+        return self.port_index.get(name)
+
+    def positions(self, from_ids, to_ids, symmetric=True):
+        """
+        Record positions of port id pairs, -1 where there is no record.
+
+        :param symmetric: Use the record of the opposite direction if a pair has none, as the simulation does.
+        """
+        positions = self._position[from_ids, to_ids]
+        if symmetric:
+            positions = np.where(positions < 0, self._position[to_ids, from_ids], positions)
+        return positions
+
+    def lookup(self, from_ids, to_ids, symmetric=True):
+        """
+        Transit time distributions of port id pairs, scalars or arrays.
+
+        :return: (mean, standard deviation) in minutes, NaN where there is no record.
+        """
+        positions = self.positions(from_ids, to_ids, symmetric)
+        found = positions >= 0
+        mean = np.where(found, self.mean[positions], np.nan)
+        std = np.where(found, self.std[positions], np.nan)
+        if np.ndim(mean) == 0:
+            return float(mean), float(std)
+        return mean, std
+
+    def get(self, origin, destination, symmetric=True):
+        """
+        Transit time distribution between two ports (or port names).
+
+        :return: (mean, standard deviation) in minutes or None if there is no record.
+        """
+        i, j = self.id_of(origin), self.id_of(destination)
+        if i is None or j is None:
+            return None
+        position = int(self.positions(i, j, symmetric))
+        if position < 0:
+            return None
+        return float(self.mean[position]), float(self.std[position])
+
+    def records(self):
+        """
+        :return: (from ids, to ids, means, standard deviations) of all records, sorted by ids.
+        """
+        return self.sources, self.indices, self.mean, self.std
+
+    def neighbours(self, port_id):
+        """
+        :return: The ids of the ports with a record from port_id.
+        """
+        return self.indices[self.indptr[port_id]:self.indptr[port_id + 1]]
@@ -0,0 +1,99 @@
+"""
+Trial schedules: a vessel's committed schedule plus pending insertions.
+
+A bid plan used to keep a full copy of the vessel's schedule for every trade.
+A TrialSchedule only records which trade goes in at which (pick-up, drop-off)
+insertion point on top of the committed schedule, so a plan costs O(1)
+memory however long the schedule is. It becomes a real Schedule again with
+materialize(), when the plan is committed in receive(). The committed
+schedule it refers to is identified by its task signature, the ordered
+(pick-up/drop-off, trade) tasks, and lengths count tasks throughout.
+"""
+from feasibility_cache import trade_key
+
+
+def committed_schedules(fleet):
+    """
+    One copy of the committed schedule of every vessel, to share as read-only base for all trials of an auction
+    (Vessel.schedule hands out a new copy on every access).
+
+    :return: vessel -> schedule
+    """
+    return {vessel: vessel.schedule for vessel in fleet}
+
+
+def task_signature(schedule):
+    """
+    The ordered tasks of a schedule: ((location type, trade key), ...).
+    """
+    return tuple((location_type, trade_key(trade)) for location_type, trade in schedule.get_simple_schedule())
+
+
+def _committed_signature(vessel):
+    # The vessel's own schedule, not the copy Vessel.schedule hands out
+    schedule = getattr(vessel, "_schedule", None)
+    if schedule is None:
+        schedule = vessel.schedule
+    return task_signature(schedule)
+
+
+class TrialSchedule:
+    __slots__ = ("vessel", "insertions", "base_signature")
+
+    def __init__(self, vessel, insertions=(), base_signature=None):
+        """
+        :param vessel: The vessel.
+        :param insertions: (trade, pick-up index, drop-off index) in the order they are applied. None indices
+            append at the end, as in Schedule.add_transportation.
+        :param base_signature: The task signature of the committed schedule the insertion points refer to.
+            Default is the vessel's current one.
+        """
+        self.vessel = vessel
+        self.insertions = tuple(insertions)
+        self.base_signature = _committed_signature(vessel) if base_signature is None else tuple(base_signature)
+
+    def with_insertion(self, trade, idx_pick_up=None, idx_drop_off=None):
+        """
+        :return: A new trial with one more insertion.
+        :rtype: TrialSchedule
+        """
+        return TrialSchedule(self.vessel, self.insertions + ((trade, idx_pick_up, idx_drop_off),),
+                             self.base_signature)
+
+    @property
+    def trades(self):
+        return [trade for trade, _, _ in self.insertions]
+
+    @property
+    def base_length(self):
+        """
+        The number of tasks of the committed schedule.
+        """
+        return len(self.base_signature)
+
+    def __len__(self):
+        # Every trade adds a pick-up and a drop-off task
+        return self.base_length + 2 * len(self.insertions)
+
+    def is_stale(self):
+        """
+        True if the vessel's committed schedule changed since the trial was planned (tasks finished or added),
+        so the insertion points may no longer mean the same.
+        """
+        return _committed_signature(self.vessel) != self.base_signature
+
+    def materialize(self, base=None):
+        """
+        Apply the insertions to a copy of the committed schedule.
+
+        :param base: The committed schedule to build on. Default is a fresh copy of the vessel's schedule.
+        :return: The schedule.
+        :rtype: Schedule
+        """
+        schedule = self.vessel.schedule if base is None else base.copy()
+        for trade, idx_pick_up, idx_drop_off in self.insertions:
+            schedule.add_transportation(trade, idx_pick_up, idx_drop_off)
+        return schedule
+
+    def __repr__(self):
+        return f"TrialSchedule({getattr(self.vessel, 'name', self.vessel)}, +{len(self.insertions)} trades)"
@@ -0,0 +1,359 @@
+"""
+Where a vessel will be over time, and when it is free.
+
+A VesselTimeline lays a vessel's committed work out in time as consecutive
+segments: sailing between ports, waiting in a port for a time window to open,
+handling cargo, and a final open-ended idle stretch where the work ends.
+Sailing and handling times follow the schedule's own model (travel time at
+the vessel's speed, cargo transfer time for pick-up and drop-off, no task
+before its earliest time). The segment start times are sorted, so "where is
+the vessel at time t" is one bisection. The idle windows (waits and the
+final stretch) are kept in order with a sparse table of their lengths, so
+"the next idle window of at least d hours after t" is a bisection plus a
+binary search over range maxima, both O(log n).
+
+TimelineIndex holds the timelines of our own and the competitors' vessels
+and updates them incrementally. A timeline is kept as long as the vessel's
+schedule is what is left of it after finishing tasks; only vessels whose
+schedules gained work are rebuilt. The competitors' schedules are not
+visible (headquarters.get_companies() hands out vessels with empty
+schedules), so the trades they win are appended to the timeline of their
+vessel that can start them earliest (record_won), and a competitor timeline
+is only started afresh from the vessel's position once that work is done.
+"""
+import bisect
+import math
+
+from mable.simulation_space.universe import OnJourney
+
+from feasibility_cache import trade_key
+
+SAIL = "sail"
+WAIT = "wait"
+HANDLE = "handle"
+IDLE = "idle"
+
+
+def _time_window(trade):
+    # Earliest pick-up, latest pick-up, earliest drop-off and latest drop-off, with 0 and inf for open ends
+    clean_window = getattr(trade, "clean_window", None)
+    if clean_window is None:
+        return [0, math.inf, 0, math.inf]
+    return clean_window()
+
+
+def _task_signature(schedule):
+    if schedule is None:
+        return ()
+    return tuple((location_type, trade_key(trade)) for location_type, trade in schedule.get_simple_schedule())
+
+
+class TimelinePosition:
+    __slots__ = ("activity", "location", "destination", "progress", "free_at")
+
+    def __init__(self, activity, location, destination, progress, free_at):
+        """
+        :param activity: One of SAIL, WAIT, HANDLE and IDLE.
+        :param location: The port the vessel is in, or sailed from if it is sailing.
+        :param destination: The port the vessel sails to, None if it is not sailing.
+        :param progress: The share of the voyage that is done, 0 if the vessel is not sailing.
+        :param free_at: The earliest time from the queried time on at which the vessel is idle.
+        """
+        self.activity = activity
+        self.location = location
+        self.destination = destination
+        self.progress = progress
+        self.free_at = free_at
+
+
+class VesselTimeline:
+
+    def __init__(self, vessel, distances, location, start_time):
+        """
+        An empty timeline: the vessel is idle in a port from a time on.
+
+        :param vessel: The vessel.
+        :param distances: The distance oracle.
+        :type distances: DistanceOracle
+        :param location: The port the vessel is in.
+        :param start_time: The time from which the vessel is idle there.
+        """
+        self.vessel = vessel
+        self._distances = distances
+        self._hours_per_mile = vessel.get_travel_time(1.0)
+        self.signature = ()  # The tasks laid out, in order
+        self.start_time = start_time
+        self.end_location = location
+        self.end_time = start_time
+        self._starts = []
+        self._segments = []  # (activity, start, end, location, destination)
+        self._idle_before = []  # per segment: the number of idle windows before it
+        self._idle_starts = []
+        self._idle_ends = []
+        self._idle_ports = []
+        self._table = None  # Sparse table of the idle window lengths, built on the first query
+        self._close()
+
+    @classmethod
+    def from_schedule(cls, vessel, schedule, distances, current_time):
+        """
+        The timeline of a vessel's schedule from now on.
+
+        :param schedule: The vessel's schedule. Default is its current one.
+        """
+        location = vessel.location
+        if schedule is None:
+            schedule = vessel.schedule
+        if isinstance(location, OnJourney):
+            # Sails on to the journey's destination first
+            sailed = (current_time - getattr(location, "start_time", current_time)) / vessel.get_travel_time(1.0)
+            remaining = max(0.0, distances.distance(location.origin, location.destination) - sailed)
+            timeline = cls(vessel, distances, location.origin, current_time)
+            timeline._sail(location.destination, vessel.get_travel_time(remaining))
+            timeline._close()
+        else:
+            timeline = cls(vessel, distances, location, current_time)
+        for location_type, trade in schedule.get_simple_schedule():
+            timeline._add_task(location_type, trade)
+        timeline._close()
+        return timeline
+
+    def _open(self):
+        # Drops the final idle stretch before more work is appended
+        self._starts.pop()
+        self._segments.pop()
+        self._idle_before.pop()
+        self._idle_starts.pop()
+        self._idle_ends.pop()
+        self._idle_ports.pop()
+        self._table = None
+
+    def _close(self):
+        if self._segments and self._segments[-1][0] == IDLE:
+            return
+        self._append(IDLE, self.end_time, math.inf, self.end_location, None)
+
+    def _append(self, activity, start, end, location, destination):
+        if self._segments and self._segments[-1][0] == IDLE:
+            self._open()
+        self._starts.append(start)
+        self._segments.append((activity, start, end, location, destination))
+        self._idle_before.append(len(self._idle_starts))
+        if activity in (WAIT, IDLE):
+            self._idle_starts.append(start)
+            self._idle_ends.append(end)
+            self._idle_ports.append(location)
+            self._table = None
+
+    def _sail(self, port, hours):
+        if hours > 0:
+            self._append(SAIL, self.end_time, self.end_time + hours, self.end_location, port)
+        self.end_location = port
+        self.end_time += max(0.0, hours)
+
+    def arrival_at(self, port):
+        """
+        The earliest arrival at a port after the committed work.
+        """
+        return self.end_time + self._distances.distance(self.end_location, port) * self._hours_per_mile
+
+    def _add_task(self, location_type, trade):
+        window = _time_window(trade)
+        if location_type == "PICK_UP":
+            port, earliest = trade.origin_port, window[0]
+        else:
+            port, earliest = trade.destination_port, window[2]
+        self._sail(port, self.arrival_at(port) - self.end_time)
+        if earliest > self.end_time:
+            self._append(WAIT, self.end_time, earliest, port, None)
+            self.end_time = earliest
+        handling_hours = self.vessel.get_loading_time(trade.cargo_type, trade.amount)
+        if handling_hours > 0:
+            self._append(HANDLE, self.end_time, self.end_time + handling_hours, port, None)
+            self.end_time += handling_hours
+        self.signature += ((location_type, trade_key(trade)),)
+
+    def extend(self, trade):
+        """
+        Append the pick-up and drop-off of a trade after the committed work.
+        """
+        self._add_task("PICK_UP", trade)
+        self._add_task("DROP_OFF", trade)
+        self._close()
+
+    def follows(self, signature):
+        """
+        Whether a schedule with these tasks is what is left of this timeline after finishing tasks.
+        """
+        return len(signature) <= len(self.signature) and self.signature[len(self.signature) - len(signature):] == \
+            tuple(signature)
+
+    def availability(self, current_time):
+        """
+        Where and when the vessel is done with its committed work.
+
+        :return: (location, time)
+        """
+        return self.end_location, max(current_time, self.end_time)
+
+    def position_at(self, time):
+        """
+        :rtype: TimelinePosition
+        """
+        i = max(0, bisect.bisect_right(self._starts, time) - 1)
+        activity, start, end, location, destination = self._segments[i]
+        progress = 0.0
+        if activity == SAIL:
+            progress = min(1.0, max(0.0, (time - start) / (end - start)))
+        return TimelinePosition(activity, location, destination, progress,
+                                max(time, self._idle_starts[self._idle_before[i]]))
+
+    def _build_table(self):
+        lengths = [end - start for start, end in zip(self._idle_starts, self._idle_ends)]
+        table = [lengths]
+        width = 1
+        while 2 * width <= len(lengths):
+            previous = table[-1]
+            table.append([max(previous[i], previous[i + width]) for i in range(len(lengths) - 2 * width + 1)])
+            width *= 2
+        self._table = table
+
+    def _longest(self, first, last):
+        level = (last - first + 1).bit_length() - 1
+        row = self._table[level]
+        return max(row[first], row[last - (1 << level) + 1])
+
+    def next_idle_window(self, time, hours):
+        """
+        The first stretch of at least the given hours from a time on in which the vessel has nothing to do.
+
+        :return: (start, end, port), end is inf for the stretch after the committed work.
+        """
+        i = bisect.bisect_right(self._idle_ends, time)
+        start = max(time, self._idle_starts[i])
+        if self._idle_ends[i] - start >= hours:
+            return start, self._idle_ends[i], self._idle_ports[i]
+        if self._table is None:
+            self._build_table()
+        # The final stretch is endless, so a long enough window exists; the range maximum grows with the range
+        low, high = i + 1, len(self._idle_starts) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._longest(i + 1, middle) >= hours:
+                high = middle
+            else:
+                low = middle + 1
+        return self._idle_starts[low], self._idle_ends[low], self._idle_ports[low]
+
+
+class TimelineIndex:
+
+    def __init__(self, distances):
+        """
+        :param distances: The distance oracle.
+        :type distances: DistanceOracle
+        """
+        self._distances = distances
+        self._timelines = {}  # (company name, vessel name) -> VesselTimeline
+        self.rebuilt = 0
+        self.kept = 0
+        self.extended = 0
+
+    @staticmethod
+    def _key(company, vessel):
+        # Competitor vessels are new objects every time, so they are recognised by name
+        return getattr(company, "name", company), getattr(vessel, "name", id(vessel))
+
+    def update(self, company, current_time, vessels=None, schedules=None):
+        """
+        Bring the timelines of a company's vessels up to date. Only vessels whose schedules gained work since
+        their timeline was built are rebuilt; a competitor vessel without a visible schedule keeps the work
+        recorded for it until it is done.
+
+        :param company: The company, ours or a competitor.
+        :param current_time: The current simulation time.
+        :param vessels: The vessels to update. Default is the company's fleet.
+        :param schedules: Optional vessel -> schedule, e.g. the committed schedule copies, instead of
+            vessel.schedule.
+        """
+        for vessel in (company.fleet if vessels is None else vessels):
+            key = self._key(company, vessel)
+            schedule = None if schedules is None else schedules.get(vessel)
+            if schedule is None:
+                try:
+                    schedule = vessel.schedule
+                except AttributeError:
+                    schedule = None
+            signature = _task_signature(schedule)
+            timeline = self._timelines.get(key)
+            if timeline is not None and timeline.follows(signature) and (signature or timeline.end_time > current_time):
+                timeline.vessel = vessel
+                self.kept += 1
+                continue
+            if schedule is None:
+                location = vessel.location
+                timeline = VesselTimeline(vessel, self._distances,
+                                          location.destination if isinstance(location, OnJourney) else location,
+                                          current_time)
+            else:
+                timeline = VesselTimeline.from_schedule(vessel, schedule, self._distances, current_time)
+            self._timelines[key] = timeline
+            self.rebuilt += 1
+
+    def record_won(self, company, trades, current_time):
+        """
+        Append the trades a competitor won to its vessels: each to the vessel that can carry it and reaches
+        its origin first.
+        """
+        self.update(company, current_time)
+        for trade in trades:
+            best, best_arrival = None, math.inf
+            for vessel in company.fleet:
+                try:
+                    if trade.amount > vessel.capacity(trade.cargo_type):
+                        continue
+                except (KeyError, AttributeError):
+                    continue
+                timeline = self._timelines[self._key(company, vessel)]
+                arrival = timeline.arrival_at(trade.origin_port)
+                if arrival < best_arrival:
+                    best, best_arrival = timeline, arrival
+            if best is not None:
+                best.extend(trade)
+                self.extended += 1
+
+    def timeline(self, company, vessel):
+        """
+        :rtype: VesselTimeline | None
+        """
+        return self._timelines.get(self._key(company, vessel))
+
+    def availability(self, company, vessel, current_time):
+        """
+        Where and when a vessel is done with its committed work, at its current position now if it has no
+        timeline.
+
+        :return: (location, time)
+        """
+        timeline = self.timeline(company, vessel)
+        if timeline is None:
+            location = vessel.location
+            return (location.destination if isinstance(location, OnJourney) else location), current_time
+        return timeline.availability(current_time)
+
+    def position_at(self, company, vessel, time):
+        """
+        :rtype: TimelinePosition | None
+        """
+        timeline = self.timeline(company, vessel)
+        return None if timeline is None else timeline.position_at(time)
+
+    def next_idle_window(self, company, vessel, time, hours):
+        """
+        :return: (start, end, port) or None if the vessel has no timeline. See VesselTimeline.next_idle_window.
+        """
+        timeline = self.timeline(company, vessel)
+        return None if timeline is None else timeline.next_idle_window(time, hours)
+
+    def stats(self):
+        return f"{self.rebuilt} rebuilt, {self.kept} kept, {self.extended} won trades appended"